@@ -0,0 +1,173 @@
+# secure_benchmark.py
+
+import argparse
+import os
+import pickle
+import random
+import time
+import tracemalloc
+
+import secure_cache
+import secure_cart
+import secure_code as c
+import secure_columnar
+import secure_parallel
+import secure_rules
+
+AMOUNTS = [4.99, 9.99, 19.99, 49.5, 100.0, 250.25, 999.0, 1000]
+
+
+def make_orders(count, seed=0):
+    """Builds `count` orders of 1-4 products, most of them fully paid."""
+    rng = random.Random(seed)
+    orders = []
+    for order_id in range(count):
+        items = []
+        total_cents = 0
+        for _ in range(rng.randint(1, 4)):
+            amount = rng.choice(AMOUNTS)
+            quantity = rng.randint(1, 5)
+            items.append(c.Item('product', 'item', amount, quantity))
+            total_cents += round(amount * 100) * quantity
+        if rng.random() < 0.95:
+            items.append(c.Item('payment', 'invoice', total_cents / 100, 1))
+        orders.append(c.Order(str(order_id), items))
+    return orders
+
+
+def timed(label, func, count, unit="orders"):
+    """Runs func once and prints its throughput."""
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {elapsed:8.3f}s  {count / elapsed:12,.0f} {unit}/s")
+    return elapsed, result
+
+
+def bench_batch(orders):
+    print("\n[validorder loop vs validorders batch]")
+    single, expected = timed("validorder (per order)", lambda: [c.validorder(o) for o in orders], len(orders))
+    batch, actual = timed("validorders (batch)", lambda: c.validorders(orders), len(orders))
+    assert actual == expected, "batch verdicts differ from the single-order path"
+    print(f"speedup: {single / batch:.1f}x")
+    results, checked = timed("check_orders (OrderResult)", lambda: c.check_orders(orders), len(orders))
+    assert [r.message for r in checked] == expected, "structured results differ from the string path"
+    print(f"speedup: {single / results:.1f}x")
+
+
+def bench_cents(orders):
+    print("\n[decimal vs integer-cents arithmetic]")
+    decimal, expected = timed("validorder mode='decimal'", lambda: [c.validorder(o) for o in orders], len(orders))
+    cents, actual = timed("validorder mode='cents'", lambda: [c.validorder(o, 'cents') for o in orders], len(orders))
+    assert actual == expected, "cents verdicts differ from the decimal path"
+    print(f"speedup: {decimal / cents:.1f}x")
+
+
+def bench_cache(orders):
+    print("\n[ValidationCache on a stream where every order is retried twice]")
+    cache = secure_cache.ValidationCache(maxsize=len(orders))
+    stream = orders + orders + orders
+    plain, expected = timed("check_order (no cache)", lambda: [c.check_order(o) for o in stream], len(stream))
+    cached, actual = timed("ValidationCache.check", lambda: [cache.check(o) for o in stream], len(stream))
+    assert [r.message for r in actual] == [r.message for r in expected], "cached verdicts differ"
+    print(f"speedup: {plain / cached:.1f}x  {cache.stats()}")
+
+
+def bench_rules(orders):
+    print("\n[interpreted vs compiled rule sets]")
+    extra = tuple(secure_rules.Rule('product', 'amount', 'max', c.MAX_ORDER_TOTAL, c.Status.INVALID_AMOUNT)
+                  for _ in range(8))
+    rulesets = [("secure rules", secure_rules.SECURE_RULES),
+                ("secure rules + 8 shop rules", secure_rules.SECURE_RULES._replace(
+                    rules=secure_rules.SECURE_RULES.rules + extra))]
+    for name, ruleset in rulesets:
+        print(f"{name}:")
+        compiled = secure_rules.compile_rules(ruleset)
+        slow, expected = timed("  interpreted", lambda: [secure_rules.check_order_interpreted(o, ruleset)
+                                                         for o in orders], len(orders))
+        fast, actual = timed("  compiled", lambda: [compiled(o) for o in orders], len(orders))
+        assert [r.message for r in actual] == [r.message for r in expected], "compiled rules disagree"
+        print(f"  speedup: {slow / fast:.1f}x")
+
+
+def bench_cart(size=1000, edits=2000):
+    print(f"\n[re-validating a {size}-item cart vs incremental Cart, {edits} edits]")
+    items = [c.Item('product', 'item', AMOUNTS[i % len(AMOUNTS)], 1) for i in range(size)]
+
+    def full():
+        current = list(items)
+        for i in range(edits):
+            current.append(items[i % size]) if i % 2 else current.pop()
+            c.validorder(c.Order('cart', current))
+
+    def incremental():
+        cart = secure_cart.Cart('cart')
+        handles = [cart.add(item) for item in items]
+        for i in range(edits):
+            handles.append(cart.add(items[i % size])) if i % 2 else cart.remove(handles.pop())
+            cart.validate()
+
+    slow, _ = timed("validorder per edit", full, edits, "edits")
+    fast, _ = timed("Cart.add/remove + validate", incremental, edits, "edits")
+    print(f"speedup: {slow / fast:.1f}x (incremental time includes building the cart)")
+
+
+def bench_parallel(orders):
+    print("\n[validorders_parallel scaling]")
+    chunk = orders[:secure_parallel.CHUNK_SIZE]
+    packed = len(pickle.dumps(secure_parallel._pack(chunk)))
+    print(f"payload per {len(chunk)}-order chunk: {len(pickle.dumps(chunk)):,} bytes pickled, "
+          f"{packed:,} bytes packed")
+
+    expected = None
+    baseline = None
+    workers = 1
+    while True:
+        elapsed, actual = timed(f"{workers} worker(s)",
+                                lambda: list(secure_parallel.validorders_parallel(orders, workers)),
+                                len(orders))
+        expected = expected or actual
+        assert actual == expected, "parallel verdicts differ from the batch path"
+        baseline = baseline or elapsed
+        print(f"{'':<28} scaling: {baseline / elapsed:.2f}x")
+        if workers >= (os.cpu_count() or 1):
+            break
+        workers = min(workers * 2, os.cpu_count())
+
+
+def bench_columnar(count):
+    print("\n[namedtuple orders vs columnar OrderBatch]")
+    tracemalloc.start()
+    orders = make_orders(count)
+    tuple_bytes = tracemalloc.get_traced_memory()[0]
+    batch = secure_columnar.OrderBatch.from_orders(orders)
+    batch_bytes = tracemalloc.get_traced_memory()[0] - tuple_bytes
+    tracemalloc.stop()
+
+    items = len(batch.types)
+    print(f"memory for {items:,} items: {tuple_bytes / 2**20:,.1f} MiB as namedtuples, "
+          f"{batch_bytes / 2**20:,.1f} MiB as columns ({batch.nbytes() / 2**20:,.1f} MiB of arrays)")
+    _, expected = timed("validorders (namedtuples)", lambda: c.validorders(orders), count)
+    _, actual = timed("OrderBatch.validate", batch.validate, count)
+    assert actual == expected, "columnar verdicts differ from the batch path"
+    _, checked = timed("check_orders (namedtuples)", lambda: c.check_orders(orders), count)
+    _, actual = timed("OrderBatch.check", batch.check, count)
+    assert [r.message for r in actual] == [r.message for r in checked] == expected, \
+        "columnar results differ from the batch path"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Level-1 order validation benchmarks")
+    parser.add_argument("--orders", type=int, default=1_000_000, help="number of orders to generate")
+    args = parser.parse_args()
+
+    print(f">>> Order Validation Benchmark ({args.orders:,} orders) <<<")
+    orders = make_orders(args.orders)
+    bench_batch(orders)
+    bench_cents(orders)
+    bench_cache(orders)
+    bench_rules(orders)
+    bench_cart()
+    bench_parallel(orders)
+    del orders
+    bench_columnar(args.orders)
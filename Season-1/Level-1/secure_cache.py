@@ -0,0 +1,110 @@
+# secure_cache.py
+
+import threading
+import time
+from collections import OrderedDict
+from operator import is_
+
+from secure_code import Order, check_order
+
+MAX_ENTRIES = 100_000
+
+
+def _content(items):
+    """Everything about the items that can change a verdict.
+
+    Types are recorded next to values so that, e.g., an amount of True is not
+    confused with an amount of 1. Descriptions are left out: validation never
+    reads them, so a retry with a reworded description still hits the cache.
+    """
+    return [(item.type, item.amount.__class__, item.amount, item.quantity.__class__, item.quantity)
+            for item in items]
+
+
+class ValidationCache:
+    """Idempotency cache of validation results keyed by order ID and item content.
+
+    A retried order with the same ID and the same items is answered from the
+    cache. If the items under an ID change, they are re-validated, and the
+    new result replaces the old one. Entries are evicted least recently used
+    beyond `maxsize`, and expire after `ttl` seconds when a TTL is set.
+    Cached OrderResult objects are shared between callers and must be
+    treated as read-only.
+    """
+
+    def __init__(self, maxsize=MAX_ENTRIES, ttl=None, mode: str = "decimal", clock=time.monotonic):
+        assert mode in {"decimal", "cents"}, "mode must be 'decimal' or 'cents'"
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.mode = mode
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # order id -> [items, content or None, result, expires_at]
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def check(self, order):
+        """Returns the OrderResult for order, validating it only on a cache miss."""
+        if order.items.__class__ is not list and order.items.__class__ is not tuple:
+            order = Order(order.id, list(order.items))
+        items = tuple(order.items)
+        try:
+            with self._lock:
+                entry = self._entries.get(order.id)
+                if (entry is not None and (entry[3] is None or entry[3] > self.clock())
+                        and self._same_content(entry, items)):
+                    self._entries.move_to_end(order.id)
+                    self.hits += 1
+                    return entry[2]
+                self.misses += 1
+        except TypeError:  # unhashable order ID, never cached
+            return check_order(order, self.mode)
+
+        result = check_order(order, self.mode)
+        expires_at = self.clock() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._entries[order.id] = [items, None, result, expires_at]
+            self._entries.move_to_end(order.id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return result
+
+    @staticmethod
+    def _same_content(entry, items):
+        """True if items have the content of the entry's items.
+
+        Items are immutable, so a retry that passes the same Item objects
+        again is a match without looking inside them. Anything else is
+        compared by _content(), which is built for the entry the first time
+        it is needed and kept.
+        """
+        stored = entry[0]
+        if len(stored) == len(items) and all(map(is_, stored, items)):
+            return True
+        if entry[1] is None:
+            entry[1] = _content(stored)
+        return entry[1] == _content(items)
+
+    def validate(self, order):
+        """Like check(), but returns a validorder()-style status string."""
+        return self.check(order).message
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Returns the cache counters as a dict."""
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
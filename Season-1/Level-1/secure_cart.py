@@ -0,0 +1,102 @@
+# secure_cart.py
+
+from decimal import InvalidOperation
+
+from secure_code import (Order, OrderResult, Status, _MAX_BATCH_ITEMS, _MAX_ORDER_TOTAL_CENTS,
+                         _batch_cents, _check_order, _to_cents)
+
+_ITEM_ERRORS = {Status.INVALID_TYPE, Status.INVALID_AMOUNT, Status.INVALID_QUANTITY_TYPE,
+                Status.QUANTITY_OUT_OF_RANGE, Status.INVALID_PAYMENT_QUANTITY}
+
+
+class Cart:
+    """A shopping cart validated incrementally as items come and go.
+
+    Every item is checked once, when it is added, with the same rules as
+    check_order(). The cart keeps running product and payment totals in
+    integer cents and the rejected items in cart order, so add(), remove()
+    and check() are all O(1). check() gives the same verdict as check_order()
+    on the current items.
+
+    If an item's amount is not a whole number of cents, or is too large to
+    sum exactly in cents, the cart cannot keep that total exactly. check()
+    then re-validates the whole cart with check_order().
+
+    A NaN amount, which check_order() cannot compare and raises on in
+    decimal mode, is rejected as an invalid amount like any other.
+
+    Carts are not counted by enable_stats(): neither the per-item checks in
+    add() nor check() show up as validated orders.
+    """
+
+    def __init__(self, order_id, mode: str = "decimal"):
+        assert mode in {"decimal", "cents"}, "mode must be 'decimal' or 'cents'"
+        self.order_id = order_id
+        self.mode = mode
+        self._items = {}        # handle -> item, in cart order
+        self._errors = {}       # handle -> (status, value) of rejected items, in cart order
+        self._cents = {}        # handle -> (product cents, payment cents) of valid items
+        self._inexact = set()   # handles of valid items that are not tracked in cents
+        self._total_products = 0
+        self._total_payments = 0
+        self._next_handle = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self):
+        return iter(self._items.values())
+
+    def add(self, item):
+        """Adds an item to the cart and returns a handle for remove()."""
+        try:
+            result = _check_order(Order(self.order_id, [item]), self.mode)
+        except InvalidOperation:
+            result = OrderResult(Status.INVALID_AMOUNT, self.order_id, item.amount)
+        handle = self._next_handle
+        self._next_handle += 1
+        self._items[handle] = item
+        if result.status in _ITEM_ERRORS:
+            self._errors[handle] = (result.status, result.value)
+            return handle
+
+        cents = _to_cents(item.amount) if self.mode == "cents" else _batch_cents(item.amount)
+        if cents is None:
+            self._inexact.add(handle)
+        elif item.type == 'product':
+            self._cents[handle] = (cents * item.quantity, 0)
+            self._total_products += cents * item.quantity
+        else:
+            self._cents[handle] = (0, cents)
+            self._total_payments += cents
+        return handle
+
+    def remove(self, handle):
+        """Removes the item behind a handle returned by add() and returns it."""
+        item = self._items.pop(handle)
+        if self._errors.pop(handle, None) is None and handle not in self._inexact:
+            products, payments = self._cents.pop(handle)
+            self._total_products -= products
+            self._total_payments -= payments
+        self._inexact.discard(handle)
+        return item
+
+    def check(self):
+        """Validates the cart as it stands, returning an OrderResult."""
+        if self._errors:
+            status, value = next(iter(self._errors.values()))
+            return OrderResult(status, self.order_id, value)
+
+        if self._inexact or len(self._items) > _MAX_BATCH_ITEMS:
+            return _check_order(Order(self.order_id, list(self._items.values())), self.mode)
+
+        if self._total_products > _MAX_ORDER_TOTAL_CENTS:
+            return OrderResult(Status.TOTAL_EXCEEDED, self.order_id)
+        if self._total_payments != self._total_products:
+            return OrderResult(Status.IMBALANCE, self.order_id,
+                               self._total_payments - self._total_products, True)
+        return OrderResult(Status.PAID, self.order_id)
+
+    def validate(self):
+        """Validates the cart as it stands, returning a validorder()-style status string."""
+        return self.check().message
@@ -1,5 +1,8 @@
-from collections import namedtuple
+import threading
+import time
+from collections import Counter, namedtuple
 from decimal import Decimal, InvalidOperation
+from enum import IntEnum
 
 Order = namedtuple('Order', 'id, items')
 Item = namedtuple('Item', 'type, description, amount, quantity')
@@ -8,7 +11,84 @@ MAX_ORDER_TOTAL = Decimal('999999.99')
 MAX_QUANTITY = 100
 MIN_QUANTITY = 1
 
-def validorder(order: Order) -> str:
+# Batch validation keeps totals as integer cents. These bounds keep every
+# partial sum below 10**28 cents, where Decimal's default 28-digit context is
+# still exact, so both paths always agree on the verdict.
+_MAX_ORDER_TOTAL_CENTS = int(MAX_ORDER_TOTAL * 100)
+_MAX_BATCH_CENTS = 10 ** 22
+_MAX_BATCH_ITEMS = 10_000
+
+# Set by enable_stats(); None keeps the validator uninstrumented
+_stats = None
+
+
+class Status(IntEnum):
+    """Outcome of validating an order."""
+    PAID = 0
+    IMBALANCE = 1
+    TOTAL_EXCEEDED = 2
+    INVALID_TYPE = 3
+    INVALID_AMOUNT = 4
+    INVALID_QUANTITY_TYPE = 5
+    QUANTITY_OUT_OF_RANGE = 6
+    INVALID_PAYMENT_QUANTITY = 7
+
+
+_MESSAGES = {
+    Status.PAID: lambda r: f"Order ID: {r.order_id} - Full payment received!",
+    Status.IMBALANCE: lambda r: f"Order ID: {r.order_id} - Payment imbalance: ${r._format_diff()}",
+    Status.TOTAL_EXCEEDED: lambda r: "Total amount payable for an order exceeded",
+    Status.INVALID_TYPE: lambda r: f"Invalid item type: {r.value}",
+    Status.INVALID_AMOUNT: lambda r: f"Invalid amount: {r.value}",
+    Status.INVALID_QUANTITY_TYPE: lambda r: f"Invalid quantity type: {r.value} ({type(r.value)})",
+    Status.QUANTITY_OUT_OF_RANGE: lambda r: f"Quantity out of range: {r.value}",
+    Status.INVALID_PAYMENT_QUANTITY: lambda r: f"Payments must have quantity 1, got: {r.value}",
+}
+
+
+class OrderResult:
+    """Result of validating one order.
+
+    `value` is the offending item type, amount or quantity for rejected items,
+    and the payment imbalance for IMBALANCE, as a Decimal or, when `in_cents`
+    is set, as integer cents. The human-readable message is only formatted
+    when `message` is read.
+    """
+
+    __slots__ = ('status', 'order_id', 'value', 'in_cents')
+
+    def __init__(self, status, order_id, value=None, in_cents=False):
+        self.status = status
+        self.order_id = order_id
+        self.value = value
+        self.in_cents = in_cents
+
+    @property
+    def ok(self):
+        return self.status == Status.PAID
+
+    @property
+    def diff(self):
+        """The payment imbalance as a Decimal, or None."""
+        if self.status != Status.IMBALANCE:
+            return None
+        return Decimal(self.value).scaleb(-2) if self.in_cents else self.value
+
+    @property
+    def message(self):
+        return _MESSAGES[self.status](self)
+
+    def _format_diff(self):
+        return _format_cents(self.value) if self.in_cents else f"{self.value:.2f}"
+
+    def __str__(self):
+        return self.message
+
+    def __repr__(self):
+        return f"OrderResult({self.status.name}, order_id={self.order_id!r}, value={self.value!r})"
+
+
+def check_order(order: Order, mode: str = "decimal") -> OrderResult:
     """Validates an order according to business and security rules.
 
     - Only 'product' and 'payment' item types are allowed.
@@ -20,42 +100,383 @@ def validorder(order: Order) -> str:
 
     Args:
         order: An Order object.
+        mode: 'decimal' sums amounts as Decimal. 'cents' sums them as integer
+            cents without Decimal and rejects amounts that are not a whole
+            number of cents.
 
     Returns:
-        A status string describing if the order is valid or specifying the error.
+        An OrderResult describing if the order is valid or specifying the error.
     """
+    if _stats is not None:
+        return _stats.observe_order(order, mode)
+    return _check_order(order, mode)
+
+
+def _check_order(order: Order, mode: str) -> OrderResult:
+    """check_order() without the instrumentation hook."""
+    assert mode in {"decimal", "cents"}, "mode must be 'decimal' or 'cents'"
+    if mode == "cents":
+        return _check_order_cents(order)
+
     total_products = Decimal('0')
     total_payments = Decimal('0')
 
     for item in order.items:
         # Check type validity
         if item.type not in {'payment', 'product'}:
-            return f"Invalid item type: {item.type}"
+            return OrderResult(Status.INVALID_TYPE, order.id, item.type)
 
         # Validate amount
         try:
             amount = Decimal(str(item.amount))
         except (InvalidOperation, TypeError, ValueError):
-            return f"Invalid amount: {item.amount}"
+            return OrderResult(Status.INVALID_AMOUNT, order.id, item.amount)
 
         # Validate quantity
         if not isinstance(item.quantity, int):
-            return f"Invalid quantity type: {item.quantity} ({type(item.quantity)})"
+            return OrderResult(Status.INVALID_QUANTITY_TYPE, order.id, item.quantity)
 
         if item.type == 'product':
             if not (MIN_QUANTITY <= item.quantity <= MAX_QUANTITY):
-                return f"Quantity out of range: {item.quantity}"
+                return OrderResult(Status.QUANTITY_OUT_OF_RANGE, order.id, item.quantity)
             total_products += amount * item.quantity
         elif item.type == 'payment':
             if item.quantity != 1:
-                return f"Payments must have quantity 1, got: {item.quantity}"
+                return OrderResult(Status.INVALID_PAYMENT_QUANTITY, order.id, item.quantity)
             total_payments += amount
 
     if total_products > MAX_ORDER_TOTAL:
-        return "Total amount payable for an order exceeded"
+        return OrderResult(Status.TOTAL_EXCEEDED, order.id)
+
+    if total_payments != total_products:
+        return OrderResult(Status.IMBALANCE, order.id, total_payments - total_products)
+
+    return OrderResult(Status.PAID, order.id)
+
+
+
+def validorder(order: Order, mode: str = "decimal") -> str:
+    """Validates an order, returning a status string (see check_order()).
+
+    Returns:
+        A status string describing if the order is valid or specifying the error.
+    """
+    return check_order(order, mode).message
+
+
+def _check_order_cents(order: Order) -> OrderResult:
+    """check_order() in integer-cents arithmetic."""
+    total_products = 0
+    total_payments = 0
+
+    for item in order.items:
+        if item.type not in {'payment', 'product'}:
+            return OrderResult(Status.INVALID_TYPE, order.id, item.type)
+
+        # Python ints never overflow, so the totals below are always exact
+        amount = _to_cents(item.amount)
+        if amount is None:
+            return OrderResult(Status.INVALID_AMOUNT, order.id, item.amount)
+
+        if not isinstance(item.quantity, int):
+            return OrderResult(Status.INVALID_QUANTITY_TYPE, order.id, item.quantity)
+
+        if item.type == 'product':
+            if not (MIN_QUANTITY <= item.quantity <= MAX_QUANTITY):
+                return OrderResult(Status.QUANTITY_OUT_OF_RANGE, order.id, item.quantity)
+            total_products += amount * item.quantity
+        elif item.type == 'payment':
+            if item.quantity != 1:
+                return OrderResult(Status.INVALID_PAYMENT_QUANTITY, order.id, item.quantity)
+            total_payments += amount
+
+    if total_products > _MAX_ORDER_TOTAL_CENTS:
+        return OrderResult(Status.TOTAL_EXCEEDED, order.id)
 
     if total_payments != total_products:
-        diff = total_payments - total_products
-        return f"Order ID: {order.id} - Payment imbalance: ${diff:.2f}"
+        return OrderResult(Status.IMBALANCE, order.id, total_payments - total_products, True)
+
+    return OrderResult(Status.PAID, order.id)
+
+
+def _format_cents(cents):
+    """Formats integer cents like f"{Decimal(cents) / 100:.2f}"."""
+    sign = '-' if cents < 0 else ''
+    units, cents = divmod(abs(cents), 100)
+    return f"{sign}{units}.{cents:02d}"
+
+
+def _to_cents(amount):
+    """Returns amount as an exact whole number of cents, or None if it is not one."""
+    cls = amount.__class__
+    if cls is int:
+        return amount * 100
+    if cls is float and -1e13 < amount < 1e13:
+        # Below 1e13 adjacent floats are much closer than a cent apart, so a
+        # float equal to cents / 100 has that exact decimal as its str().
+        cents = round(amount * 100)
+        return cents if cents / 100 == amount else None
+
+    try:
+        value = Decimal(str(amount))
+    except (InvalidOperation, TypeError, ValueError):
+        return None
+    if not value.is_finite() or len(value.as_tuple().digits) > 26:
+        return None
+    cents = value.scaleb(2)
+    if cents != cents.to_integral_value():
+        return None
+    return int(cents)
+
+
+def _batch_cents(amount):
+    """Returns _to_cents(amount) if it is small enough for the batch fast path."""
+    cents = _to_cents(amount)
+    if cents is not None and -_MAX_BATCH_CENTS < cents < _MAX_BATCH_CENTS:
+        return cents
+    return None
+
+
+def check_orders(orders, mode: str = "decimal") -> list:
+    """Validates a batch of orders, returning one OrderResult per order.
+
+    Gives the same verdicts as check_order(), but amortizes the work across the
+    batch: totals are accumulated as integer cents, each distinct valid product
+    line is converted once, and a payment is compared against the order total
+    instead of being converted. Any order the fast path cannot settle on its
+    own (an invalid item, or an amount that is not a whole number of cents) is
+    handed to check_order() so that it reports exactly the same error.
+
+    Args:
+        orders: An iterable of Order objects.
+        mode: Arithmetic mode passed on to check_order(), 'decimal' or 'cents'.
+
+    Returns:
+        A list of OrderResult objects, in the same order as the input.
+    """
+    if _stats is not None:
+        return _stats.observe_batch(orders, mode)
+    return _check_orders(orders, mode)
+
+
+def _check_orders(orders, mode: str, as_text: bool = False) -> list:
+    """check_orders() without the instrumentation hook.
+
+    With `as_text` it returns the status strings instead, formatting them
+    directly rather than building an OrderResult per order.
+    """
+    assert mode in {"decimal", "cents"}, "mode must be 'decimal' or 'cents'"
+    # Valid product lines seen so far, mapped to their cents * quantity. An
+    # Item equal to a cached one may still differ in type (True == 1 and
+    # 2.0 == 2), so a hit only counts for an int or float amount and an int
+    # quantity, the only types ever cached.
+    line_cents = {}
+    cached = line_cents.get
+    amount_cents = {}
+    min_quantity, max_quantity = MIN_QUANTITY, MAX_QUANTITY
+    result = OrderResult
+    paid, imbalance, total_exceeded = Status.PAID, Status.IMBALANCE, Status.TOTAL_EXCEEDED
+    results = []
+    append = results.append
+
+    for order in orders:
+        items = order.items
+        if items.__class__ is not list and items.__class__ is not tuple:
+            items = list(items)
+            order = Order(order.id, items)
+
+        total_products = 0
+        total_payments = 0
+        # The first float payment is settled against the totals at the end
+        payment = None
+        settled = len(items) <= _MAX_BATCH_ITEMS
+
+        try:
+            for item in items if settled else ():
+                cents = cached(item)
+                if cents is not None and item[3].__class__ is int:
+                    amount_class = item[2].__class__
+                    if amount_class is float or amount_class is int:
+                        total_products += cents
+                        continue
+
+                item_type, _, amount, quantity = item
+                if quantity.__class__ is not int:
+                    settled = False
+                    break
+                if item_type == 'payment' and quantity == 1:
+                    if payment is None and amount.__class__ is float and -1e13 < amount < 1e13:
+                        payment = amount
+                        continue
+                    cents = amount_cents.get((amount.__class__, amount), False)
+                    if cents is False:
+                        cents = amount_cents[amount.__class__, amount] = _batch_cents(amount)
+                    if cents is None:
+                        settled = False
+                        break
+                    total_payments += cents
+                elif item_type == 'product' and min_quantity <= quantity <= max_quantity:
+                    cents = amount_cents.get((amount.__class__, amount), False)
+                    if cents is False:
+                        cents = amount_cents[amount.__class__, amount] = _batch_cents(amount)
+                    if cents is None:
+                        settled = False
+                        break
+                    cents *= quantity
+                    if amount.__class__ is float or amount.__class__ is int:
+                        line_cents[item] = cents
+                    total_products += cents
+                else:
+                    settled = False
+                    break
+        except (TypeError, ValueError):
+            # Items that are not Item-shaped tuples, or unhashable amounts
+            settled = False
+
+        if settled and payment is not None:
+            # Below 1e13 a float is cents / 100 for at most one whole number
+            # of cents, so equality means the payment settles the balance.
+            if payment == (total_products - total_payments) / 100:
+                total_payments = total_products
+            else:
+                cents = round(payment * 100)
+                if cents / 100 == payment:
+                    total_payments += cents
+                else:
+                    settled = False
+
+        if not settled:
+            checked = _check_order(order, mode)
+            append(checked.message if as_text else checked)
+        elif total_products > _MAX_ORDER_TOTAL_CENTS:
+            checked = result(total_exceeded, order.id)
+            append(checked.message if as_text else checked)
+        elif total_payments != total_products:
+            checked = result(imbalance, order.id, total_payments - total_products, True)
+            append(checked.message if as_text else checked)
+        elif as_text:
+            append(f"Order ID: {order.id} - Full payment received!")
+        else:
+            append(result(paid, order.id))
+
+    return results
+
+
+def validorders(orders, mode: str = "decimal") -> list:
+    """Validates a batch of orders, returning one status string per order (see check_orders())."""
+    if _stats is not None:
+        return [result.message for result in _stats.observe_batch(orders, mode)]
+    return _check_orders(orders, mode, as_text=True)
+
+
+class ValidationStats:
+    """Counters and sampled timings collected while instrumentation is enabled.
+
+    Counts orders, items and results per Status. For every `sample_every`-th
+    order passed to check_order(), it also times validation and message
+    formatting separately. Each check_orders() call is timed as a whole.
+
+    Only the public entry points count: check_order(), validorder(),
+    check_orders() and validorders(), once per order passed in, including
+    when ValidationCache (on a miss), ValidationService or validate_stream()
+    call them. Cart and OrderBatch validate through _check_order() and are
+    never counted, and neither are validorders_parallel() workers, which run
+    in other processes.
+    """
+
+    PHASES = ('validate', 'format', 'batch')
+
+    def __init__(self, sample_every=100):
+        self.sample_every = sample_every
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.orders = 0
+            self.items = 0
+            self.statuses = Counter()
+            self.timings = {phase: [0, 0, 0] for phase in self.PHASES}  # samples, total ns, max ns
+
+    def _time(self, phase, elapsed_ns, orders=1):
+        timing = self.timings[phase]
+        timing[0] += orders
+        timing[1] += elapsed_ns
+        timing[2] = max(timing[2], elapsed_ns // orders)
+
+    def observe_order(self, order, mode):
+        if order.items.__class__ is not list and order.items.__class__ is not tuple:
+            order = Order(order.id, list(order.items))
+        with self._lock:
+            self.orders += 1
+            sampled = self.orders % self.sample_every == 0
+
+        if not sampled:
+            result = _check_order(order, mode)
+            with self._lock:
+                self.items += len(order.items)
+                self.statuses[result.status.name] += 1
+            return result
+
+        start = time.perf_counter_ns()
+        result = _check_order(order, mode)
+        validated = time.perf_counter_ns()
+        result.message
+        formatted = time.perf_counter_ns()
+        with self._lock:
+            self.items += len(order.items)
+            self.statuses[result.status.name] += 1
+            self._time('validate', validated - start)
+            self._time('format', formatted - validated)
+        return result
+
+    def observe_batch(self, orders, mode):
+        orders = [order if order.items.__class__ is list or order.items.__class__ is tuple
+                  else Order(order.id, list(order.items)) for order in orders]
+        start = time.perf_counter_ns()
+        results = _check_orders(orders, mode)
+        elapsed = time.perf_counter_ns() - start
+        statuses = Counter(result.status.name for result in results)
+        with self._lock:
+            self.orders += len(orders)
+            self.items += sum(len(order.items) for order in orders)
+            self.statuses.update(statuses)
+            if orders:
+                self._time('batch', elapsed, len(orders))
+        return results
+
+    def snapshot(self):
+        """Returns the counters as a plain dict, ready for a metrics exporter.
+
+        Timings are per order, in microseconds.
+        """
+        with self._lock:
+            return {
+                'orders': self.orders,
+                'items': self.items,
+                'statuses': dict(self.statuses),
+                'rejections': {name: count for name, count in self.statuses.items()
+                               if name != Status.PAID.name},
+                'sample_every': self.sample_every,
+                'timings': {
+                    phase: {
+                        'samples': samples,
+                        'mean_us': total / samples / 1000 if samples else 0.0,
+                        'max_us': longest / 1000,
+                    }
+                    for phase, (samples, total, longest) in self.timings.items()
+                },
+            }
+
+
+def enable_stats(sample_every=100) -> ValidationStats:
+    """Turns on instrumentation of check_order()/check_orders() and returns the collector."""
+    global _stats
+    _stats = ValidationStats(sample_every)
+    return _stats
+
 
-    return f"Order ID: {order.id} - Full payment received!"
+def disable_stats():
+    """Turns instrumentation off again; the validator goes back to its uninstrumented path."""
+    global _stats
+    _stats = None
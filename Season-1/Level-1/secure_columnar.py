@@ -0,0 +1,143 @@
+# secure_columnar.py
+
+from array import array
+from itertools import islice
+
+from secure_code import (MAX_QUANTITY, MIN_QUANTITY, OrderResult, Status, _MAX_BATCH_ITEMS,
+                         _MAX_ORDER_TOTAL_CENTS, _check_order, _to_cents)
+
+PRODUCT = 0
+PAYMENT = 1
+TYPE_CODES = {'product': PRODUCT, 'payment': PAYMENT}
+
+_INT64_MAX = 2 ** 63 - 1
+
+
+class OrderBatch:
+    """Column-oriented storage for a batch of orders.
+
+    Items are not kept as objects. They are spread over three typed arrays:
+    `types` holds item type codes (PRODUCT/PAYMENT), `cents` holds amounts as
+    fixed-point integer cents and `quantities` holds quantities. The items of
+    order i are at positions offsets[i]:offsets[i + 1].
+
+    An order that cannot be stored in these columns (unknown item type, an
+    amount that is not a whole number of cents, a non-integer quantity) is
+    validated with check_order() when appended. Its result is kept in
+    `verdicts`, and it gets no items in the columns. Like Cart, an OrderBatch
+    is not counted by enable_stats().
+    """
+
+    __slots__ = ('ids', 'types', 'cents', 'quantities', 'offsets', 'verdicts')
+
+    def __init__(self):
+        self.ids = []
+        self.types = array('b')
+        self.cents = array('q')
+        self.quantities = array('q')
+        self.offsets = array('q', [0])
+        self.verdicts = {}
+
+    @classmethod
+    def from_orders(cls, orders):
+        batch = cls()
+        for order in orders:
+            batch.append(order)
+        return batch
+
+    def __len__(self):
+        return len(self.ids)
+
+    def append(self, order):
+        """Adds one Order to the batch."""
+        items = list(order.items)
+        encoded = self._encode(items) if len(items) <= _MAX_BATCH_ITEMS else None
+        if encoded is None:
+            self.verdicts[len(self.ids)] = _check_order(order, "decimal")
+        else:
+            types, cents, quantities = encoded
+            self.types.extend(types)
+            self.cents.extend(cents)
+            self.quantities.extend(quantities)
+        self.ids.append(order.id)
+        self.offsets.append(len(self.types))
+
+    @staticmethod
+    def _encode(items):
+        """Returns the column values for items, or None if they don't fit."""
+        types, amounts, quantities = [], [], []
+        for item in items:
+            code = TYPE_CODES.get(item.type) if item.type.__class__ is str else None
+            cents = _to_cents(item.amount)
+            quantity = item.quantity
+            if (code is None or cents is None or not -_INT64_MAX <= cents <= _INT64_MAX
+                    or quantity.__class__ is not int or not -_INT64_MAX <= quantity <= _INT64_MAX):
+                return None
+            types.append(code)
+            amounts.append(cents)
+            quantities.append(quantity)
+        return types, amounts, quantities
+
+    def nbytes(self):
+        """Bytes held by the item columns and the offsets."""
+        return sum(column.buffer_info()[1] * column.itemsize
+                   for column in (self.types, self.cents, self.quantities, self.offsets))
+
+    def check(self):
+        """Validates every order, returning one OrderResult per order.
+
+        Runs the Level-1 rules directly over the columns and gives the same
+        verdicts as check_order() on the original orders.
+        """
+        return self._check(as_text=False)
+
+    def validate(self):
+        """Validates every order, returning one validorder()-style status string per order.
+
+        Formats the strings directly instead of going through check(), so it
+        does not pay for an OrderResult per order.
+        """
+        return self._check(as_text=True)
+
+    def _check(self, as_text):
+        results = []
+        append = results.append
+        verdicts = self.verdicts
+        offsets = self.offsets
+        columns = zip(self.types, self.cents, self.quantities)
+
+        for index, order_id in enumerate(self.ids):
+            if index in verdicts:
+                append(verdicts[index].message if as_text else verdicts[index])
+                continue
+
+            error = None
+            total_products = 0
+            total_payments = 0
+            for code, cents, quantity in islice(columns, offsets[index + 1] - offsets[index]):
+                if error is not None:
+                    continue
+                if code == PRODUCT:
+                    if MIN_QUANTITY <= quantity <= MAX_QUANTITY:
+                        total_products += cents * quantity
+                    else:
+                        error = OrderResult(Status.QUANTITY_OUT_OF_RANGE, order_id, quantity)
+                elif quantity == 1:
+                    total_payments += cents
+                else:
+                    error = OrderResult(Status.INVALID_PAYMENT_QUANTITY, order_id, quantity)
+
+            if error is None:
+                if total_products > _MAX_ORDER_TOTAL_CENTS:
+                    error = OrderResult(Status.TOTAL_EXCEEDED, order_id)
+                elif total_payments != total_products:
+                    error = OrderResult(Status.IMBALANCE, order_id, total_payments - total_products, True)
+                elif as_text:
+                    append(f"Order ID: {order_id} - Full payment received!")
+                    continue
+                else:
+                    append(OrderResult(Status.PAID, order_id))
+                    continue
+            append(error.message if as_text else error)
+
+        return results
@@ -0,0 +1,64 @@
+# secure_parallel.py
+
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from secure_code import Item, Order, validorders
+
+CHUNK_SIZE = 4096
+
+
+def _pack(orders):
+    """Encodes a chunk of orders as plain tuples for the trip to a worker.
+
+    Descriptions are dropped since validation never reads them, and plain
+    tuples pickle far smaller than namedtuples:
+    [(order_id, ((type, amount, quantity), ...)), ...]
+    """
+    return [(order.id, tuple((item.type, item.amount, item.quantity) for item in order.items))
+            for order in orders]
+
+
+def _validate_packed(chunk):
+    """Worker entry point: rebuilds the orders of a packed chunk and validates them."""
+    return validorders([Order(order_id, [Item(item_type, None, amount, quantity)
+                                         for item_type, amount, quantity in items])
+                        for order_id, items in chunk])
+
+
+def validorders_parallel(orders, workers=None, chunk_size=CHUNK_SIZE):
+    """Validates an order stream on a pool of worker processes.
+
+    Orders are cut into chunks of `chunk_size`, packed into compact tuples and
+    validated with validorders() in the workers. At most two chunks per worker
+    are in flight, so arbitrarily long streams run in bounded memory.
+
+    Args:
+        orders: An iterable of Order objects.
+        workers: Number of worker processes (defaults to the CPU count).
+        chunk_size: Orders sent to a worker at a time.
+
+    Yields:
+        One status string per order, in input order.
+    """
+    workers = workers or os.cpu_count() or 1
+    orders = iter(orders)
+
+    if workers == 1:
+        while chunk := list(islice(orders, chunk_size)):
+            yield from validorders(chunk)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        while True:
+            while len(pending) < 2 * workers:
+                chunk = list(islice(orders, chunk_size))
+                if not chunk:
+                    break
+                pending.append(pool.submit(_validate_packed, _pack(chunk)))
+            if not pending:
+                return
+            yield from pending.popleft().result()
@@ -0,0 +1,162 @@
+# secure_rules.py
+
+from collections import namedtuple
+from decimal import Decimal, InvalidOperation
+
+from secure_code import MAX_ORDER_TOTAL, MAX_QUANTITY, MIN_QUANTITY, OrderResult, Status
+
+# A rule checks one field ('amount' or 'quantity') of the items of one type
+# (or of every type when item_type is None). op is one of OPS, and a failing
+# rule rejects the order with `status`, carrying the item's raw field value.
+Rule = namedtuple('Rule', 'item_type, field, op, value, status')
+
+# item_types maps each allowed item type to its role: 'product' items add
+# amount * quantity to the amount payable, 'payment' items add amount to
+# the amount paid. Rules run in order, after the type and amount checks.
+RuleSet = namedtuple('RuleSet', 'item_types, rules, max_order_total')
+
+OPS = {
+    'int': lambda field, value: isinstance(field, int),
+    'range': lambda field, value: value[0] <= field <= value[1],
+    'eq': lambda field, value: field == value,
+    'min': lambda field, value: field >= value,
+    'max': lambda field, value: field <= value,
+}
+
+_CONDITIONS = {
+    'int': "isinstance({field}, int)",
+    'range': "{value}[0] <= {field} <= {value}[1]",
+    'eq': "{field} == {value}",
+    'min': "{field} >= {value}",
+    'max': "{field} <= {value}",
+}
+
+# The rules hard-coded in secure_code.check_order()
+SECURE_RULES = RuleSet(
+    item_types={'product': 'product', 'payment': 'payment'},
+    rules=(
+        Rule(None, 'quantity', 'int', None, Status.INVALID_QUANTITY_TYPE),
+        Rule('product', 'quantity', 'range', (MIN_QUANTITY, MAX_QUANTITY), Status.QUANTITY_OUT_OF_RANGE),
+        Rule('payment', 'quantity', 'eq', 1, Status.INVALID_PAYMENT_QUANTITY),
+    ),
+    max_order_total=MAX_ORDER_TOTAL,
+)
+
+
+def _check_ruleset(ruleset):
+    for role in ruleset.item_types.values():
+        if role not in {'product', 'payment'}:
+            raise ValueError(f"Unknown item role: {role!r}")
+    for rule in ruleset.rules:
+        if rule.field not in {'amount', 'quantity'}:
+            raise ValueError(f"Unknown rule field: {rule.field!r}")
+        if rule.op not in OPS:
+            raise ValueError(f"Unknown rule op: {rule.op!r}")
+        if rule.item_type is not None and rule.item_type not in ruleset.item_types:
+            raise ValueError(f"Rule for unknown item type: {rule.item_type!r}")
+
+
+def check_order_interpreted(order, ruleset=SECURE_RULES):
+    """Validates an order by walking the rule set item by item.
+
+    This is the reference for compile_rules(): simple, but every rule costs
+    an attribute lookup and a dispatch per item.
+    """
+    totals = {'product': Decimal('0'), 'payment': Decimal('0')}
+
+    for item in order.items:
+        role = ruleset.item_types.get(item.type)
+        if role is None:
+            return OrderResult(Status.INVALID_TYPE, order.id, item.type)
+
+        try:
+            amount = Decimal(str(item.amount))
+        except (InvalidOperation, TypeError, ValueError):
+            return OrderResult(Status.INVALID_AMOUNT, order.id, item.amount)
+
+        fields = {'amount': amount, 'quantity': item.quantity}
+        for rule in ruleset.rules:
+            if rule.item_type is not None and rule.item_type != item.type:
+                continue
+            if not OPS[rule.op](fields[rule.field], rule.value):
+                return OrderResult(rule.status, order.id, getattr(item, rule.field))
+
+        totals[role] += amount * item.quantity if role == 'product' else amount
+
+    if totals['product'] > ruleset.max_order_total:
+        return OrderResult(Status.TOTAL_EXCEEDED, order.id)
+    if totals['payment'] != totals['product']:
+        return OrderResult(Status.IMBALANCE, order.id, totals['payment'] - totals['product'])
+    return OrderResult(Status.PAID, order.id)
+
+
+def compile_rules(ruleset=SECURE_RULES):
+    """Compiles a rule set into one specialized check_order()-style function.
+
+    The rules are unrolled into straight-line comparisons, grouped by item
+    type, so adding a rule adds a single comparison to the items it applies
+    to and no per-rule dispatch. Rule values and type names are bound as
+    constants of the generated function and never pasted into its source.
+    The generated source is kept on the function as `.source`.
+    """
+    _check_ruleset(ruleset)
+    constants = {
+        '_Decimal': Decimal,
+        '_InvalidOperation': InvalidOperation,
+        '_OrderResult': OrderResult,
+        '_Status': Status,
+        '_types': frozenset(ruleset.item_types),
+        '_max_total': ruleset.max_order_total,
+    }
+
+    def constant(value):
+        name = f"_c{len(constants)}"
+        constants[name] = value
+        return name
+
+    lines = [
+        "def check_order(order):",
+        "    order_id = order.id",
+        "    total_products = _Decimal('0')",
+        "    total_payments = _Decimal('0')",
+        "    for item in order.items:",
+        "        item_type = item.type",
+        "        if item_type not in _types:",
+        "            return _OrderResult(_Status.INVALID_TYPE, order_id, item_type)",
+        "        try:",
+        "            amount = _Decimal(str(item.amount))",
+        "        except (_InvalidOperation, TypeError, ValueError):",
+        "            return _OrderResult(_Status.INVALID_AMOUNT, order_id, item.amount)",
+        "        quantity = item.quantity",
+    ]
+
+    keyword = "if"
+    for item_type, role in ruleset.item_types.items():
+        lines.append(f"        {keyword} item_type == {constant(item_type)}:")
+        keyword = "elif"
+        for rule in ruleset.rules:
+            if rule.item_type not in (None, item_type):
+                continue
+            condition = _CONDITIONS[rule.op].format(field=rule.field, value=constant(rule.value))
+            raw = "item.amount" if rule.field == 'amount' else "quantity"
+            lines.append(f"            if not ({condition}):")
+            lines.append(f"                return _OrderResult({constant(rule.status)}, order_id, {raw})")
+        if role == 'product':
+            lines.append("            total_products += amount * quantity")
+        else:
+            lines.append("            total_payments += amount")
+
+    lines += [
+        "    if total_products > _max_total:",
+        "        return _OrderResult(_Status.TOTAL_EXCEEDED, order_id)",
+        "    if total_payments != total_products:",
+        "        return _OrderResult(_Status.IMBALANCE, order_id, total_payments - total_products)",
+        "    return _OrderResult(_Status.PAID, order_id)",
+    ]
+
+    source = "\n".join(lines) + "\n"
+    namespace = dict(constants)
+    exec(compile(source, "<compiled order rules>", "exec"), namespace)
+    check = namespace['check_order']
+    check.source = source
+    return check
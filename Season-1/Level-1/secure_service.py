@@ -0,0 +1,171 @@
+# secure_service.py
+
+import argparse
+import asyncio
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from secure_code import check_order, check_orders
+
+MAX_BATCH = 256
+MAX_DELAY = 0.002  # seconds
+
+
+def _check_batch(orders, mode):
+    """Validates a micro-batch, isolating orders that make validation raise."""
+    try:
+        return check_orders(orders, mode)
+    except Exception:
+        results = []
+        for order in orders:
+            try:
+                results.append(check_order(order, mode))
+            except Exception as e:
+                results.append(e)
+        return results
+
+
+class ValidationService:
+    """Async front end that validates concurrent requests in micro-batches.
+
+    Calls to check() made within `max_delay` seconds of each other, up to
+    `max_batch` of them, are validated together with check_orders(). The
+    batch runs on the event loop, or on `executor` (a thread or process pool)
+    when one is given, so validation never blocks other I/O. Each caller
+    awaits only its own result.
+    """
+
+    def __init__(self, max_batch=MAX_BATCH, max_delay=MAX_DELAY, executor=None, mode: str = "decimal"):
+        assert mode in {"decimal", "cents"}, "mode must be 'decimal' or 'cents'"
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.executor = executor
+        self.mode = mode
+        self.batches = 0
+        self._pending = []
+        self._timer = None
+        self._inflight = set()
+
+    async def check(self, order):
+        """Validates one order as part of the next micro-batch, returning an OrderResult."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((order, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_delay, self._flush)
+        return await future
+
+    async def validate(self, order):
+        """Like check(), but returns a validorder()-style status string."""
+        return (await self.check(order)).message
+
+    async def aclose(self):
+        """Validates anything still queued and waits for in-flight batches."""
+        self._flush()
+        if self._inflight:
+            await asyncio.gather(*self._inflight)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.aclose()
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+
+        batch, self._pending = self._pending, []
+        self.batches += 1
+        orders = [order for order, _ in batch]
+        futures = [future for _, future in batch]
+
+        if self.executor is None:
+            self._resolve(futures, _check_batch(orders, self.mode))
+            return
+
+        task = asyncio.ensure_future(self._run_in_executor(orders, futures))
+        self._inflight.add(task)
+        task.add_done_callback(self._inflight.discard)
+
+    async def _run_in_executor(self, orders, futures):
+        loop = asyncio.get_running_loop()
+        try:
+            results = await loop.run_in_executor(self.executor, _check_batch, orders, self.mode)
+        except Exception as e:
+            results = [e] * len(futures)
+        self._resolve(futures, results)
+
+    @staticmethod
+    def _resolve(futures, results):
+        for future, result in zip(futures, results):
+            if future.done():  # the caller gave up waiting
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+
+async def run_load(service, orders, concurrency):
+    """Sends `orders` through `service` from `concurrency` concurrent clients.
+
+    Returns the per-request latencies in seconds.
+    """
+    latencies = []
+    queue = iter(orders)
+
+    async def client():
+        for order in queue:
+            start = time.perf_counter()
+            await service.check(order)
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return latencies
+
+
+def main(argv=None):
+    from secure_benchmark import make_orders
+
+    parser = argparse.ArgumentParser(description="Load generator for the micro-batching validation service")
+    parser.add_argument("--requests", type=int, default=100_000)
+    parser.add_argument("--concurrency", type=int, default=500)
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH)
+    parser.add_argument("--max-delay-ms", type=float, default=MAX_DELAY * 1000)
+    parser.add_argument("--executor", choices=["none", "thread", "process"], default="none")
+    args = parser.parse_args(argv)
+
+    orders = make_orders(args.requests)
+    pools = {"none": None, "thread": ThreadPoolExecutor, "process": ProcessPoolExecutor}
+    pool = pools[args.executor]() if pools[args.executor] else None
+
+    async def run():
+        async with ValidationService(args.max_batch, args.max_delay_ms / 1000, pool) as service:
+            start = time.perf_counter()
+            latencies = await run_load(service, orders, args.concurrency)
+            return time.perf_counter() - start, latencies, service.batches
+
+    try:
+        elapsed, latencies, batches = asyncio.run(run())
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    latencies.sort()
+    p50 = statistics.median(latencies) * 1000
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+    print(f"[LOAD] {len(latencies)} requests, {args.concurrency} clients, executor={args.executor}")
+    print(f"[LOAD] {batches} batches (avg {len(latencies) / max(batches, 1):.1f} orders/batch)")
+    print(f"[LOAD] throughput: {len(latencies) / elapsed:,.0f} orders/s")
+    print(f"[LOAD] latency p50: {p50:.2f} ms  p99: {p99:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
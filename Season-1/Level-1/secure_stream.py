@@ -0,0 +1,155 @@
+# secure_stream.py
+
+import argparse
+import csv
+import json
+import os
+import re
+import sys
+import time
+from decimal import Decimal
+from itertools import groupby, islice
+
+from secure_code import Item, Order, validorders
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+BATCH_SIZE = 1024
+CSV_FIELDS = ('order_id', 'type', 'description', 'amount', 'quantity')
+
+
+_NUMBER = re.compile(r'[+-]?[0-9]+(?:\.[0-9]+)?')  # ASCII digits only: int() also takes '١٢' and '1_000'
+
+
+class MalformedNumber(str):
+    """CSV text in a number column that is not a plain decimal number.
+
+    int() and Decimal() accept forms such as '1_000', ' 5 ' and '1e3', and
+    so would the validator, which reads a string amount through
+    Decimal(str(amount)). str() of a MalformedNumber is its repr, which no
+    parser accepts, so the cell is reported invalid, quoted, which also
+    makes stray whitespace visible in the message.
+    """
+
+    __slots__ = ()
+
+    def __str__(self):
+        return str.__repr__(self)
+
+
+def _parse_number(text):
+    """Parses a CSV amount or quantity without going through float.
+
+    Only an optional sign, ASCII digits and an optional fractional part are
+    numbers: int for whole numbers, Decimal otherwise. Any other text comes
+    back as a MalformedNumber, and None, which csv gives for the missing
+    cells of a short row, unchanged, so the validator reports them as it
+    would a bad value built in Python.
+    """
+    if text is None:
+        return None
+    if _NUMBER.fullmatch(text) is None:
+        return MalformedNumber(text)
+    return Decimal(text) if '.' in text else int(text)
+
+
+def read_jsonl(path):
+    """Yields one Order per line of a JSONL file, parsing lazily.
+
+    Each line holds {"id": ..., "items": [{"type", "description", "amount",
+    "quantity"}, ...]}. Decimal numbers are read as Decimal, never float.
+    """
+    with open(path, encoding='utf-8') as lines:
+        for line_number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line, parse_float=Decimal)
+                items = [Item(item.get('type'), item.get('description'),
+                              item.get('amount'), item.get('quantity'))
+                         for item in record.get('items', [])]
+            except (ValueError, AttributeError, TypeError) as e:
+                raise ValueError(f"{path}:{line_number}: malformed order record") from e
+            yield Order(record.get('id'), items)
+
+
+def read_csv(path):
+    """Yields one Order per run of consecutive rows sharing an order_id.
+
+    The file needs a header with the columns in CSV_FIELDS. Only the rows of
+    the current order are held in memory.
+    """
+    with open(path, encoding='utf-8', newline='') as rows:
+        reader = csv.DictReader(rows)
+        missing = set(CSV_FIELDS) - set(reader.fieldnames or ())
+        if missing:
+            raise ValueError(f"{path}: missing CSV columns: {', '.join(sorted(missing))}")
+
+        for order_id, group in groupby(reader, key=lambda row: row['order_id']):
+            items = [Item(row['type'], row['description'],
+                          _parse_number(row['amount']), _parse_number(row['quantity']))
+                     for row in group]
+            yield Order(order_id, items)
+
+
+def read_orders(path, fmt=None):
+    """Picks the reader for `path` from `fmt` or the file extension."""
+    fmt = fmt or os.path.splitext(path)[1].lstrip('.').lower()
+    if fmt in {'jsonl', 'ndjson'}:
+        return read_jsonl(path)
+    if fmt == 'csv':
+        return read_csv(path)
+    raise ValueError(f"Unsupported order file format: {fmt!r}")
+
+
+def validate_stream(orders, batch_size=BATCH_SIZE):
+    """Validates an iterable of orders lazily, yielding one status per order.
+
+    Orders are pulled in batches of `batch_size` and passed to validorders(),
+    so memory stays bounded by the batch size, not by the length of the stream.
+    """
+    orders = iter(orders)
+    while True:
+        batch = list(islice(orders, batch_size))
+        if not batch:
+            return
+        yield from validorders(batch)
+
+
+def peak_rss_mb():
+    """Returns the peak resident set size of this process in MiB, if known."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in KiB elsewhere
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stream-validate a JSONL or CSV order dump")
+    parser.add_argument("path", help="order file (.jsonl or .csv)")
+    parser.add_argument("--format", choices=["jsonl", "csv"], help="override format detection")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--quiet", action="store_true", help="only print the summary")
+    args = parser.parse_args(argv)
+
+    count = 0
+    start = time.perf_counter()
+    for status in validate_stream(read_orders(args.path, args.format), args.batch_size):
+        count += 1
+        if not args.quiet:
+            print(status)
+    elapsed = time.perf_counter() - start
+
+    rate = count / elapsed if elapsed else 0.0
+    peak = peak_rss_mb()
+    print(f"[SUMMARY] {count} orders in {elapsed:.3f}s ({rate:,.0f} orders/s)", file=sys.stderr)
+    print(f"[SUMMARY] peak RSS: {'unknown' if peak is None else f'{peak:.1f} MiB'}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
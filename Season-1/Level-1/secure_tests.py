@@ -0,0 +1,562 @@
+# secure_tests.py
+
+import asyncio
+import json
+import os
+import random
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+import secure_cache
+import secure_cart
+import secure_code as c
+import secure_columnar
+import secure_parallel
+import secure_rules
+import secure_service
+import secure_stream
+
+
+def make_orders(count, seed=0):
+    """Builds a reproducible mix of valid, imbalanced and malformed orders."""
+    rng = random.Random(seed)
+    amounts = [9.99, 19.99, 100.0, 250.5, 1000, 3.3, 1.1, 2.2, 0.1, 1e19, -1e19,
+               1.005, Decimal('12.50'), '15.00', 'abc', None]
+    quantities = [1, 1, 2, 5, 100, 101, 0, -1, 1.5, True]
+    types = ['product', 'product', 'payment', 'payment', 'service']
+    orders = []
+    for order_id in range(count):
+        items = [c.Item(type=rng.choice(types), description='item',
+                        amount=rng.choice(amounts), quantity=rng.choice(quantities))
+                 for _ in range(rng.randint(0, 4))]
+        orders.append(c.Order(id=str(order_id), items=items))
+    return orders
+
+
+class TestSecureOrderValidation(unittest.TestCase):
+
+    def test_valid_order(self):
+        tv = c.Item(type='product', description='tv', amount=1000.00, quantity=1)
+        payment = c.Item(type='payment', description='invoice_1', amount=1000.00, quantity=1)
+        order = c.Order(id='1', items=[payment, tv])
+        self.assertEqual(c.validorder(order), 'Order ID: 1 - Full payment received!')
+
+    def test_float_rounding_is_exact(self):
+        items = [c.Item('product', 'accessory', 3.3, 1),
+                 c.Item('payment', 'invoice_5_1', 1.1, 1),
+                 c.Item('payment', 'invoice_5_2', 2.2, 1)]
+        self.assertEqual(c.validorder(c.Order('5', items)), 'Order ID: 5 - Full payment received!')
+
+    def test_order_total_is_limited(self):
+        items = [c.Item('product', 'tv', 99999, 12)]
+        items += [c.Item('payment', 'invoice', 99999, 1) for _ in range(12)]
+        self.assertEqual(c.validorder(c.Order('1', items)), 'Total amount payable for an order exceeded')
+
+
+class TestBatchValidation(unittest.TestCase):
+
+    def test_matches_single_order_path(self):
+        orders = make_orders(5000)
+        self.assertEqual(c.validorders(orders), [c.validorder(order) for order in orders])
+
+    def test_preserves_input_order(self):
+        orders = [c.Order(id=str(i), items=[c.Item('payment', 'p', i, 1)]) for i in range(1, 4)]
+        self.assertEqual(c.validorders(orders), [
+            'Order ID: 1 - Payment imbalance: $1.00',
+            'Order ID: 2 - Payment imbalance: $2.00',
+            'Order ID: 3 - Payment imbalance: $3.00',
+        ])
+
+    def test_underflow_attack_is_detected(self):
+        items = [c.Item('payment', 'invoice_4', 1e19, 1),
+                 c.Item('product', 'tv', 1000.00, 1),
+                 c.Item('payment', 'payback_4', -1e19, 1)]
+        self.assertEqual(c.validorders([c.Order('4', items)]), ['Order ID: 4 - Payment imbalance: $-1000.00'])
+
+    def test_accepts_generators(self):
+        items = (item for item in [c.Item('product', 'tv', 5, 1), c.Item('payment', 'p', 5, 1)])
+        self.assertEqual(c.validorders(iter([c.Order('1', items)])), ['Order ID: 1 - Full payment received!'])
+
+    def test_empty_batch(self):
+        self.assertEqual(c.validorders([]), [])
+
+    def test_equal_items_of_other_types_are_checked_again(self):
+        payment = c.Item('payment', 'p', 2.0, 1)
+        orders = [c.Order(str(i), [product, payment]) for i, product in enumerate([
+            c.Item('product', 'pen', 1, 2),
+            c.Item('product', 'pen', True, 2),
+            c.Item('product', 'pen', 1, 2.0),
+            c.Item('product', 'pen', Decimal(1), 2),
+            c.Item('product', 'pen', 1.0, 2),
+        ])]
+        self.assertEqual(c.validorders(orders), [c.validorder(order) for order in orders])
+        self.assertEqual(c.validorders(orders)[1:3], ['Invalid amount: True',
+                                                      "Invalid quantity type: 2.0 (<class 'float'>)"])
+
+    def test_payments_settled_against_the_total(self):
+        items = [c.Item('product', 'tv', 0.1, 3)]
+        self.assertEqual(c.validorders([c.Order('1', items + [c.Item('payment', 'p', 0.3, 1)]),
+                                        c.Order('2', items + [c.Item('payment', 'p', 0.1 + 0.2, 1)]),
+                                        c.Order('3', items + [c.Item('payment', 'p', 0.29, 1)])]), [
+            'Order ID: 1 - Full payment received!',
+            'Order ID: 2 - Payment imbalance: $0.00',
+            'Order ID: 3 - Payment imbalance: $-0.01',
+        ])
+
+
+class TestCentsMode(unittest.TestCase):
+
+    def test_matches_decimal_path_for_whole_cents(self):
+        orders = make_orders(5000, seed=5)
+        for order in orders:
+            if all(c._to_cents(item.amount) is not None for item in order.items):
+                self.assertEqual(c.validorder(order, mode='cents'), c.validorder(order), order)
+
+    def test_rejects_sub_cent_amounts(self):
+        items = [c.Item('product', 'pen', 0.005, 2), c.Item('payment', 'p', 0.01, 1)]
+        self.assertEqual(c.validorder(c.Order('1', items)), 'Order ID: 1 - Full payment received!')
+        self.assertEqual(c.validorder(c.Order('1', items), mode='cents'), 'Invalid amount: 0.005')
+        self.assertEqual(c.validorder(c.Order('1', [c.Item('payment', 'p', 0.1 + 0.2, 1)]), mode='cents'),
+                         'Invalid amount: 0.30000000000000004')
+
+    def test_keeps_overflow_and_underflow_guards(self):
+        items = [c.Item('payment', 'invoice_4', 1e19, 1),
+                 c.Item('product', 'tv', 1000.00, 1),
+                 c.Item('payment', 'payback_4', -1e19, 1)]
+        self.assertEqual(c.validorder(c.Order('4', items), mode='cents'),
+                         'Order ID: 4 - Payment imbalance: $-1000.00')
+        items = [c.Item('product', 'tv', 99999, 12)] + [c.Item('payment', 'p', 99999, 1)] * 12
+        self.assertEqual(c.validorder(c.Order('1', items), mode='cents'),
+                         'Total amount payable for an order exceeded')
+
+    def test_batch_mode(self):
+        orders = make_orders(2000, seed=6)
+        self.assertEqual(c.validorders(orders, mode='cents'),
+                         [c.validorder(order, mode='cents') for order in orders])
+
+    def test_format_cents(self):
+        for cents in (0, 5, -5, 99, -100, 123456, -100000):
+            self.assertEqual(c._format_cents(cents), f"{Decimal(cents) / 100:.2f}")
+
+    def test_unknown_mode(self):
+        with self.assertRaises(AssertionError):
+            c.validorder(c.Order('1', []), mode='float')
+
+
+class TestStructuredResults(unittest.TestCase):
+
+    def test_messages_match_legacy_strings(self):
+        orders = make_orders(3000, seed=7)
+        self.assertEqual([c.check_order(order).message for order in orders],
+                         [c.validorder(order) for order in orders])
+        self.assertEqual([str(result) for result in c.check_orders(orders)], c.validorders(orders))
+
+    def test_result_fields(self):
+        tv = c.Item('product', 'tv', 1000.00, 1)
+        result = c.check_order(c.Order('2', [tv]))
+        self.assertEqual(result.status, c.Status.IMBALANCE)
+        self.assertFalse(result.ok)
+        self.assertEqual(result.order_id, '2')
+        self.assertEqual(result.diff, Decimal('-1000.00'))
+
+        [batched] = c.check_orders([c.Order('2', [tv])])
+        self.assertTrue(batched.in_cents)
+        self.assertEqual(batched.value, -100000)
+        self.assertEqual(batched.diff, Decimal('-1000.00'))
+
+        paid = c.check_order(c.Order('1', [tv, c.Item('payment', 'p', 1000, 1)]))
+        self.assertTrue(paid.ok)
+        self.assertIsNone(paid.diff)
+
+    def test_rejections_carry_offending_value(self):
+        result = c.check_order(c.Order('1', [c.Item('product', 'tv', 1000, 1.5)]))
+        self.assertEqual(result.status, c.Status.INVALID_QUANTITY_TYPE)
+        self.assertEqual(result.value, 1.5)
+        self.assertEqual(result.message, "Invalid quantity type: 1.5 (<class 'float'>)")
+
+
+class TestIncrementalCart(unittest.TestCase):
+
+    def test_matches_full_validation_after_every_edit(self):
+        rng = random.Random(8)
+        pool = [item for order in make_orders(500, seed=8) for item in order.items]
+        for mode in ('decimal', 'cents'):
+            cart = secure_cart.Cart('42', mode=mode)
+            handles = []
+            for _ in range(2000):
+                if handles and rng.random() < 0.45:
+                    cart.remove(handles.pop(rng.randrange(len(handles))))
+                else:
+                    handles.append(cart.add(rng.choice(pool)))
+                self.assertEqual(cart.validate(), c.validorder(c.Order('42', list(cart)), mode))
+
+    def test_checkout_flow(self):
+        cart = secure_cart.Cart('7')
+        tv = cart.add(c.Item('product', 'tv', 1000.00, 1))
+        self.assertEqual(cart.validate(), 'Order ID: 7 - Payment imbalance: $-1000.00')
+        bad = cart.add(c.Item('service', 'shipping', 10, 1))
+        self.assertEqual(cart.validate(), 'Invalid item type: service')
+        cart.remove(bad)
+        cart.add(c.Item('payment', 'invoice', 1000.00, 1))
+        self.assertTrue(cart.check().ok)
+        cart.remove(tv)
+        self.assertEqual(len(cart), 1)
+        self.assertEqual(cart.validate(), 'Order ID: 7 - Payment imbalance: $1000.00')
+        with self.assertRaises(KeyError):
+            cart.remove(tv)
+
+    def test_non_finite_amounts(self):
+        for mode in ('decimal', 'cents'):
+            cart = secure_cart.Cart('1', mode=mode)
+            cart.add(c.Item('product', 'tv', 5.0, 1))
+            cart.add(c.Item('payment', 'p', 5.0, 1))
+            for amount in (Decimal('NaN'), float('nan')):
+                nan = cart.add(c.Item('product', 'x', amount, 1))
+                self.assertEqual(len(cart), 3)
+                self.assertEqual(cart.validate(), f'Invalid amount: {amount}')
+                cart.remove(nan)
+            self.assertEqual(cart.validate(), 'Order ID: 1 - Full payment received!')
+
+            refund = cart.add(c.Item('refund', 'r', 5, 1))
+            cart.add(c.Item('product', 'x', Decimal('NaN'), 1))
+            self.assertEqual(cart.validate(), 'Invalid item type: refund')
+            self.assertEqual(cart.validate(), c.validorder(c.Order('1', list(cart)), mode))
+            cart.remove(refund)
+
+        for amount in (float('inf'), Decimal('-Infinity')):
+            for item_type in ('product', 'payment'):
+                for mode in ('decimal', 'cents'):
+                    cart = secure_cart.Cart('1', mode=mode)
+                    cart.add(c.Item('product', 'tv', 5.0, 1))
+                    cart.add(c.Item(item_type, 'x', amount, 1))
+                    self.assertEqual(cart.validate(), c.validorder(c.Order('1', list(cart)), mode))
+
+
+class TestCompiledRules(unittest.TestCase):
+
+    def test_secure_rules_match_check_order(self):
+        orders = make_orders(5000, seed=9)
+        compiled = secure_rules.compile_rules(secure_rules.SECURE_RULES)
+        expected = [c.validorder(order) for order in orders]
+        self.assertEqual([compiled(order).message for order in orders], expected)
+        self.assertEqual([secure_rules.check_order_interpreted(order).message for order in orders], expected)
+
+    def test_shop_specific_rules(self):
+        ruleset = secure_rules.RuleSet(
+            item_types={'product': 'product', 'payment': 'payment', 'gift_card': 'payment'},
+            rules=secure_rules.SECURE_RULES.rules + (
+                secure_rules.Rule('product', 'amount', 'max', Decimal('100000'), c.Status.INVALID_AMOUNT),
+                secure_rules.Rule('gift_card', 'amount', 'range', (Decimal('0'), Decimal('500')),
+                                  c.Status.INVALID_AMOUNT),
+            ),
+            max_order_total=c.MAX_ORDER_TOTAL,
+        )
+        compiled = secure_rules.compile_rules(ruleset)
+        orders = [
+            c.Order('1', [c.Item('product', 'tv', 100, 1), c.Item('gift_card', 'gc', 60, 1),
+                          c.Item('payment', 'p', 40, 1)]),
+            c.Order('2', [c.Item('product', 'yacht', 100000.01, 1)]),
+            c.Order('3', [c.Item('gift_card', 'gc', 501, 1)]),
+            c.Order('4', [c.Item('gift_card', 'gc', 5, 2)]),
+        ]
+        expected = ['Order ID: 1 - Full payment received!', 'Invalid amount: 100000.01',
+                    'Invalid amount: 501', 'Order ID: 4 - Payment imbalance: $5.00']
+        self.assertEqual([compiled(order).message for order in orders], expected)
+        self.assertEqual([secure_rules.check_order_interpreted(order, ruleset).message for order in orders],
+                         expected)
+
+    def test_rule_values_are_not_pasted_into_source(self):
+        ruleset = secure_rules.RuleSet({"x'); import os; ('": 'product'}, (), c.MAX_ORDER_TOTAL)
+        compiled = secure_rules.compile_rules(ruleset)
+        self.assertNotIn('import os', compiled.source)
+
+    def test_rejects_unknown_ops(self):
+        ruleset = secure_rules.RuleSet({'product': 'product'},
+                                       (secure_rules.Rule(None, 'quantity', 'regex', '.*', c.Status.INVALID_AMOUNT),),
+                                       c.MAX_ORDER_TOTAL)
+        with self.assertRaises(ValueError):
+            secure_rules.compile_rules(ruleset)
+
+
+class TestValidationService(unittest.IsolatedAsyncioTestCase):
+
+    async def test_concurrent_requests_share_batches(self):
+        orders = make_orders(1000, seed=10)
+        async with secure_service.ValidationService(max_batch=64, max_delay=0.001) as service:
+            results = await asyncio.gather(*(service.validate(order) for order in orders))
+        self.assertEqual(results, c.validorders(orders))
+        self.assertEqual(service.batches, 16)
+
+    async def test_partial_batch_flushes_after_delay(self):
+        service = secure_service.ValidationService(max_batch=1000, max_delay=0.001)
+        result = await service.check(c.Order('1', [c.Item('product', 'tv', 5, 1)]))
+        self.assertEqual(result.status, c.Status.IMBALANCE)
+        self.assertEqual(service.batches, 1)
+
+    async def test_thread_executor(self):
+        orders = make_orders(200, seed=11)
+        with ThreadPoolExecutor(2) as pool:
+            async with secure_service.ValidationService(max_batch=50, executor=pool) as service:
+                results = await asyncio.gather(*(service.validate(order) for order in orders))
+        self.assertEqual(results, c.validorders(orders))
+
+    async def test_bad_order_only_fails_its_caller(self):
+        good = c.Order('1', [c.Item('payment', 'p', 5, 1)])
+        bad = c.Order('2', [object()])
+        async with secure_service.ValidationService() as service:
+            results = await asyncio.gather(service.validate(good), service.validate(bad),
+                                           return_exceptions=True)
+        self.assertEqual(results[0], 'Order ID: 1 - Payment imbalance: $5.00')
+        self.assertIsInstance(results[1], AttributeError)
+
+    async def test_load_generator(self):
+        async with secure_service.ValidationService(max_batch=32) as service:
+            latencies = await secure_service.run_load(service, make_orders(100, seed=12), concurrency=10)
+        self.assertEqual(len(latencies), 100)
+
+
+class TestValidationCache(unittest.TestCase):
+
+    def test_retries_hit_the_cache(self):
+        cache = secure_cache.ValidationCache()
+        orders = make_orders(500, seed=13)
+        first = [cache.validate(order) for order in orders]
+        second = [cache.validate(order) for order in orders]
+        self.assertEqual(first, [c.validorder(order) for order in orders])
+        self.assertEqual(second, first)
+        self.assertEqual(cache.stats()['hits'], 500)
+        self.assertEqual(cache.stats()['misses'], 500)
+
+    def test_changed_items_under_same_id_are_revalidated(self):
+        cache = secure_cache.ValidationCache()
+        tv = c.Item('product', 'tv', 1000, 1)
+        self.assertEqual(cache.validate(c.Order('1', [tv])), 'Order ID: 1 - Payment imbalance: $-1000.00')
+        paid = c.Order('1', [tv, c.Item('payment', 'p', 1000, 1)])
+        self.assertEqual(cache.validate(paid), 'Order ID: 1 - Full payment received!')
+        # same value, different type: True is not a valid amount
+        self.assertEqual(cache.validate(c.Order('1', [c.Item('payment', 'p', True, 1)])), 'Invalid amount: True')
+        self.assertEqual(cache.validate(c.Order('1', [c.Item('payment', 'p', 1, 1)])),
+                         'Order ID: 1 - Payment imbalance: $1.00')
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.hits, 0)
+
+    def test_equal_copies_of_the_items_hit_the_cache(self):
+        cache = secure_cache.ValidationCache()
+        cache.check(c.Order('1', [c.Item('payment', 'p', 1, 1)]))
+        cache.check(c.Order('1', [c.Item('payment', 'reworded', 1, 1)]))
+        cache.check(c.Order('1', (c.Item('payment', 'p', 1, 1),)))
+        self.assertEqual((cache.hits, cache.misses), (2, 1))
+        self.assertEqual(cache.validate(c.Order('1', [c.Item('payment', 'p', 1.0, 1)])),
+                         'Order ID: 1 - Payment imbalance: $1.00')
+        self.assertEqual((cache.hits, cache.misses), (2, 2))
+
+    def test_lru_eviction(self):
+        cache = secure_cache.ValidationCache(maxsize=2)
+        a, b, d = (c.Order(i, []) for i in 'abd')
+        cache.check(a)
+        cache.check(b)
+        cache.check(a)
+        cache.check(d)
+        self.assertEqual(cache.evictions, 1)
+        cache.check(a)
+        cache.check(b)
+        self.assertEqual((cache.hits, cache.misses), (2, 4))
+
+    def test_ttl_expiry(self):
+        now = [0.0]
+        cache = secure_cache.ValidationCache(ttl=10, clock=lambda: now[0])
+        order = c.Order('1', [])
+        cache.check(order)
+        now[0] = 5
+        cache.check(order)
+        now[0] = 20
+        cache.check(order)
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+    def test_unhashable_id_bypasses_cache(self):
+        cache = secure_cache.ValidationCache()
+        self.assertEqual(cache.validate(c.Order(['x'], [])), "Order ID: ['x'] - Full payment received!")
+        self.assertEqual(len(cache), 0)
+
+
+class TestValidationStats(unittest.TestCase):
+
+    def setUp(self):
+        self.addCleanup(c.disable_stats)
+
+    def test_counts_orders_items_and_reasons(self):
+        stats = c.enable_stats(sample_every=2)
+        tv = c.Item('product', 'tv', 1000, 1)
+        orders = [c.Order('1', [tv, c.Item('payment', 'p', 1000, 1)]),
+                  c.Order('2', [tv]),
+                  c.Order('3', [c.Item('service', 'x', 1, 1)]),
+                  c.Order('4', iter([tv, tv]))]
+        results = [c.validorder(order) for order in orders]
+        self.assertEqual(results[3], 'Order ID: 4 - Payment imbalance: $-2000.00')
+        c.validorders(orders[:3])
+
+        snapshot = stats.snapshot()
+        self.assertEqual(snapshot['orders'], 7)
+        self.assertEqual(snapshot['items'], 10)
+        self.assertEqual(snapshot['statuses'], {'PAID': 2, 'IMBALANCE': 3, 'INVALID_TYPE': 2})
+        self.assertEqual(snapshot['rejections'], {'IMBALANCE': 3, 'INVALID_TYPE': 2})
+        self.assertEqual(snapshot['timings']['validate']['samples'], 2)
+        self.assertEqual(snapshot['timings']['format']['samples'], 2)
+        self.assertEqual(snapshot['timings']['batch']['samples'], 3)
+
+    def test_disabled_by_default(self):
+        stats = c.enable_stats()
+        c.disable_stats()
+        c.validorder(c.Order('1', []))
+        c.validorders([c.Order('1', [])])
+        self.assertEqual(stats.snapshot()['orders'], 0)
+
+    def test_batch_fallbacks_are_not_double_counted(self):
+        stats = c.enable_stats()
+        c.check_orders([c.Order('1', [c.Item('product', 'pen', 0.005, 2)])])
+        self.assertEqual(stats.snapshot()['orders'], 1)
+
+    def test_carts_and_columnar_batches_are_not_counted(self):
+        stats = c.enable_stats()
+        cart = secure_cart.Cart('1')
+        cart.add(c.Item('product', 'tv', 1000, 1))
+        cart.add(c.Item('payment', 'p', 1000, 1))
+        cart.add(c.Item('product', 'pen', 0.005, 2))
+        self.assertEqual(cart.validate(), 'Order ID: 1 - Payment imbalance: $-0.01')
+        batch = secure_columnar.OrderBatch.from_orders([c.Order('2', [c.Item('service', 'x', 1, 1)])])
+        self.assertEqual(batch.validate(), ['Invalid item type: service'])
+
+        c.validorder(c.Order('3', list(cart)))
+        snapshot = stats.snapshot()
+        self.assertEqual(snapshot['orders'], 1)
+        self.assertEqual(snapshot['rejections'], {'IMBALANCE': 1})
+
+
+class TestStreamingValidation(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+
+    def write(self, name, content):
+        path = os.path.join(self.tmpdir.name, name)
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            f.write(content)
+        return path
+
+    def test_jsonl_stream(self):
+        records = [
+            {'id': '1', 'items': [{'type': 'product', 'description': 'tv', 'amount': 3.3, 'quantity': 1},
+                                  {'type': 'payment', 'description': 'p1', 'amount': 1.1, 'quantity': 1},
+                                  {'type': 'payment', 'description': 'p2', 'amount': 2.2, 'quantity': 1}]},
+            {'id': '2', 'items': [{'type': 'service', 'description': 'x', 'amount': 1, 'quantity': 1}]},
+        ]
+        path = self.write('orders.jsonl', '\n'.join(json.dumps(r) for r in records) + '\n\n')
+        self.assertEqual(list(secure_stream.validate_stream(secure_stream.read_orders(path), batch_size=1)), [
+            'Order ID: 1 - Full payment received!',
+            'Invalid item type: service',
+        ])
+
+    def test_csv_stream_groups_consecutive_rows(self):
+        path = self.write('orders.csv', (
+            'order_id,type,description,amount,quantity\n'
+            '1,product,tv,1000.00,1\n'
+            '1,payment,invoice,1000.00,1\n'
+            '2,product,tv,1000,1.5\n'
+            '3,payment,invoice,abc,1\n'
+            '4,product,tv\n'
+            '5,product,tv,1000\n'
+        ))
+        self.assertEqual(list(secure_stream.validate_stream(secure_stream.read_orders(path))), [
+            'Order ID: 1 - Full payment received!',
+            "Invalid quantity type: 1.5 (<class 'decimal.Decimal'>)",
+            "Invalid amount: 'abc'",
+            'Invalid amount: None',
+            "Invalid quantity type: None (<class 'NoneType'>)",
+        ])
+
+    def test_csv_numbers_are_parsed_strictly(self):
+        path = self.write('orders.csv', (
+            'order_id,type,description,amount,quantity\n'
+            '1,payment,p,-12.50,1\n'
+            '2,payment,p,1_000,1\n'
+            '3,payment,p, 5 ,1\n'
+            '4,payment,p,1e3,1\n'
+            '5,payment,p,.5,1\n'
+            '6,payment,p,NaN,1\n'
+            '7,product,tv,5,1_0\n'
+        ))
+        for mode in ('decimal', 'cents'):
+            self.assertEqual([c.validorder(order, mode) for order in secure_stream.read_orders(path)], [
+                'Order ID: 1 - Payment imbalance: $-12.50',
+                "Invalid amount: '1_000'",
+                "Invalid amount: ' 5 '",
+                "Invalid amount: '1e3'",
+                "Invalid amount: '.5'",
+                "Invalid amount: 'NaN'",
+                "Invalid quantity type: '1_0' (<class 'secure_stream.MalformedNumber'>)",
+            ])
+        self.assertEqual(list(secure_stream.validate_stream(secure_stream.read_orders(path)))[1],
+                         "Invalid amount: '1_000'")
+
+    def test_stream_is_lazy(self):
+        def orders():
+            for i in range(10):
+                yield c.Order(str(i), [])
+            raise AssertionError("stream read past the first batch")
+
+        results = secure_stream.validate_stream(orders(), batch_size=10)
+        self.assertEqual(next(results), 'Order ID: 0 - Full payment received!')
+
+    def test_rejects_unknown_format(self):
+        with self.assertRaises(ValueError):
+            secure_stream.read_orders(self.write('orders.xml', ''))
+
+
+class TestParallelValidation(unittest.TestCase):
+
+    def test_matches_batch_path_in_order(self):
+        orders = make_orders(3000, seed=1)
+        results = list(secure_parallel.validorders_parallel(orders, workers=2, chunk_size=250))
+        self.assertEqual(results, c.validorders(orders))
+
+    def test_single_worker_runs_inline(self):
+        orders = make_orders(100, seed=2)
+        self.assertEqual(list(secure_parallel.validorders_parallel(orders, workers=1, chunk_size=7)),
+                         c.validorders(orders))
+
+    def test_pack_round_trip(self):
+        orders = make_orders(50, seed=3)
+        self.assertEqual(secure_parallel._validate_packed(secure_parallel._pack(orders)),
+                         c.validorders(orders))
+
+
+class TestColumnarValidation(unittest.TestCase):
+
+    def test_matches_single_order_path(self):
+        orders = make_orders(5000, seed=4)
+        batch = secure_columnar.OrderBatch.from_orders(orders)
+        self.assertEqual(len(batch), len(orders))
+        self.assertEqual(batch.validate(), [c.validorder(order) for order in orders])
+        self.assertEqual([result.message for result in batch.check()], batch.validate())
+
+    def test_items_are_stored_in_columns(self):
+        orders = [c.Order('1', [c.Item('product', 'tv', 19.99, 3), c.Item('payment', 'p', 59.97, 1)]),
+                  c.Order('2', [c.Item('service', 'x', 1, 1)]),
+                  c.Order('3', [c.Item('product', 'tv', 5, 101)])]
+        batch = secure_columnar.OrderBatch.from_orders(orders)
+        self.assertEqual(list(batch.types), [secure_columnar.PRODUCT, secure_columnar.PAYMENT,
+                                             secure_columnar.PRODUCT])
+        self.assertEqual(list(batch.cents), [1999, 5997, 500])
+        self.assertEqual(list(batch.quantities), [3, 1, 101])
+        self.assertEqual(list(batch.offsets), [0, 2, 2, 3])
+        self.assertEqual({i: r.message for i, r in batch.verdicts.items()}, {1: 'Invalid item type: service'})
+        self.assertEqual(batch.validate(), ['Order ID: 1 - Full payment received!',
+                                            'Invalid item type: service',
+                                            'Quantity out of range: 101'])
+
+
+if __name__ == '__main__':
+    unittest.main()
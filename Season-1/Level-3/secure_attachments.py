@@ -0,0 +1,200 @@
+# secure_attachments.py
+
+import os
+import threading
+import weakref
+from collections import OrderedDict
+
+from secure_mmap import mappings
+
+CACHE_BYTES = 256 * 1024 * 1024
+
+
+class Blob(bytearray):
+    """The content of an attachment file.
+
+    A bytearray subclass so that it can be filled with readinto() and weakly
+    referenced, which bytes cannot. Blobs are shared and only ever handed
+    out as read-only memoryviews, which also keep them alive while in use.
+    """
+
+    __slots__ = ('__weakref__',)
+
+
+def file_key(st):
+    """Identifies one version of a file: device, inode, size and mtime."""
+    return (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+def open_checked(source, index, relative_path):
+    """Opens relative_path from source (a SafeRoot or ContentStore).
+
+    Returns (fd, os.stat_result) or None. When an index (a SafeRootIndex)
+    is given, paths it does not know are rejected before touching the
+    filesystem.
+    """
+    if index is not None and relative_path not in index:
+        return None
+    return source.open_stat(relative_path)
+
+
+class AttachmentCache:
+    """Attachment contents shared between taxpayers, within a byte budget.
+
+    Blobs are keyed by file_key(), so every taxpayer pointing at the same
+    unchanged file (or, through a ContentStore, the same content) shares one
+    copy. Up to `max_bytes` of recently used blobs are held strongly and
+    evicted least recently used first. Beyond that, blobs are only weakly
+    referenced: one that was evicted but is still in use somewhere is found
+    again instead of being read a second time, and one nobody uses is freed.
+    """
+
+    def __init__(self, max_bytes=CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.nbytes = 0
+        self._strong = OrderedDict()                # key -> Blob, least recently used first
+        self._weak = weakref.WeakValueDictionary()  # key -> Blob, for every blob still alive
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._weak)
+
+    def get(self, key):
+        """Returns the cached Blob for key, or None."""
+        with self._lock:
+            blob = self._strong.get(key)
+            if blob is not None:
+                self._strong.move_to_end(key)
+                self.hits += 1
+                return blob
+            blob = self._weak.get(key)
+            if blob is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._hold(key, blob)
+            return blob
+
+    def put(self, key, blob):
+        """Caches blob under key, returning the blob to use: an equal one may already be cached."""
+        with self._lock:
+            cached = self._weak.get(key)
+            if cached is not None:
+                blob = cached
+            self._weak[key] = blob
+            if key not in self._strong:
+                self._hold(key, blob)
+            return blob
+
+    def _hold(self, key, blob):
+        if len(blob) > self.max_bytes:
+            return
+        self._strong[key] = blob
+        self.nbytes += len(blob)
+        while self.nbytes > self.max_bytes:
+            self.nbytes -= len(self._strong.popitem(last=False)[1])
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._strong.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        """Returns the cache counters as a dict."""
+        lookups = self.hits + self.misses
+        return {
+            'blobs': len(self._weak),
+            'held': len(self._strong),
+            'held_bytes': self.nbytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+
+attachments = AttachmentCache()
+
+
+class AttachmentHandle:
+    """A validated attachment that is only read when first used.
+
+    The handle remembers where the file is and which version of it was
+    validated, but not its content: load() fetches the content from the
+    shared AttachmentCache (mode 'copy'), reading the file on a miss, or
+    maps it through secure_mmap (mode 'mmap'). The file is reopened with
+    the same checks as the original lookup, so it must still be allowed.
+    """
+
+    __slots__ = ('path', 'mode', 'key', '_source', '_index', '_ref', '_mapped')
+
+    def __init__(self, source, index, path, mode, key):
+        self.path = path
+        self.mode = mode
+        self.key = key
+        self._source = source
+        self._index = index
+        self._ref = None      # weakref to the Blob last loaded (mode 'copy')
+        self._mapped = None   # MappedAttachment (mode 'mmap')
+
+    def __del__(self):
+        self.release()
+
+    def load(self):
+        """Returns the content as a read-only memoryview, or None if it can no longer be read."""
+        if self.mode == "mmap":
+            return self._map()
+
+        blob = self._ref() if self._ref is not None else None
+        if blob is None:
+            blob = attachments.get(self.key)
+            if blob is None:
+                blob = self._read()
+                if blob is None:
+                    return None
+            self._ref = weakref.ref(blob)
+        return memoryview(blob).toreadonly()
+
+    def _read(self):
+        opened = open_checked(self._source, self._index, self.path)
+        if opened is None:
+            return None
+        fd, st = opened
+        with os.fdopen(fd, 'rb', buffering=0) as f:
+            self.key = file_key(st)  # the file may have changed since it was validated
+            blob = Blob(st.st_size)
+            filled = 0
+            with memoryview(blob) as view:
+                while filled < st.st_size:
+                    read = f.readinto(view[filled:])
+                    if not read:
+                        break
+                    filled += read
+            del blob[filled:]
+        return attachments.put(self.key, blob)
+
+    def _map(self):
+        if self._mapped is None:
+            opened = open_checked(self._source, self._index, self.path)
+            if opened is None:
+                return None
+            fd = opened[0]
+            try:
+                self._mapped = mappings.acquire(fd)
+            finally:
+                os.close(fd)
+        return self._mapped.export()
+
+    def release(self):
+        """Drops this handle's reference to its mapping, if any.
+
+        Views returned by load() stay valid: each holds its own reference,
+        and the file is unmapped once the last of them is collected.
+        """
+        mapped, self._mapped = self._mapped, None
+        if mapped is not None:
+            mapped.release()
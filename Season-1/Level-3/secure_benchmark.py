@@ -0,0 +1,310 @@
+# secure_benchmark.py
+
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+import secure_bulk
+import secure_cas
+import secure_code as c
+import secure_mmap
+import secure_paths
+import secure_thumbnails
+
+PATHS = ['prof_picture.png', 'tax_form.pdf', './tax_form.pdf', 'missing.png', '../code.py']
+
+
+def timed(label, func, count, unit="lookups"):
+    """Runs func once and prints its throughput."""
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<34} {elapsed:8.3f}s  {count / elapsed:12,.0f} {unit}/s")
+    return elapsed, result
+
+
+def legacy_open(relative_path, safe_root=c.TaxPayer.SAFE_ROOT):
+    """The string-based check TaxPayer used before secure_paths: normalize, stat, then open."""
+    if not relative_path:
+        return None
+    normalized = os.path.normpath(relative_path)
+    if os.path.isabs(normalized) or normalized.startswith('..'):
+        return None
+    full_path = os.path.abspath(os.path.join(safe_root, normalized))
+    if not full_path.startswith(safe_root) or not os.path.isfile(full_path):
+        return None
+    return os.open(full_path, os.O_RDONLY)
+
+
+def bench_resolution(lookups):
+    print("\n[string normalization + isfile vs fd-anchored SafeRoot]")
+    paths = [PATHS[i % len(PATHS)] for i in range(lookups)]
+    root = secure_paths.safe_root(c.TaxPayer.SAFE_ROOT)
+
+    def run(opener):
+        opened = 0
+        for path in paths:
+            fd = opener(path)
+            if fd is not None:
+                os.close(fd)
+                opened += 1
+        return opened
+
+    legacy, expected = timed("normpath/abspath/isfile/open", lambda: run(legacy_open), lookups)
+    anchored, actual = timed("SafeRoot.open (cached split)", lambda: run(root.open), lookups)
+    assert actual == expected, "SafeRoot opened a different set of files"
+    print(f"speedup: {legacy / anchored:.1f}x")
+
+
+def bench_index(lookups):
+    print("\n[probing flood: SafeRoot.open vs SafeRootIndex lookup]")
+    probes = [f"probe/{i % 1000}/../../guess{i % 5000}.pdf" for i in range(lookups)]
+    root = secure_paths.safe_root(c.TaxPayer.SAFE_ROOT)
+    index = secure_paths.SafeRootIndex(c.TaxPayer.SAFE_ROOT)
+
+    def opened():
+        return sum(root.open(path) is not None for path in probes)
+
+    def indexed():
+        return sum(path in index for path in probes)
+
+    slow, expected = timed("SafeRoot.open (syscalls)", opened, lookups)
+    fast, actual = timed("SafeRootIndex (in memory)", indexed, lookups)
+    assert actual == expected == 0, "a probe matched a file"
+    print(f"speedup: {slow / fast:.1f}x ({len(index)} files indexed)")
+
+
+def make_assets(size_mb):
+    """Creates a scratch SAFE_ROOT holding one `size_mb` MB tax form."""
+    root = tempfile.mkdtemp()
+    with open(os.path.join(root, 'tax_form.pdf'), 'wb') as f:
+        f.write(b'%PDF-1.4\n' + os.urandom(size_mb * 1024 * 1024))
+    return root
+
+
+def bench_mmap(payers, size_mb):
+    print(f"\n[shared copy cache vs shared mmap, {payers} taxpayers x {size_mb} MB form]")
+    root = make_assets(size_mb)
+
+    class TaxPayer(c.TaxPayer):
+        SAFE_ROOT = root
+
+    def load(mode):
+        loaded = [TaxPayer(str(i), 'pw', attachment_mode=mode) for i in range(payers)]
+        for payer in loaded:
+            payer.get_tax_form_attachment('tax_form.pdf')
+            payer.tax_form_attachment
+        return loaded
+
+    try:
+        for mode in ("copy", "mmap"):
+            tracemalloc.start()
+            _, loaded = timed(f"attachment_mode='{mode}'", lambda: load(mode), payers, "taxpayers")
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f"{'':<34} heap peak {peak / 2**20:8.1f} MB, {len(secure_mmap.mappings)} shared mapping(s)")
+            for payer in loaded:
+                payer.close()
+    finally:
+        secure_paths.safe_root(root).close()
+        shutil.rmtree(root)
+
+
+def bench_streaming(size_mb):
+    print(f"\n[whole-file read vs chunked streaming, {size_mb} MB form]")
+    root = make_assets(size_mb)
+
+    class TaxPayer(c.TaxPayer):
+        SAFE_ROOT = root
+
+    payer = TaxPayer('foo', 'bar')
+
+    def whole():
+        start = time.perf_counter()
+        payer.read_attachment('tax_form.pdf')
+        return time.perf_counter() - start
+
+    def streamed():
+        start = time.perf_counter()
+        chunks = c.iter_chunks(payer.open_attachment('tax_form.pdf'))
+        next(chunks)
+        first_byte = time.perf_counter() - start
+        for _ in chunks:
+            pass
+        return first_byte
+
+    try:
+        for label, func in (("read_attachment (whole file)", whole), ("iter_chunks", streamed)):
+            tracemalloc.start()
+            _, first_byte = timed(label, func, size_mb, "MB")
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f"{'':<34} first byte {first_byte * 1000:7.2f} ms, heap peak {peak / 2**20:8.2f} MB")
+    finally:
+        secure_paths.safe_root(root).close()
+        shutil.rmtree(root)
+
+
+def bench_conditional(requests):
+    import secure_server
+
+    print(f"\n[GET /attachment: full download vs 304 revalidation, {requests:,} requests]")
+    client = secure_server.app.test_client()
+    url = '/attachment?input=prof_picture.png'
+    etag = client.get(url).headers['ETag']
+
+    def fetch(headers, status):
+        sent = 0
+        for _ in range(requests):
+            response = client.get(url, headers=headers)
+            assert response.status_code == status, response.status_code
+            sent += len(response.get_data())
+        return sent
+
+    for label, headers, status in (("unconditional GET", {}, 200),
+                                   ("If-None-Match -> 304", {'If-None-Match': etag}, 304)):
+        _, sent = timed(label, lambda: fetch(headers, status), requests, "requests")
+        print(f"{'':<34} body bytes sent {sent / requests:10,.0f} per request")
+
+
+def bench_thumbnails(requests):
+    backend = "Pillow" if secure_thumbnails.Image is not None else "pure Python"
+    print(f"\n[avatar thumbnails ({backend}): first request vs cached, {requests:,} requests]")
+    root = tempfile.mkdtemp()
+    try:
+        cache = secure_thumbnails.ThumbnailCache(root)
+        payer = c.TaxPayer('foo', 'bar')
+        original = len(payer.read_attachment('prof_picture.png'))
+        for size in (32, 64):
+            timed(f"generate {size}px", lambda: cache.get(payer, 'prof_picture.png', size), 1, "thumbnails")
+        _, png = timed("cached 64px", lambda: [cache.get(payer, 'prof_picture.png', 64) for _ in range(requests)][-1],
+                       requests, "requests")
+        print(f"{'':<34} {len(png):,} bytes per avatar instead of {original:,} ({cache.stats()['hit_rate']:.1%} hit rate)")
+    finally:
+        shutil.rmtree(root)
+
+
+def bench_lazy(taxpayers):
+    print(f"\n[session cache of {taxpayers:,} taxpayers: eager bytearrays vs lazy shared handles]")
+
+    def eager():
+        session = []
+        for i in range(taxpayers):
+            payer = c.TaxPayer(str(i), 'pw')
+            session.append((payer, bytearray(payer.read_attachment('prof_picture.png')),
+                            bytearray(payer.read_attachment('tax_form.pdf'))))
+        return session
+
+    def lazy():
+        session = []
+        for i in range(taxpayers):
+            payer = c.TaxPayer(str(i), 'pw')
+            payer.get_prof_picture('prof_picture.png')
+            payer.get_tax_form_attachment('tax_form.pdf')
+            payer.prof_picture, payer.tax_form_attachment
+            session.append(payer)
+        return session
+
+    for label, func in (("eager bytearray per taxpayer", eager), ("slotted TaxPayer, lazy handles", lazy)):
+        tracemalloc.start()
+        _, session = timed(label, func, taxpayers, "taxpayers")
+        held = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        print(f"{'':<34} held {held / 2**20:8.1f} MB ({held / taxpayers:,.0f} bytes/taxpayer)")
+        del session
+
+
+def make_corpus(root, files, templates=50, seed=0):
+    """Writes `files` attachments under root, drawn from `templates` distinct contents.
+
+    Like real uploads, a few popular forms account for most of the files.
+    """
+    rng = random.Random(seed)
+    contents = [b'%PDF-1.4\n' + rng.randbytes(rng.randint(16, 256) * 1024) for _ in range(templates)]
+    weights = [1 / (rank + 1) for rank in range(templates)]
+    paths = []
+    for i in range(files):
+        path = f"user{i % 500:03d}/form{i}.pdf"
+        os.makedirs(os.path.join(root, os.path.dirname(path)), exist_ok=True)
+        with open(os.path.join(root, path), 'wb') as f:
+            f.write(rng.choices(contents, weights)[0])
+        paths.append(path)
+    return paths
+
+
+def bench_cas(files):
+    print(f"\n[content-addressable store, synthetic corpus of {files:,} uploads]")
+    root = tempfile.mkdtemp()
+    try:
+        paths = make_corpus(os.path.join(root, 'uploads'), files)
+        store = secure_cas.ContentStore(os.path.join(root, 'cas'))
+        timed("ingest", lambda: store.ingest(os.path.join(root, 'uploads')), files, "files")
+
+        def fetch():
+            for path in paths:
+                c.TaxPayer('foo', 'bar', store=store).read_attachment(path)
+
+        timed("TaxPayer fetch from store", fetch, files, "files")
+        secure_cas.print_report(store.report())
+        store.close()
+    finally:
+        shutil.rmtree(root)
+
+
+def bench_bulk(files, workers):
+    print(f"\n[sequential loop vs fetch_attachments, {files:,} files, {workers} threads]")
+    root = tempfile.mkdtemp()
+    try:
+        paths = make_corpus(root, files)
+
+        class TaxPayer(c.TaxPayer):
+            SAFE_ROOT = root
+
+        requests = [(TaxPayer(str(i), 'pw'), path) for i, path in enumerate(paths)]
+
+        def sequential():
+            for payer, path in requests:
+                payer.get_tax_form_attachment(path)
+                payer.tax_form_attachment
+
+        def bulk(ordered):
+            for result in secure_bulk.fetch_attachments(requests, workers, ordered):
+                assert result.error is None, result.error
+
+        loop, _ = timed("sequential getter loop", sequential, files, "files")
+        ordered, _ = timed("fetch_attachments (ordered)", lambda: bulk(True), files, "files")
+        completed, _ = timed("fetch_attachments (as completed)", lambda: bulk(False), files, "files")
+        print(f"speedup: {loop / ordered:.1f}x ordered, {loop / completed:.1f}x as completed ({os.cpu_count()} CPUs)")
+        secure_paths.safe_root(root).close()
+    finally:
+        shutil.rmtree(root)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks for the Level-3 attachment access paths")
+    parser.add_argument("--lookups", type=int, default=200_000)
+    parser.add_argument("--payers", type=int, default=200)
+    parser.add_argument("--size-mb", type=int, default=4)
+    parser.add_argument("--taxpayers", type=int, default=20_000)
+    parser.add_argument("--files", type=int, default=3000)
+    parser.add_argument("--workers", type=int, default=secure_bulk.MAX_WORKERS)
+    args = parser.parse_args(argv)
+
+    print(f"[BENCH] {args.lookups:,} lookups (dir_fd support: {secure_paths.HAVE_DIR_FD})")
+    bench_resolution(args.lookups)
+    bench_index(args.lookups)
+    bench_mmap(args.payers, args.size_mb)
+    bench_streaming(args.size_mb * 16)
+    bench_conditional(args.lookups // 20)
+    bench_thumbnails(args.lookups // 20)
+    bench_lazy(args.taxpayers)
+    bench_cas(args.files)
+    bench_bulk(args.files, args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+# secure_bulk.py
+
+from collections import deque, namedtuple
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, as_completed, wait
+
+from secure_paths import split_safe_path
+
+MAX_WORKERS = 8
+
+# One per request: `index` is the request's position in the input, and
+# exactly one of `data` (bytes) and `error` (an exception) is set.
+FetchResult = namedtuple('FetchResult', 'index, taxpayer, path, data, error')
+
+
+def _read(index, taxpayer, path):
+    try:
+        data = taxpayer.read_attachment(path)
+        if data is None:
+            raise FileNotFoundError(f"No readable attachment at {path!r}")
+    except Exception as e:
+        return FetchResult(index, taxpayer, path, None, e)
+    return FetchResult(index, taxpayer, path, data, None)
+
+
+def _done(result):
+    future = Future()
+    future.set_result(result)
+    return future
+
+
+def fetch_attachments(requests, max_workers=MAX_WORKERS, ordered=True):
+    """Reads the attachments for many (taxpayer, path) requests concurrently.
+
+    Every path is validated before any file is read; invalid ones get a
+    ValueError without reaching the pool. The rest are read on a pool of
+    `max_workers` threads with TaxPayer.read_attachment(), keeping at most
+    2 * max_workers reads in flight. Yields one FetchResult per request, in
+    request order, or as reads complete when ordered is False. A failing
+    request never stops the others.
+    """
+    requests = list(requests)
+    checked = []
+    for index, (taxpayer, path) in enumerate(requests):
+        if split_safe_path(path) is None:
+            checked.append(FetchResult(index, taxpayer, path, None, ValueError(f"Invalid attachment path: {path!r}")))
+        else:
+            checked.append(FetchResult(index, taxpayer, path, None, None))
+
+    window = 2 * max_workers
+    pool = ThreadPoolExecutor(max_workers)
+    try:
+        if ordered:
+            pending = deque()
+            for request in checked:
+                if request.error is not None:
+                    pending.append(_done(request))
+                else:
+                    pending.append(pool.submit(_read, request.index, request.taxpayer, request.path))
+                while len(pending) > window:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        else:
+            valid = []
+            for request in checked:
+                if request.error is not None:
+                    yield request
+                else:
+                    valid.append(request)
+            pending = set()
+            for request in valid:
+                pending.add(pool.submit(_read, request.index, request.taxpayer, request.path))
+                if len(pending) >= window:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield future.result()
+            for future in as_completed(pending):
+                yield future.result()
+    finally:
+        pool.shutdown(cancel_futures=True)
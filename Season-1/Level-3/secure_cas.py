@@ -0,0 +1,229 @@
+# secure_cas.py
+
+import argparse
+import hashlib
+import json
+import os
+import stat
+import tempfile
+import threading
+from collections import OrderedDict
+
+from secure_paths import SafeRoot, split_safe_path
+
+STORE_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cas')
+CACHE_BYTES = 64 * 1024 * 1024
+_READ_SIZE = 1024 * 1024
+
+
+def _copy_hashed(source_path, dst):
+    """Copies the file at source_path into the binary file dst; returns the digest and size of what was copied."""
+    digest = hashlib.sha256()
+    size = 0
+    with open(source_path, 'rb') as src:
+        for chunk in iter(lambda: src.read(_READ_SIZE), b''):
+            digest.update(chunk)
+            dst.write(chunk)
+            size += len(chunk)
+    return digest.hexdigest(), size
+
+
+def _blob_path(digest):
+    return f"{digest[:2]}/{digest}"
+
+
+class ContentStore:
+    """Content-addressable store for TaxPayer attachments.
+
+    Every distinct file content is kept once, as objects/<ab>/<sha256>. An
+    index maps attachment paths (normalized like SafeRoot paths) to their
+    digest and size, so byte-identical uploads under many paths share one
+    blob on disk and one entry in the in-memory read cache. Only indexed
+    paths can be read: the index is the allowlist.
+
+    Blobs are opened through a SafeRoot on the objects directory, so the
+    same no-symlink rules apply as for SAFE_ROOT itself.
+    """
+
+    def __init__(self, path=STORE_ROOT, cache_bytes=CACHE_BYTES):
+        self.path = os.path.abspath(path)
+        self.cache_bytes = cache_bytes
+        self.hits = 0
+        self.misses = 0
+        self._objects = os.path.join(self.path, 'objects')
+        self._index_path = os.path.join(self.path, 'index.json')
+        self._index = {}               # path -> (digest, size)
+        self._cache = OrderedDict()    # digest -> bytes, least recently used first
+        self._cached_bytes = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(self._objects, exist_ok=True)
+        self._root = SafeRoot(self._objects)
+        if os.path.exists(self._index_path):
+            with open(self._index_path) as f:
+                self._index = {path: tuple(entry) for path, entry in json.load(f)['paths'].items()}
+
+    def __len__(self):
+        return len(self._index)
+
+    def close(self):
+        self._root.close()
+
+    @staticmethod
+    def _key(relative_path):
+        parts = split_safe_path(relative_path)
+        return None if parts is None else '/'.join(parts)
+
+    def digest(self, relative_path):
+        """Returns the SHA-256 hex digest stored for relative_path, or None."""
+        entry = self._index.get(self._key(relative_path))
+        return None if entry is None else entry[0]
+
+    def add_file(self, relative_path, source_path):
+        """Adds the file at source_path to the store under relative_path.
+
+        The file is hashed while it is copied into a temporary file, which
+        then becomes the blob, so a blob always holds the content its name
+        says even if the source changes meanwhile. The copy is dropped if
+        that content is stored already. Returns the digest. Call save() to
+        persist the index.
+        """
+        key = self._key(relative_path)
+        if key is None:
+            raise ValueError(f"Invalid attachment path: {relative_path!r}")
+
+        fd, tmp = tempfile.mkstemp(dir=self._objects)
+        try:
+            with os.fdopen(fd, 'wb') as dst:
+                digest, size = _copy_hashed(source_path, dst)
+            blob = os.path.join(self._objects, _blob_path(digest))
+            if not os.path.exists(blob):
+                os.makedirs(os.path.dirname(blob), exist_ok=True)
+                os.replace(tmp, blob)
+        finally:
+            if os.path.exists(tmp):  # a duplicate, or the copy failed
+                os.remove(tmp)
+        with self._lock:
+            self._index[key] = (digest, size)
+        return digest
+
+    def ingest(self, source_dir):
+        """Adds every regular file under source_dir, keyed by its relative path.
+
+        Symlinks are skipped rather than followed. Saves the index and
+        returns the number of files ingested.
+        """
+        count = 0
+        for dirpath, dirnames, filenames in os.walk(source_dir):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                if not stat.S_ISREG(os.lstat(path).st_mode):
+                    continue
+                self.add_file(os.path.relpath(path, source_dir), path)
+                count += 1
+        self.save()
+        return count
+
+    def save(self):
+        """Writes the path index atomically."""
+        with self._lock:
+            paths = {path: list(entry) for path, entry in self._index.items()}
+        fd, tmp = tempfile.mkstemp(dir=self.path)
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'version': 1, 'paths': paths}, f)
+        os.replace(tmp, self._index_path)
+
+    def resolve(self, relative_path):
+        """Returns the absolute path of the blob behind relative_path, or None."""
+        digest = self.digest(relative_path)
+        return None if digest is None else self._root.resolve(_blob_path(digest))
+
+    def open(self, relative_path):
+        """Opens the blob behind relative_path, like SafeRoot.open()."""
+        digest = self.digest(relative_path)
+        return None if digest is None else self._root.open(_blob_path(digest))
+
+    def open_stat(self, relative_path):
+        """Opens the blob behind relative_path, like SafeRoot.open_stat()."""
+        digest = self.digest(relative_path)
+        return None if digest is None else self._root.open_stat(_blob_path(digest))
+
+    def read(self, relative_path):
+        """Returns the content behind relative_path as bytes, or None.
+
+        Contents are cached by digest, up to `cache_bytes`, so every path
+        with the same content is served from one in-memory copy.
+        """
+        digest = self.digest(relative_path)
+        if digest is None:
+            return None
+        with self._lock:
+            data = self._cache.get(digest)
+            if data is not None:
+                self._cache.move_to_end(digest)
+                self.hits += 1
+                return data
+            self.misses += 1
+
+        fd = self._root.open(_blob_path(digest))
+        if fd is None:
+            return None
+        with os.fdopen(fd, 'rb') as f:
+            data = f.read()
+        if len(data) > self.cache_bytes:
+            return data
+        with self._lock:
+            if digest not in self._cache:
+                self._cache[digest] = data
+                self._cached_bytes += len(data)
+                while self._cached_bytes > self.cache_bytes:
+                    self._cached_bytes -= len(self._cache.popitem(last=False)[1])
+        return data
+
+    def report(self):
+        """Returns storage and read-cache savings as a dict."""
+        with self._lock:
+            entries = list(self._index.values())
+        blobs = dict(entries)
+        logical = sum(size for _, size in entries)
+        stored = sum(blobs.values())
+        lookups = self.hits + self.misses
+        return {
+            'paths': len(entries),
+            'blobs': len(blobs),
+            'logical_bytes': logical,
+            'stored_bytes': stored,
+            'saved_bytes': logical - stored,
+            'dedup_ratio': logical / stored if stored else 1.0,
+            'cache_hits': self.hits,
+            'cache_misses': self.misses,
+            'cache_hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+
+def print_report(report):
+    print(f"[CAS] {report['paths']:,} paths -> {report['blobs']:,} blobs")
+    print(f"[CAS] logical {report['logical_bytes'] / 2**20:,.1f} MB, stored {report['stored_bytes'] / 2**20:,.1f} MB, "
+          f"saved {report['saved_bytes'] / 2**20:,.1f} MB ({report['dedup_ratio']:.1f}x)")
+    if report['cache_hits'] or report['cache_misses']:
+        print(f"[CAS] read cache: {report['cache_hits']:,} hits, {report['cache_misses']:,} misses "
+              f"({report['cache_hit_rate']:.1%} hit rate)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Content-addressable attachment store")
+    parser.add_argument("--store", default=STORE_ROOT, help="store directory (default: %(default)s)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    ingest = commands.add_parser("ingest", help="bulk-add every file under a directory")
+    ingest.add_argument("source")
+    commands.add_parser("report", help="print storage savings")
+    args = parser.parse_args(argv)
+
+    store = ContentStore(args.store)
+    if args.command == "ingest":
+        print(f"[CAS] ingested {store.ingest(args.source):,} files from {args.source}")
+    print_report(store.report())
+
+
+if __name__ == "__main__":
+    main()
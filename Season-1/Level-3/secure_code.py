@@ -5,6 +5,9 @@
 import os
 from flask import Flask, request
 
+from secure_attachments import AttachmentHandle, file_key, open_checked
+from secure_paths import safe_root
+
 ### Unrelated to the exercise -- Starts here -- Please ignore
 app = Flask(__name__)
 @app.route("/")
@@ -13,54 +16,167 @@ def source():
     TaxPayer('foo', 'bar').get_prof_picture(request.args["input"])
 ### Unrelated to the exercise -- Ends here -- Please ignore
 
+CHUNK_SIZE = 64 * 1024
+
 class TaxPayer:
 
     SAFE_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'assets')
 
-    def __init__(self, username, password):
+    # Attachments are not kept on the instance: each is a lazy
+    # secure_attachments.AttachmentHandle, read on first access and shared
+    # with every other taxpayer using the same file, so a taxpayer costs a
+    # few hundred bytes however large its attachments are.
+    __slots__ = ('username', 'password', 'attachment_mode', 'store', 'index',
+                 '_prof_picture', '_tax_form_attachment', '__weakref__')
+
+    # attachment_mode selects how attachments are loaded: 'copy' reads each
+    # file once into the shared AttachmentCache, 'mmap' maps it read-only so
+    # its pages are shared with every other taxpayer reading the same file.
+    # Either way the getters return a read-only memoryview, not bytes; call
+    # bytes() on it for a private copy. Call close() to let go of mapped
+    # attachments early; views already returned stay valid, and a file is
+    # unmapped once the last of them is collected.
+    # store, a secure_cas.ContentStore, serves attachments from deduplicated
+    # blobs instead of SAFE_ROOT; only paths in its index can be read.
+    # index, a secure_paths.SafeRootIndex of SAFE_ROOT, rejects paths that
+    # are not known files before touching the filesystem.
+    def __init__(self, username, password, attachment_mode: str = "copy", store=None, index=None):
+        assert attachment_mode in {"copy", "mmap"}, "attachment_mode must be 'copy' or 'mmap'"
         self.username = username
         self.password = password
+        self.attachment_mode = attachment_mode
+        self.store = store
+        self.index = index
+        self._prof_picture = None
+        self._tax_form_attachment = None
+
+    @property
+    def prof_picture(self):
+        return self._prof_picture.load() if self._prof_picture is not None else None
+
+    @prof_picture.setter
+    def prof_picture(self, value):
+        self._set_attachment('_prof_picture', value)
+
+    @property
+    def tax_form_attachment(self):
+        return self._tax_form_attachment.load() if self._tax_form_attachment is not None else None
+
+    @tax_form_attachment.setter
+    def tax_form_attachment(self, value):
+        self._set_attachment('_tax_form_attachment', value)
+
+    def _set_attachment(self, slot, handle):
+        """Replaces an attachment handle; only None or an AttachmentHandle may be assigned."""
+        assert handle is None or isinstance(handle, AttachmentHandle), "attachments are set through the getters"
+        previous = getattr(self, slot)
+        setattr(self, slot, handle)
+        if previous is not None:
+            previous.release()
+
+    def close(self):
+        """Drops both attachments, releasing any mappings; they read as None afterwards."""
         self.prof_picture = None
         self.tax_form_attachment = None
 
-    def _resolve_safe_path(self, relative_path):
-        """Resolves path within SAFE_ROOT and validates it doesn't escape."""
-        if not relative_path:
-            return None
+    def _safe_root(self):
+        return safe_root(self.SAFE_ROOT)
 
-        normalized = os.path.normpath(relative_path)
+    def _source(self):
+        """Where attachments come from: the content store if set, else SAFE_ROOT."""
+        return self.store if self.store is not None else self._safe_root()
 
-        # Reject absolute paths or traversal
-        if os.path.isabs(normalized) or normalized.startswith('..'):
-            return None
+    def _index(self):
+        return self.index if self.store is None else None
 
-        full_path = os.path.abspath(os.path.join(self.SAFE_ROOT, normalized))
+    def _open(self, relative_path):
+        """Opens an attachment from _source(), returning (fd, os.stat_result) or None."""
+        return open_checked(self._source(), self._index(), relative_path)
 
-        if not full_path.startswith(self.SAFE_ROOT):
+    def _resolve_safe_path(self, relative_path):
+        """Resolves path within SAFE_ROOT and validates it doesn't escape."""
+        return self._safe_root().resolve(relative_path)
+
+    def _attach(self, relative_path, slot):
+        """Validates an attachment and stores a lazy handle for it in `slot`.
+
+        The file is opened relative to SAFE_ROOT's directory fd (or the
+        store's objects directory) without following symlinks, see
+        secure_paths.SafeRoot, so there is no gap between checking the path
+        and opening the file. Its content is not read until the attachment
+        is first accessed. Returns the resolved path, or None if the file
+        may not be read.
+        """
+        source = self._source()
+        opened = open_checked(source, self._index(), relative_path)
+        if opened is None:
             return None
-
-        return full_path
+        fd, st = opened
+        os.close(fd)
+        self._set_attachment(slot, AttachmentHandle(source, self._index(), relative_path,
+                                                    self.attachment_mode, file_key(st)))
+        return source.resolve(relative_path)
+
+    def read_attachment(self, path=None):
+        """Returns an attachment's content as bytes, or None if it may not be read.
+
+        Applies the same checks as the getters but leaves the taxpayer's
+        attributes alone, so it is safe to call from several threads.
+        """
+        if self.store is not None:
+            return self.store.read(path)
+        opened = self._open(path)
+        if opened is None:
+            return None
+        with os.fdopen(opened[0], 'rb') as f:
+            return f.read()
+
+    def open_attachment(self, path=None):
+        """Opens an attachment for streaming with iter_chunks().
+
+        Applies the same checks as the getters, but reads nothing. Returns an
+        unbuffered binary file, which the caller must close, or None.
+        """
+        opened = self.open_attachment_stat(path)
+        return None if opened is None else opened[0]
+
+    def open_attachment_stat(self, path=None):
+        """Like open_attachment(), but returns (file, os.stat_result) or None."""
+        opened = self._open(path)
+        if opened is None:
+            return None
+        fd, st = opened
+        return os.fdopen(fd, 'rb', buffering=0), st
 
     # returns the path of an optional profile picture that users can set
     def get_prof_picture(self, path=None):
-        resolved = self._resolve_safe_path(path)
-        if not resolved or not os.path.isfile(resolved):
-            return None
-
-        with open(resolved, 'rb') as pic:
-            picture = bytearray(pic.read())
-            self.prof_picture = picture
-
-        return resolved
+        return self._attach(path, '_prof_picture')
 
     # returns the path of an attached tax form that every user should submit
     def get_tax_form_attachment(self, path=None):
-        resolved = self._resolve_safe_path(path)
-        if not resolved or not os.path.isfile(resolved):
+        resolved = self._attach(path, '_tax_form_attachment')
+        if resolved is None:
             raise Exception("Invalid or missing tax form file")
 
-        with open(resolved, 'rb') as form:
-            tax_data = bytearray(form.read())
-            self.tax_form_attachment = tax_data
-
         return resolved
+
+
+def iter_chunks(f, start=0, end=None, chunk_size=CHUNK_SIZE):
+    """Yields bytes [start, end) of an open file in chunks of chunk_size.
+
+    Only one chunk is held in memory at a time. The file is closed when the
+    generator finishes or is closed.
+    """
+    try:
+        f.seek(start)
+        remaining = None if end is None else end - start
+        while remaining is None or remaining > 0:
+            chunk = f.read(chunk_size if remaining is None else min(chunk_size, remaining))
+            if not chunk:
+                break
+            if remaining is not None:
+                remaining -= len(chunk)
+            yield chunk
+    finally:
+        f.close()
+
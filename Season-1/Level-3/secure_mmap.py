@@ -0,0 +1,111 @@
+# secure_mmap.py
+
+import mmap
+import os
+import threading
+import weakref
+
+
+class MappedAttachment:
+    """A read-only memoryview over a file mapping shared through a MappingCache.
+
+    `view` stays valid until release() is called. Release it once the data
+    is no longer needed, so the mapping can be unmapped when its last user
+    lets go; the handle also works as a context manager. Views for other
+    code come from export() and stay valid after release().
+    """
+
+    __slots__ = ('view', '_cache', '_key')
+
+    def __init__(self, view, cache=None, key=None):
+        self.view = view
+        self._cache = cache
+        self._key = key
+
+    def __len__(self):
+        return len(self.view)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+    def export(self):
+        """Returns a new read-only view of the mapping that holds its own reference.
+
+        The reference is dropped when the view is garbage collected, so the
+        mapping stays alive for as long as any exported view does, whatever
+        happens to this MappedAttachment.
+        """
+        view = self.view[:]
+        if self._cache is not None:
+            self._cache._retain(self._key)
+            weakref.finalize(view, self._cache._release, self._key)
+        return view
+
+    def release(self):
+        if self._cache is None:
+            return
+        cache, self._cache = self._cache, None
+        try:
+            self.view.release()
+        except BufferError:  # the caller still holds a view derived from ours
+            pass
+        cache._release(self._key)
+
+
+class MappingCache:
+    """Shares one read-only mmap per file between every reader of that file.
+
+    Mappings are keyed by the file's device, inode, size and modification
+    time, so readers of the same unchanged file share pages while a file
+    that was replaced gets a fresh mapping. Each acquire() and each
+    MappedAttachment.export() adds a reference; release() and the garbage
+    collection of an exported view drop one. The file is unmapped when the
+    last reference goes. Mapped files must not be truncated in place
+    while mapped, which holds for the read-only attachment assets.
+    """
+
+    def __init__(self):
+        self._mappings = {}  # (st_dev, st_ino, st_size, st_mtime_ns) -> [mmap, references]
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._mappings)
+
+    def acquire(self, fd):
+        """Maps the file open on fd, returning a MappedAttachment.
+
+        The fd may be closed as soon as this returns.
+        """
+        st = os.fstat(fd)
+        if st.st_size == 0:  # empty files cannot be mapped
+            return MappedAttachment(memoryview(b''))
+
+        key = (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+        with self._lock:
+            entry = self._mappings.get(key)
+            if entry is None:
+                entry = self._mappings[key] = [mmap.mmap(fd, 0, access=mmap.ACCESS_READ), 0]
+            entry[1] += 1
+            return MappedAttachment(memoryview(entry[0]), self, key)
+
+    def _retain(self, key):
+        with self._lock:
+            self._mappings[key][1] += 1
+
+    def _release(self, key):
+        with self._lock:
+            entry = self._mappings[key]
+            entry[1] -= 1
+            if entry[1]:
+                return
+            del self._mappings[key]
+        try:
+            entry[0].close()
+        except BufferError:  # still exported; unmapped once the last view is collected
+            pass
+
+
+mappings = MappingCache()
@@ -0,0 +1,266 @@
+# secure_paths.py
+
+import os
+import stat
+import threading
+import time
+from functools import lru_cache
+
+MAX_CACHED_PATHS = 4096
+POLL_INTERVAL = 1.0  # seconds
+
+# openat()-style access needs dir_fd support for os.open and O_NOFOLLOW /
+# O_DIRECTORY. Where they are missing (e.g. Windows), SafeRoot falls back to
+# resolving real paths and checking that they stay under the root.
+HAVE_DIR_FD = (os.open in os.supports_dir_fd and hasattr(os, 'O_NOFOLLOW')
+               and hasattr(os, 'O_DIRECTORY'))
+
+_O_CLOEXEC = getattr(os, 'O_CLOEXEC', 0)
+_O_BINARY = getattr(os, 'O_BINARY', 0)
+_O_NONBLOCK = getattr(os, 'O_NONBLOCK', 0)
+
+
+@lru_cache(maxsize=MAX_CACHED_PATHS)
+def split_safe_path(relative_path):
+    """Splits a user-supplied relative path into its components.
+
+    '.' and empty components are dropped and '..' removes the previous
+    component, so 'a/./b/../c' becomes ('a', 'c'). Returns None for paths
+    that are empty, absolute, contain NUL bytes or climb above the root.
+    Results are cached, so a path seen before costs one dictionary lookup.
+    """
+    if not isinstance(relative_path, str) or not relative_path or '\0' in relative_path:
+        return None
+    if os.path.isabs(relative_path) or os.path.splitdrive(relative_path)[0]:
+        return None
+
+    parts = []
+    for part in relative_path.replace(os.sep, '/').split('/'):
+        if part in ('', '.'):
+            continue
+        if part == '..':
+            if not parts:
+                return None
+            parts.pop()
+        else:
+            parts.append(part)
+    return tuple(parts) or None
+
+
+class SafeRoot:
+    """A directory that files are only ever opened beneath.
+
+    The root is opened once and kept as a directory fd. open() walks the
+    components of a validated relative path one by one with dir_fd and
+    O_NOFOLLOW, so a symlink anywhere along the path is refused rather than
+    followed, and a directory renamed or swapped for a link after the path
+    was validated cannot redirect the open outside the root. The file type
+    is checked on the opened fd, never with a separate stat beforehand.
+    """
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self._fd = None
+        self._real_path = os.path.realpath(self.path)
+        self._lock = threading.Lock()
+
+    def _root_fd(self):
+        if self._fd is None:
+            with self._lock:
+                if self._fd is None:
+                    self._fd = os.open(self.path, os.O_RDONLY | os.O_DIRECTORY | _O_CLOEXEC)
+        return self._fd
+
+    def close(self):
+        with self._lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+
+    def resolve(self, relative_path):
+        """Returns the absolute path for relative_path under the root, or None.
+
+        Only the path string is checked; nothing is read from disk.
+        """
+        parts = split_safe_path(relative_path)
+        if parts is None:
+            return None
+        return os.path.join(self.path, *parts)
+
+    def open(self, relative_path):
+        """Opens a regular file under the root for reading.
+
+        Returns a raw file descriptor, which the caller must close, or None
+        when the path is invalid, leaves the root, goes through a symlink or
+        does not name a regular file.
+        """
+        opened = self.open_stat(relative_path)
+        return None if opened is None else opened[0]
+
+    def open_stat(self, relative_path):
+        """Like open(), but returns (fd, os.stat_result) so callers need no second fstat."""
+        parts = split_safe_path(relative_path)
+        if parts is None:
+            return None
+        try:
+            fd = self._open_at(parts) if HAVE_DIR_FD else self._open_real(parts)
+        except OSError:
+            return None
+        try:
+            st = os.fstat(fd)
+            if stat.S_ISREG(st.st_mode):
+                return fd, st
+        except OSError:
+            pass
+        os.close(fd)
+        return None
+
+    def _open_at(self, parts):
+        root_fd = dir_fd = self._root_fd()
+        flags = os.O_RDONLY | os.O_NOFOLLOW | _O_CLOEXEC
+        try:
+            for part in parts[:-1]:
+                next_fd = os.open(part, flags | os.O_DIRECTORY, dir_fd=dir_fd)
+                if dir_fd != root_fd:
+                    os.close(dir_fd)
+                dir_fd = next_fd
+            # O_NONBLOCK keeps a FIFO planted under the root from hanging the open
+            return os.open(parts[-1], flags | _O_NONBLOCK, dir_fd=dir_fd)
+        finally:
+            if dir_fd != root_fd:
+                os.close(dir_fd)
+
+    def _open_real(self, parts):
+        real = os.path.realpath(os.path.join(self.path, *parts))
+        if os.path.commonpath([real, self._real_path]) != self._real_path:
+            raise PermissionError(f"{real} is outside {self._real_path}")
+        return os.open(real, os.O_RDONLY | _O_BINARY)
+
+
+_roots = {}
+_roots_lock = threading.Lock()
+
+
+def safe_root(path):
+    """Returns the shared SafeRoot for path, opening it on first use."""
+    path = os.path.abspath(path)
+    root = _roots.get(path)
+    if root is None:
+        with _roots_lock:
+            root = _roots.setdefault(path, SafeRoot(path))
+    return root
+
+
+class SafeRootIndex:
+    """In-memory allowlist of the regular files under a directory.
+
+    The tree is scanned once, without following symlinks, into a dict from
+    path components to (size, mtime_ns). lookup() then answers from memory:
+    unknown and traversal paths are rejected in O(path length) with no
+    syscalls, so probing for files costs the filesystem nothing.
+
+    The index is refreshed at most once per `interval` seconds, by whichever
+    lookup comes due: every indexed directory is stat()ed, and only those
+    whose mtime changed are rescanned. Directory mtimes change when entries
+    are added, removed or renamed, not when a file is rewritten in place, so
+    size and mtime of an existing file can lag until its directory changes.
+    """
+
+    def __init__(self, path, interval=POLL_INTERVAL, clock=time.monotonic):
+        self.path = os.path.abspath(path)
+        self.interval = interval
+        self.clock = clock
+        self.refreshes = 0
+        self._files = {}  # path components -> (size, mtime_ns)
+        self._dirs = {}   # path components -> (mtime_ns, file names, subdirectory names)
+        self._lock = threading.Lock()
+        self._scan(self._files, self._dirs, ())
+        self._checked_at = clock()
+
+    def __len__(self):
+        return len(self._files)
+
+    def __contains__(self, relative_path):
+        return self.lookup(relative_path) is not None
+
+    def lookup(self, relative_path):
+        """Returns (size, mtime_ns) for an indexed file, or None."""
+        if self.clock() - self._checked_at >= self.interval:
+            with self._lock:
+                # another lookup may have refreshed while this one waited
+                if self.clock() - self._checked_at >= self.interval:
+                    self._refresh()
+        parts = split_safe_path(relative_path)
+        return None if parts is None else self._files.get(parts)
+
+    def refresh(self):
+        """Rescans the directories that changed since the last scan; returns how many."""
+        with self._lock:
+            return self._refresh()
+
+    def _refresh(self):
+        # Changes are made to copies that replace the live dicts in one
+        # assignment each, so lookups, which do not take the lock, see either
+        # the old index or the new one and never a directory half rescanned.
+        self._checked_at = self.clock()
+        self.refreshes += 1
+        mtimes = {}
+        for parts in self._dirs:
+            try:
+                st = os.stat(os.path.join(self.path, *parts), follow_symlinks=False)
+                mtimes[parts] = st.st_mtime_ns if stat.S_ISDIR(st.st_mode) else None
+            except OSError:
+                mtimes[parts] = None
+        if all(mtime == self._dirs[parts][0] for parts, mtime in mtimes.items()):
+            return 0
+
+        changed = 0
+        files, dirs = dict(self._files), dict(self._dirs)
+        for parts, mtime in mtimes.items():
+            entry = dirs.get(parts)
+            if entry is None:  # dropped along with a changed parent
+                continue
+            if mtime != entry[0]:
+                changed += 1
+                self._drop(files, dirs, parts)
+                if mtime is not None:
+                    self._scan(files, dirs, parts)
+        self._files, self._dirs = files, dirs
+        return changed
+
+    def _scan(self, files, dirs, parts):
+        path = os.path.join(self.path, *parts)
+        try:
+            # stat before listing, so a change made during the scan is seen by the next refresh
+            mtime = os.stat(path, follow_symlinks=False).st_mtime_ns
+            entries = list(os.scandir(path))
+        except OSError:
+            return
+
+        names, subdirs = set(), set()
+        for entry in entries:
+            try:
+                if entry.is_symlink():
+                    continue
+                if entry.is_file():
+                    st = entry.stat(follow_symlinks=False)
+                    files[parts + (entry.name,)] = (st.st_size, st.st_mtime_ns)
+                    names.add(entry.name)
+                elif entry.is_dir():
+                    subdirs.add(entry.name)
+            except OSError:
+                continue
+        # parents are recorded before their children, so refresh() meets a
+        # changed directory before the subdirectories its rescan replaces
+        dirs[parts] = (mtime, names, subdirs)
+        for name in subdirs:
+            self._scan(files, dirs, parts + (name,))
+
+    def _drop(self, files, dirs, parts):
+        entry = dirs.pop(parts, None)
+        if entry is None:
+            return
+        for name in entry[1]:
+            files.pop(parts + (name,), None)
+        for name in entry[2]:
+            self._drop(files, dirs, parts + (name,))
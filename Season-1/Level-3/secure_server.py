@@ -0,0 +1,118 @@
+# secure_server.py
+
+import mimetypes
+from datetime import datetime, timezone
+from functools import lru_cache
+from flask import Flask, Response, jsonify, request
+from werkzeug.http import http_date
+from secure_code import TaxPayer, iter_chunks
+from secure_paths import SafeRootIndex
+from secure_thumbnails import ThumbnailCache
+
+app = Flask(__name__)
+assets_index = SafeRootIndex(TaxPayer.SAFE_ROOT)
+thumbnails = ThumbnailCache()
+
+@lru_cache(maxsize=4096)
+def _validators(dev, ino, size, mtime_ns):
+    """Returns (ETag, Last-Modified datetime) for one version of a file.
+
+    The strong ETag is built from inode, mtime and size, so it changes
+    whenever the file is replaced or rewritten and costs no read. Keyed by
+    the fstat() fields, the cache keeps the header values for the files
+    in use without ever serving a stale one.
+    """
+    etag = f"{dev:x}-{ino:x}-{mtime_ns:x}-{size:x}"
+    last_modified = datetime.fromtimestamp(mtime_ns // 1_000_000_000, timezone.utc)
+    return etag, last_modified
+
+def _not_modified(etag, last_modified):
+    # If-None-Match takes precedence over If-Modified-Since (RFC 9110 13.2.2)
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    since = request.if_modified_since
+    return since is not None and last_modified <= since
+
+def _range_applies(etag, last_modified):
+    if_range = request.if_range
+    if if_range.etag is not None:
+        return if_range.etag == etag
+    if if_range.date is not None:
+        return if_range.date == last_modified
+    return True
+
+@app.route("/")
+def index():
+    return jsonify({
+        "message": "TaxPayer attachment API",
+        "endpoints": {
+            "GET /attachment": "/attachment?input=tax_form.pdf (honours Range, If-Range, "
+                               "If-None-Match and If-Modified-Since)",
+            "GET /avatar": "/avatar?input=prof_picture.png&size=64",
+        }
+    })
+
+def _send_file(f, st, mimetype):
+    """Streams an open attachment, honouring conditional and Range headers."""
+    size = st.st_size
+    etag, last_modified = _validators(st.st_dev, st.st_ino, size, st.st_mtime_ns)
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": f'"{etag}"',
+        "Last-Modified": http_date(last_modified),
+        "Cache-Control": "private, no-cache",
+    }
+    if _not_modified(etag, last_modified):
+        f.close()
+        return Response(status=304, headers=headers)
+    status, start, end = 200, 0, size
+
+    # A Range header that is malformed, not in bytes or asks for several
+    # ranges is ignored and the whole file is sent, as RFC 9110 allows. So
+    # is one whose If-Range no longer matches the file.
+    byte_range = request.range
+    if (byte_range is not None and byte_range.units == "bytes" and len(byte_range.ranges) == 1
+            and _range_applies(etag, last_modified)):
+        span = byte_range.range_for_length(size)
+        if span is None:
+            f.close()
+            return Response(status=416, headers={"Content-Range": f"bytes */{size}", **headers})
+        status, (start, end) = 206, span
+        headers["Content-Range"] = f"bytes {start}-{end - 1}/{size}"
+
+    headers["Content-Length"] = str(end - start)
+    response = Response(iter_chunks(f, start, end), status, headers, mimetype=mimetype,
+                        direct_passthrough=True)
+    response.call_on_close(f.close)  # e.g. a HEAD request never starts the generator
+    return response
+
+@app.route("/attachment", methods=["GET"])
+def attachment():
+    path = request.args.get("input")
+    if not path:
+        return jsonify({"error": "Missing 'input' parameter"}), 400
+
+    opened = TaxPayer('foo', 'bar', index=assets_index).open_attachment_stat(path)
+    if opened is None:
+        return jsonify({"error": "Invalid or missing attachment"}), 404
+
+    return _send_file(*opened, mimetypes.guess_type(path)[0] or "application/octet-stream")
+
+@app.route("/avatar", methods=["GET"])
+def avatar():
+    path = request.args.get("input")
+    try:
+        size = int(request.args.get("size", thumbnails.sizes[1]))
+    except ValueError:
+        size = 0
+    if not path or size < 1:
+        return jsonify({"error": "'input' and a positive integer 'size' are required"}), 400
+
+    opened = thumbnails.open(TaxPayer('foo', 'bar', index=assets_index), path, size)
+    if opened is None:
+        return jsonify({"error": "Invalid or missing profile picture"}), 404
+
+    return _send_file(*opened, "image/png")
+
+if __name__ == "__main__":
+    app.run(debug=True)
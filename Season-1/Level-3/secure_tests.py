@@ -0,0 +1,600 @@
+# secure_tests.py
+
+import gc
+import hashlib
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+from unittest import mock
+import zlib
+
+import secure_attachments
+import secure_bulk
+import secure_cas
+import secure_code as c
+import secure_mmap
+import secure_paths
+import secure_server
+import secure_thumbnails
+
+
+class SafeRootTestCase(unittest.TestCase):
+    """Runs against a scratch SAFE_ROOT holding a few small files."""
+
+    def setUp(self):
+        self.base = tempfile.mkdtemp()
+        self.root = os.path.join(self.base, 'assets')
+        os.makedirs(os.path.join(self.root, 'forms'))
+        self.write('prof_picture.png', b'\x89PNG picture')
+        self.write('forms/tax_form.pdf', b'%PDF-1.4 form')
+        with open(os.path.join(self.base, 'secret.txt'), 'wb') as f:
+            f.write(b'secret')
+
+        class TaxPayer(c.TaxPayer):
+            SAFE_ROOT = self.root
+
+        self.TaxPayer = TaxPayer
+
+    def tearDown(self):
+        secure_paths.safe_root(self.root).close()
+        shutil.rmtree(self.base)
+
+    def write(self, relative_path, data):
+        with open(os.path.join(self.root, relative_path), 'wb') as f:
+            f.write(data)
+
+
+class TestSafePathResolution(SafeRootTestCase):
+
+    def test_split_safe_path(self):
+        split = secure_paths.split_safe_path
+        self.assertEqual(split('forms/tax_form.pdf'), ('forms', 'tax_form.pdf'))
+        self.assertEqual(split('./forms//x/../tax_form.pdf'), ('forms', 'tax_form.pdf'))
+        for path in [None, '', '.', '/etc/passwd', '../secret.txt', 'forms/../../secret.txt', 'a\0b', b'forms']:
+            self.assertIsNone(split(path), path)
+
+    def test_valid_paths(self):
+        payer = self.TaxPayer('username_test', 'password_test')
+        self.assertEqual(payer.get_prof_picture('prof_picture.png'), os.path.join(self.root, 'prof_picture.png'))
+        self.assertEqual(payer.prof_picture, b'\x89PNG picture')
+        self.assertEqual(payer.get_tax_form_attachment('forms/../forms/tax_form.pdf'),
+                         os.path.join(self.root, 'forms', 'tax_form.pdf'))
+        self.assertEqual(payer.tax_form_attachment, b'%PDF-1.4 form')
+
+    def test_traversal_is_blocked(self):
+        payer = self.TaxPayer('username_test', 'password_test')
+        for path in ['./../../../../../etc/passwd', '../secret.txt', os.path.join(self.base, 'secret.txt'),
+                     'forms', 'missing.png', None, '']:
+            self.assertIsNone(payer.get_prof_picture(path), path)
+            with self.assertRaises(Exception):
+                payer.get_tax_form_attachment(path)
+        self.assertIsNone(payer.prof_picture)
+        self.assertIsNone(payer.tax_form_attachment)
+
+    @unittest.skipUnless(hasattr(os, 'symlink'), "needs symlinks")
+    def test_symlinks_are_not_followed(self):
+        os.symlink(os.path.join(self.base, 'secret.txt'), os.path.join(self.root, 'link.txt'))
+        os.symlink(self.base, os.path.join(self.root, 'up'))
+        payer = self.TaxPayer('username_test', 'password_test')
+        self.assertIsNone(payer.get_prof_picture('link.txt'))
+        self.assertIsNone(payer.get_prof_picture('up/secret.txt'))
+
+    @unittest.skipUnless(secure_paths.HAVE_DIR_FD, "needs dir_fd support")
+    def test_root_is_anchored_by_fd(self):
+        payer = self.TaxPayer('username_test', 'password_test')
+        payer.get_prof_picture('prof_picture.png')
+        # Swapping the root directory for a link after it was opened must not redirect reads
+        moved = self.root + '.moved'
+        os.rename(self.root, moved)
+        os.symlink(self.base, self.root)
+        try:
+            self.assertIsNone(payer.get_prof_picture('secret.txt'))
+            self.assertIsNotNone(payer.get_prof_picture('prof_picture.png'))
+        finally:
+            os.remove(self.root)
+            os.rename(moved, self.root)
+
+    def test_open_leaks_no_descriptors(self):
+        if not os.path.isdir('/proc/self/fd'):
+            self.skipTest("needs /proc")
+        payer = self.TaxPayer('username_test', 'password_test')
+        payer.get_prof_picture('prof_picture.png')
+        before = len(os.listdir('/proc/self/fd'))
+        for _ in range(50):
+            payer.get_tax_form_attachment('forms/tax_form.pdf')
+            payer.get_prof_picture('forms/missing.png')
+            payer.get_prof_picture('forms')
+        self.assertEqual(len(os.listdir('/proc/self/fd')), before)
+
+
+class TestSafeRootIndex(SafeRootTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.now = 0.0
+        self.index = secure_paths.SafeRootIndex(self.root, interval=1.0, clock=lambda: self.now)
+
+    def test_lookup(self):
+        self.assertEqual(len(self.index), 2)
+        self.assertEqual(self.index.lookup('forms/../forms/tax_form.pdf')[0], len(b'%PDF-1.4 form'))
+        for path in ['forms', 'missing.png', '../secret.txt', '/etc/passwd', None]:
+            self.assertIsNone(self.index.lookup(path), path)
+
+    @unittest.skipUnless(hasattr(os, 'symlink'), "needs symlinks")
+    def test_symlinks_are_not_indexed(self):
+        os.symlink(os.path.join(self.base, 'secret.txt'), os.path.join(self.root, 'link.txt'))
+        os.symlink(self.base, os.path.join(self.root, 'up'))
+        self.assertEqual(self.index.refresh(), 1)
+        self.assertNotIn('link.txt', self.index)
+        self.assertNotIn('up/secret.txt', self.index)
+
+    def test_changes_are_picked_up_by_polling(self):
+        os.makedirs(os.path.join(self.root, 'new', 'deeper'))
+        self.write('new/deeper/late.pdf', b'late')
+        os.remove(os.path.join(self.root, 'forms', 'tax_form.pdf'))
+        # not polled yet: the index still answers from the previous scan
+        self.assertNotIn('new/deeper/late.pdf', self.index)
+        self.assertIn('forms/tax_form.pdf', self.index)
+
+        self.now = 1.0
+        self.assertIn('new/deeper/late.pdf', self.index)
+        self.assertNotIn('forms/tax_form.pdf', self.index)
+        self.assertEqual(self.index.refreshes, 1)
+
+        shutil.rmtree(os.path.join(self.root, 'new'))
+        self.assertEqual(self.index.refresh(), 1)
+        self.assertEqual(len(self.index), 1)
+        self.assertEqual(self.index.refresh(), 0)
+
+    def test_lookups_during_a_rescan_see_the_previous_index(self):
+        seen = []
+        scan = self.index._scan
+
+        def looking_scan(files, dirs, parts):
+            seen.append(self.index.lookup('forms/tax_form.pdf'))
+            scan(files, dirs, parts)
+
+        self.index._scan = looking_scan
+        self.write('forms/late.pdf', b'late')
+        self.now = 1.0
+        self.assertIn('forms/late.pdf', self.index)
+        self.assertEqual(seen, [(len(b'%PDF-1.4 form'), seen[0][1])])
+        self.assertEqual(self.index.refreshes, 1)
+
+    def test_taxpayer_rejects_unindexed_paths(self):
+        payer = self.TaxPayer('username_test', 'password_test', index=self.index)
+        self.assertIsNotNone(payer.get_prof_picture('prof_picture.png'))
+        self.write('unindexed.png', b'x')
+        self.assertIsNone(payer.get_prof_picture('unindexed.png'))
+        self.assertIsNone(payer.read_attachment('unindexed.png'))
+        self.assertIsNone(payer.open_attachment('unindexed.png'))
+
+
+class TestLazyAttachments(SafeRootTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.cache = secure_attachments.attachments
+        self.max_bytes = self.cache.max_bytes
+        self.cache.clear()
+
+    def tearDown(self):
+        self.cache.max_bytes = self.max_bytes
+        self.cache.clear()
+        super().tearDown()
+
+    def test_taxpayer_is_slotted(self):
+        payer = c.TaxPayer('username_test', 'password_test')
+        self.assertFalse(hasattr(payer, '__dict__'))
+        with self.assertRaises(AttributeError):
+            payer.nickname = 'x'
+        with self.assertRaises(AssertionError):
+            payer.prof_picture = b'not a handle'
+
+    def test_attachments_load_on_first_access(self):
+        payer = self.TaxPayer('username_test', 'password_test')
+        misses = self.cache.misses
+        payer.get_tax_form_attachment('forms/tax_form.pdf')
+        self.assertEqual(self.cache.misses, misses)
+        self.assertEqual(payer.tax_form_attachment, b'%PDF-1.4 form')
+        self.assertEqual(self.cache.misses, misses + 1)
+        with self.assertRaises(TypeError):
+            payer.tax_form_attachment[0] = 0
+
+    def test_payers_share_one_copy(self):
+        payers = [self.TaxPayer(str(i), 'pw') for i in range(100)]
+        for payer in payers:
+            payer.get_prof_picture('prof_picture.png')
+        views = [payer.prof_picture for payer in payers]
+        self.assertEqual(len({id(view.obj) for view in views}), 1)
+        self.assertEqual(self.cache.stats()['blobs'], 1)
+
+    def test_budget_evicts_unused_blobs(self):
+        self.cache.max_bytes = 20  # fits one 13-byte attachment
+        payer = self.TaxPayer('username_test', 'password_test')
+        payer.get_prof_picture('prof_picture.png')
+        payer.get_tax_form_attachment('forms/tax_form.pdf')
+        picture = payer.prof_picture
+        payer.tax_form_attachment
+        self.assertEqual(self.cache.evictions, 1)
+        self.assertEqual(self.cache.nbytes, 13)
+
+        # evicted but still referenced through `picture`: found again, not re-read
+        misses = self.cache.misses
+        other = self.TaxPayer('other', 'pw')
+        other.get_prof_picture('prof_picture.png')
+        self.assertIs(other.prof_picture.obj, picture.obj)
+        self.assertEqual(self.cache.misses, misses)
+
+        del picture
+        self.cache.clear()
+        gc.collect()
+        self.assertEqual(self.cache.stats()['blobs'], 0)
+        self.assertEqual(payer.prof_picture, b'\x89PNG picture')
+
+
+class TestMappedAttachments(SafeRootTestCase):
+
+    def test_payers_share_one_mapping(self):
+        payers = [self.TaxPayer(f'user{i}', 'pw', attachment_mode='mmap') for i in range(3)]
+        for payer in payers:
+            payer.get_tax_form_attachment('forms/tax_form.pdf')
+            self.assertIsInstance(payer.tax_form_attachment, memoryview)
+            self.assertTrue(payer.tax_form_attachment.readonly)
+            self.assertEqual(bytes(payer.tax_form_attachment), b'%PDF-1.4 form')
+        self.assertEqual(len(secure_mmap.mappings), 1)
+
+        for payer in payers:
+            payer.close()
+            self.assertIsNone(payer.tax_form_attachment)
+        self.assertEqual(len(secure_mmap.mappings), 0)
+
+    def test_reload_and_collection_release_mappings(self):
+        payer = self.TaxPayer('username_test', 'password_test', attachment_mode='mmap')
+        payer.get_prof_picture('prof_picture.png')
+        payer.prof_picture
+        payer.get_prof_picture('prof_picture.png')
+        payer.get_tax_form_attachment('forms/tax_form.pdf')
+        self.assertEqual(len(secure_mmap.mappings), 0)  # nothing is mapped until it is read
+        payer.prof_picture, payer.tax_form_attachment
+        self.assertEqual(len(secure_mmap.mappings), 2)
+        del payer
+        self.assertEqual(len(secure_mmap.mappings), 0)
+
+    def test_replaced_file_gets_a_new_mapping(self):
+        first = self.TaxPayer('first', 'pw', attachment_mode='mmap')
+        first.get_prof_picture('prof_picture.png')
+        first.prof_picture
+        os.remove(os.path.join(self.root, 'prof_picture.png'))
+        self.write('prof_picture.png', b'new picture')
+        second = self.TaxPayer('second', 'pw', attachment_mode='mmap')
+        second.get_prof_picture('prof_picture.png')
+        self.assertEqual(bytes(first.prof_picture), b'\x89PNG picture')
+        self.assertEqual(bytes(second.prof_picture), b'new picture')
+        first.close()
+        second.close()
+        self.assertEqual(len(secure_mmap.mappings), 0)
+
+    def test_views_outlive_their_taxpayer(self):
+        payer = self.TaxPayer('username_test', 'password_test', attachment_mode='mmap')
+        payer.get_prof_picture('prof_picture.png')
+        view = payer.prof_picture
+        payer.get_prof_picture('prof_picture.png')  # a new handle releases the old one
+        self.assertEqual(bytes(view), b'\x89PNG picture')
+        again = payer.prof_picture
+        self.assertIsNot(again, view)
+        del payer
+        gc.collect()
+        self.assertEqual(bytes(view), b'\x89PNG picture')
+        self.assertEqual(bytes(again[:4]), b'\x89PNG')
+        self.assertEqual(len(secure_mmap.mappings), 1)
+        del view, again
+        self.assertEqual(len(secure_mmap.mappings), 0)
+
+    def test_empty_file_and_derived_views(self):
+        self.write('empty.pdf', b'')
+        payer = self.TaxPayer('username_test', 'password_test', attachment_mode='mmap')
+        payer.get_tax_form_attachment('empty.pdf')
+        self.assertEqual(len(payer.tax_form_attachment), 0)
+        payer.get_prof_picture('prof_picture.png')
+        header = payer.prof_picture[:4]
+        payer.close()
+        self.assertEqual(bytes(header), b'\x89PNG')
+        self.assertEqual(len(secure_mmap.mappings), 0)
+
+
+class TestContentStore(SafeRootTestCase):
+
+    def setUp(self):
+        super().setUp()
+        for i in range(3):
+            self.write(f'forms/copy{i}.pdf', b'%PDF-1.4 form')
+        self.store = secure_cas.ContentStore(os.path.join(self.base, 'cas'))
+        self.assertEqual(self.store.ingest(self.root), 5)
+
+    def tearDown(self):
+        self.store.close()
+        super().tearDown()
+
+    def test_duplicates_are_stored_once(self):
+        report = self.store.report()
+        self.assertEqual((report['paths'], report['blobs']), (5, 2))
+        self.assertEqual(report['saved_bytes'], 3 * len(b'%PDF-1.4 form'))
+        self.assertEqual(self.store.digest('forms/copy0.pdf'), self.store.digest('./forms/tax_form.pdf'))
+        self.assertEqual(self.store.resolve('forms/copy1.pdf'), self.store.resolve('forms/copy2.pdf'))
+
+    def test_blobs_match_their_names(self):
+        objects = os.path.join(self.base, 'cas', 'objects')
+        source = os.path.join(self.root, 'prof_picture.png')
+        real_open = open
+        opens = []
+
+        def changing_open(path, *args, **kwargs):
+            if path == source:  # the source changes every time it is opened
+                opens.append(path)
+                with real_open(source, 'wb') as w:
+                    w.write(b'version %d' % len(opens))
+            return real_open(path, *args, **kwargs)
+
+        with mock.patch('builtins.open', changing_open):
+            digest = self.store.add_file('changed.png', source)
+        with open(os.path.join(objects, digest[:2], digest), 'rb') as f:
+            self.assertEqual(hashlib.sha256(f.read()).hexdigest(), digest)
+
+        with self.assertRaises(OSError):
+            self.store.add_file('missing.png', os.path.join(self.root, 'missing.png'))
+        self.assertEqual([name for name in os.listdir(objects) if len(name) != 2], [])
+
+    def test_taxpayer_reads_from_store(self):
+        payer = self.TaxPayer('username_test', 'password_test', store=self.store)
+        cache = secure_attachments.attachments
+        hits, misses = cache.hits, cache.misses
+        for path in ['forms/tax_form.pdf', 'forms/copy0.pdf', 'forms/copy1.pdf']:
+            self.assertEqual(payer.get_tax_form_attachment(path), self.store.resolve(path))
+            self.assertEqual(payer.tax_form_attachment, b'%PDF-1.4 form')
+        # one blob on disk, so one read shared by all three paths
+        self.assertEqual((cache.hits - hits, cache.misses - misses), (2, 1))
+        self.assertEqual(payer.read_attachment('forms/copy2.pdf'), b'%PDF-1.4 form')
+        self.assertEqual(payer.read_attachment('forms/copy0.pdf'), b'%PDF-1.4 form')
+        self.assertEqual((self.store.hits, self.store.misses), (1, 1))
+        for path in ['../secret.txt', 'forms/missing.pdf', 'secret.txt', None]:
+            self.assertIsNone(payer.get_prof_picture(path), path)
+
+    def test_mapped_duplicates_share_pages(self):
+        payers = [self.TaxPayer(str(i), 'pw', attachment_mode='mmap', store=self.store) for i in range(3)]
+        for i, payer in enumerate(payers):
+            payer.get_tax_form_attachment(f'forms/copy{i}.pdf')
+            self.assertEqual(payer.tax_form_attachment, b'%PDF-1.4 form')
+        self.assertEqual(len(secure_mmap.mappings), 1)
+        for payer in payers:
+            payer.close()
+
+    def test_index_is_persisted(self):
+        store = secure_cas.ContentStore(self.store.path)
+        self.assertEqual(store.report()['blobs'], 2)
+        self.assertEqual(store.read('prof_picture.png'), b'\x89PNG picture')
+        store.close()
+
+
+class TestBulkFetch(SafeRootTestCase):
+
+    def setUp(self):
+        super().setUp()
+        for i in range(40):
+            self.write(f'forms/form{i}.pdf', f'form {i}'.encode())
+        self.payers = [self.TaxPayer(f'user{i}', 'pw') for i in range(40)]
+        self.requests = [(payer, f'forms/form{i}.pdf') for i, payer in enumerate(self.payers)]
+        self.requests[5] = (self.payers[5], '../secret.txt')
+        self.requests[17] = (self.payers[17], 'forms/missing.pdf')
+
+    def check(self, results):
+        self.assertEqual(len(results), 40)
+        for result in results:
+            payer, path = self.requests[result.index]
+            self.assertIs(result.taxpayer, payer)
+            self.assertEqual(result.path, path)
+            if result.index == 5:
+                self.assertIsInstance(result.error, ValueError)
+            elif result.index == 17:
+                self.assertIsInstance(result.error, FileNotFoundError)
+            else:
+                self.assertIsNone(result.error)
+                self.assertEqual(result.data, f'form {result.index}'.encode())
+
+    def test_ordered(self):
+        results = list(secure_bulk.fetch_attachments(self.requests, max_workers=4))
+        self.assertEqual([result.index for result in results], list(range(40)))
+        self.check(results)
+
+    def test_as_completed(self):
+        results = list(secure_bulk.fetch_attachments(self.requests, max_workers=4, ordered=False))
+        self.assertEqual(sorted(result.index for result in results), list(range(40)))
+        self.assertEqual(results[0].index, 5)  # rejected before any read
+        self.check(results)
+
+    def test_bulk_fetch_leaves_taxpayers_alone(self):
+        list(secure_bulk.fetch_attachments(self.requests))
+        self.assertTrue(all(payer.tax_form_attachment is None for payer in self.payers))
+
+
+def make_png(width, height, color, pixel, filter_type=0):
+    """Builds a PNG of one repeated pixel, each row using filter_type 0 or 2 (Up)."""
+    row = bytes(pixel) * width
+    rows = [b'\x00' + row] + [bytes([filter_type]) + (bytes(len(row)) if filter_type == 2 else row)] * (height - 1)
+
+    def chunk(kind, body):
+        return struct.pack('>I', len(body)) + kind + body + struct.pack('>I', zlib.crc32(kind + body))
+
+    return (secure_thumbnails.PNG_SIGNATURE
+            + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, color, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(b''.join(rows)))
+            + chunk(b'IEND', b''))
+
+
+class TestThumbnails(SafeRootTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.cache = secure_thumbnails.ThumbnailCache(os.path.join(self.base, 'thumbnails'))
+        with open(os.path.join(c.TaxPayer.SAFE_ROOT, 'prof_picture.png'), 'rb') as f:
+            self.write('prof_picture.png', f.read())
+        self.payer = self.TaxPayer('username_test', 'password_test')
+
+    def test_resize_in_pure_python(self):
+        for color, pixel in [(0, [7]), (2, [1, 2, 3]), (4, [9, 200]), (6, [1, 2, 3, 4])]:
+            data = make_png(40, 20, color, pixel, filter_type=2)
+            width, height, rgba = secure_thumbnails.decode_png(data)
+            self.assertEqual((width, height), (40, 20))
+            width, height, small = secure_thumbnails.resize_rgba(width, height, rgba, 10)
+            self.assertEqual((width, height), (10, 5))
+            self.assertEqual(small[:4], rgba[:4])
+        with self.assertRaises(ValueError):
+            secure_thumbnails.decode_png(b'%PDF-1.4 form')
+        huge = make_png(1, 1, 0, [0])
+        huge = huge[:16] + struct.pack('>II', 5000, 5000) + huge[24:]  # header claims 25M pixels
+        with self.assertRaises(ValueError):
+            secure_thumbnails.decode_png(huge)
+        good = make_png(4, 4, 0, [0])
+        short_header = good[:8] + struct.pack('>I', 5) + b'IHDR' + good[16:21] + b'\0' * 4 + good[33:]
+        corrupt_data = good.replace(b'IDAT', b'IDAT\xff\xff\xff\xff', 1)
+        for damaged in (short_header, corrupt_data):
+            with self.assertRaises(ValueError):
+                secure_thumbnails.decode_png(damaged)
+
+    def test_pillow_path_limits_pixels(self):
+        class FakeImage:
+            DecompressionBombError = type('DecompressionBombError', (Exception,), {})
+            size = (5000, 5000)
+
+            @classmethod
+            def open(cls, f):
+                return cls()
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                pass
+
+            def thumbnail(self, size):
+                raise AssertionError("decoded an oversized image")
+
+        with mock.patch.object(secure_thumbnails, 'Image', FakeImage):
+            with self.assertRaises(ValueError):
+                secure_thumbnails.make_thumbnail(b'not decoded', 64)
+
+    def test_thumbnails_are_bucketed_and_reused(self):
+        self.assertEqual([self.cache.bucket(size) for size in (1, 32, 33, 100, 999)], [32, 32, 64, 128, 256])
+        png = self.cache.get(self.payer, 'prof_picture.png', 50)
+        width, height, _ = secure_thumbnails.decode_png(png)
+        self.assertEqual((width, height), (64, 64))
+        self.assertEqual(self.cache.get(self.payer, './prof_picture.png', 64), png)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+        self.assertTrue(os.path.isdir(os.path.join(self.cache.root, '64')))
+
+        # a fresh cache finds the thumbnails already on disk
+        cache = secure_thumbnails.ThumbnailCache(self.cache.root)
+        self.assertEqual(cache.get(self.payer, 'prof_picture.png', 60), png)
+        self.assertEqual((cache.hits, cache.misses, cache.stats()['thumbnails']), (1, 0, 1))
+
+    def test_source_checks_apply(self):
+        for path in ['../secret.txt', 'forms/tax_form.pdf', 'missing.png', None]:
+            self.assertIsNone(self.cache.get(self.payer, path, 64), path)
+
+    def test_lru_eviction_by_total_size(self):
+        first = self.cache.get(self.payer, 'prof_picture.png', 32)
+        self.cache.max_bytes = len(first) + 1
+        self.cache.get(self.payer, 'prof_picture.png', 64)
+        self.assertEqual(self.cache.evictions, 1)
+        self.assertEqual(os.listdir(os.path.join(self.cache.root, '32')), [])
+        self.assertEqual(self.cache.stats()['thumbnails'], 1)
+
+    def test_avatar_route(self):
+        cache, secure_server.thumbnails = secure_server.thumbnails, self.cache
+        try:
+            client = secure_server.app.test_client()
+            response = client.get('/avatar?input=prof_picture.png&size=100')
+            self.assertEqual((response.status_code, response.mimetype), (200, 'image/png'))
+            self.assertEqual(secure_thumbnails.decode_png(response.data)[:2], (128, 128))
+            response = client.get('/avatar?input=prof_picture.png&size=100',
+                                  headers={'If-None-Match': response.headers['ETag']})
+            self.assertEqual(response.status_code, 304)
+            for query, status in [('input=../secure_code.py', 404), ('input=tax_form.pdf', 404),
+                                  ('input=prof_picture.png&size=x', 400), ('input=prof_picture.png&size=0', 400)]:
+                self.assertEqual(client.get(f'/avatar?{query}').status_code, status, query)
+        finally:
+            secure_server.thumbnails = cache
+
+
+class TestStreamingDownloads(unittest.TestCase):
+
+    def setUp(self):
+        self.client = secure_server.app.test_client()
+        with open(os.path.join(c.TaxPayer.SAFE_ROOT, 'tax_form.pdf'), 'rb') as f:
+            self.form = f.read()
+
+    def test_iter_chunks(self):
+        f = c.TaxPayer('username_test', 'password_test').open_attachment('tax_form.pdf')
+        chunks = list(c.iter_chunks(f, 10, 5000, chunk_size=1024))
+        self.assertEqual([len(chunk) for chunk in chunks], [1024] * 4 + [894])
+        self.assertEqual(b''.join(chunks), self.form[10:5000])
+        self.assertTrue(f.closed)
+
+    def test_full_download(self):
+        response = self.client.get('/attachment?input=tax_form.pdf')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, self.form)
+        self.assertEqual(response.headers['Content-Length'], str(len(self.form)))
+        self.assertEqual(response.headers['Accept-Ranges'], 'bytes')
+        self.assertEqual(response.mimetype, 'application/pdf')
+
+    def test_range_requests(self):
+        size = len(self.form)
+        for header, start, end in [('bytes=0-99', 0, 100), ('bytes=100-', 100, size), ('bytes=-10', size - 10, size)]:
+            response = self.client.get('/attachment?input=tax_form.pdf', headers={'Range': header})
+            self.assertEqual(response.status_code, 206, header)
+            self.assertEqual(response.data, self.form[start:end], header)
+            self.assertEqual(response.headers['Content-Range'], f'bytes {start}-{end - 1}/{size}')
+
+        response = self.client.get('/attachment?input=tax_form.pdf', headers={'Range': f'bytes={size}-'})
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response.headers['Content-Range'], f'bytes */{size}')
+        for header in ['bytes=0-1,5-6', 'pages=1-2']:
+            response = self.client.get('/attachment?input=tax_form.pdf', headers={'Range': header})
+            self.assertEqual((response.status_code, response.data), (200, self.form), header)
+
+    def test_conditional_get(self):
+        first = self.client.get('/attachment?input=tax_form.pdf')
+        etag, last_modified = first.headers['ETag'], first.headers['Last-Modified']
+        self.assertTrue(etag.startswith('"') and etag.endswith('"'))
+
+        for headers in [{'If-None-Match': etag}, {'If-None-Match': f'"other", W/{etag}'},
+                        {'If-None-Match': '*'}, {'If-Modified-Since': last_modified}]:
+            response = self.client.get('/attachment?input=tax_form.pdf', headers=headers)
+            self.assertEqual((response.status_code, response.data), (304, b''), headers)
+            self.assertEqual(response.headers['ETag'], etag)
+
+        for headers in [{'If-None-Match': '"other"'}, {'If-Modified-Since': 'Thu, 01 Jan 1998 00:00:00 GMT'},
+                        {'If-None-Match': '"other"', 'If-Modified-Since': last_modified}]:
+            response = self.client.get('/attachment?input=tax_form.pdf', headers=headers)
+            self.assertEqual((response.status_code, response.data), (200, self.form), headers)
+
+    def test_if_range(self):
+        etag = self.client.get('/attachment?input=tax_form.pdf').headers['ETag']
+        response = self.client.get('/attachment?input=tax_form.pdf',
+                                   headers={'Range': 'bytes=0-9', 'If-Range': etag})
+        self.assertEqual((response.status_code, response.data), (206, self.form[:10]))
+        response = self.client.get('/attachment?input=tax_form.pdf',
+                                   headers={'Range': 'bytes=0-9', 'If-Range': '"stale"'})
+        self.assertEqual((response.status_code, response.data), (200, self.form))
+
+    def test_traversal_is_blocked(self):
+        for path in ['../secure_code.py', '/etc/passwd', './../../../../../etc/passwd']:
+            self.assertEqual(self.client.get('/attachment', query_string={'input': path}).status_code, 404)
+        self.assertEqual(self.client.get('/attachment').status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
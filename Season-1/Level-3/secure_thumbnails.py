@@ -0,0 +1,325 @@
+# secure_thumbnails.py
+
+import io
+import os
+import struct
+import tempfile
+import threading
+import zlib
+from collections import OrderedDict
+
+from secure_paths import SafeRoot
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow is optional; PNGs are resized in pure Python without it
+    Image = None
+
+THUMBNAIL_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'thumbnails')
+SIZES = (32, 64, 128, 256)
+MAX_BYTES = 64 * 1024 * 1024
+MAX_PIXELS = 4096 * 4096  # larger images are refused rather than decoded
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+_CHANNELS = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}  # PNG color type -> samples per pixel
+
+
+def _chunks(data):
+    if data[:8] != PNG_SIGNATURE:
+        raise ValueError("Not a PNG file")
+    pos = 8
+    while pos + 8 <= len(data):
+        length, kind = struct.unpack('>I4s', data[pos:pos + 8])
+        yield kind, data[pos + 8:pos + 8 + length]
+        pos += 12 + length
+
+
+def _unfilter(kind, row, prev, bpp):
+    n = len(row)
+    if kind == 0:
+        return
+    if kind == 1:
+        for i in range(bpp, n):
+            row[i] = (row[i] + row[i - bpp]) & 0xFF
+    elif kind == 2:
+        row[:] = bytes((a + b) & 0xFF for a, b in zip(row, prev))
+    elif kind == 3:
+        for i in range(n):
+            left = row[i - bpp] if i >= bpp else 0
+            row[i] = (row[i] + ((left + prev[i]) >> 1)) & 0xFF
+    elif kind == 4:
+        for i in range(n):
+            a = row[i - bpp] if i >= bpp else 0
+            b = prev[i]
+            c = prev[i - bpp] if i >= bpp else 0
+            p = a + b - c
+            pa, pb, pc = abs(p - a), abs(p - b), abs(p - c)
+            row[i] = (row[i] + (a if pa <= pb and pa <= pc else b if pb <= pc else c)) & 0xFF
+    else:
+        raise ValueError(f"Unknown PNG filter type {kind}")
+
+
+def _to_rgba(color, pixels, count, palette, transparency):
+    if color == 6:
+        return pixels
+    if color == 3:
+        alphas = transparency or b''
+        table = [bytes(palette[i * 3:i * 3 + 3]) + bytes([alphas[i] if i < len(alphas) else 255])
+                 for i in range(len(palette) // 3)]
+        try:
+            return bytearray(b''.join(table[i] for i in pixels))
+        except IndexError:
+            raise ValueError("PNG palette index out of range") from None
+
+    rgba = bytearray(count * 4)
+    if color == 2:
+        rgba[0::4], rgba[1::4], rgba[2::4] = pixels[0::3], pixels[1::3], pixels[2::3]
+        rgba[3::4] = b'\xff' * count
+    elif color == 0:
+        rgba[0::4] = rgba[1::4] = rgba[2::4] = pixels
+        rgba[3::4] = b'\xff' * count
+    else:  # gray + alpha
+        rgba[0::4] = rgba[1::4] = rgba[2::4] = pixels[0::2]
+        rgba[3::4] = pixels[1::2]
+    return rgba
+
+
+def decode_png(data):
+    """Decodes an 8-bit, non-interlaced PNG into (width, height, RGBA bytearray)."""
+    header, palette, transparency, idat = None, None, None, []
+    for kind, body in _chunks(data):
+        if kind == b'IHDR':
+            try:
+                header = struct.unpack('>IIBBBBB', body)
+            except struct.error:
+                raise ValueError("Malformed PNG IHDR chunk") from None
+        elif kind == b'PLTE':
+            palette = body
+        elif kind == b'tRNS':
+            transparency = body
+        elif kind == b'IDAT':
+            idat.append(body)
+        elif kind == b'IEND':
+            break
+    if header is None:
+        raise ValueError("PNG has no IHDR chunk")
+
+    width, height, depth, color, _, _, interlace = header
+    if depth != 8 or interlace or color not in _CHANNELS or (color == 3 and palette is None):
+        raise ValueError("Only 8-bit, non-interlaced PNGs can be resized without Pillow")
+    if not 0 < width * height <= MAX_PIXELS:
+        raise ValueError(f"PNG of {width}x{height} pixels is too large")
+
+    bpp = _CHANNELS[color]
+    stride = width * bpp
+    expected = (stride + 1) * height
+    # bounded, so a small compressed stream cannot expand without limit
+    try:
+        raw = zlib.decompressobj().decompress(b''.join(idat), expected)
+    except zlib.error as e:
+        raise ValueError(f"Corrupt PNG image data: {e}") from None
+    if len(raw) < expected:
+        raise ValueError("Truncated PNG image data")
+
+    pixels = bytearray(stride * height)
+    prev = bytearray(stride)
+    for y in range(height):
+        start = y * (stride + 1)
+        row = bytearray(raw[start + 1:start + 1 + stride])
+        _unfilter(raw[start], row, prev, bpp)
+        pixels[y * stride:(y + 1) * stride] = row
+        prev = row
+    return width, height, _to_rgba(color, pixels, width * height, palette, transparency)
+
+
+def encode_png(width, height, rgba):
+    """Encodes RGBA pixels as an 8-bit PNG."""
+    stride = width * 4
+    raw = b''.join(b'\x00' + rgba[y * stride:(y + 1) * stride] for y in range(height))
+
+    def chunk(kind, body):
+        return struct.pack('>I', len(body)) + kind + body + struct.pack('>I', zlib.crc32(kind + body))
+
+    return (PNG_SIGNATURE
+            + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(bytes(raw), 9))
+            + chunk(b'IEND', b''))
+
+
+def resize_rgba(width, height, rgba, size):
+    """Shrinks RGBA pixels to fit in size x size, averaging each source box.
+
+    Keeps the aspect ratio and never enlarges. Returns (width, height, rgba).
+    """
+    scale = min(1.0, size / max(width, height))
+    out_w, out_h = max(1, round(width * scale)), max(1, round(height * scale))
+    if (out_w, out_h) == (width, height):
+        return width, height, rgba
+
+    stride = width * 4
+    columns = [(x * width // out_w, max((x + 1) * width // out_w, x * width // out_w + 1)) for x in range(out_w)]
+    out = bytearray(out_w * out_h * 4)
+    for oy in range(out_h):
+        y0 = oy * height // out_h
+        y1 = max((oy + 1) * height // out_h, y0 + 1)
+        sums = [0] * (out_w * 4)
+        for y in range(y0, y1):
+            row = rgba[y * stride:(y + 1) * stride]
+            for channel in range(4):
+                samples = row[channel::4]
+                for ox, (x0, x1) in enumerate(columns):
+                    sums[ox * 4 + channel] += sum(samples[x0:x1])
+        base = oy * out_w * 4
+        for ox, (x0, x1) in enumerate(columns):
+            area = (x1 - x0) * (y1 - y0)
+            for channel in range(4):
+                out[base + ox * 4 + channel] = sums[ox * 4 + channel] // area
+    return out_w, out_h, out
+
+
+def make_thumbnail(data, size):
+    """Returns PNG bytes of the image in `data` shrunk to fit in size x size.
+
+    Uses Pillow when it is installed; otherwise only PNGs are supported.
+    Raises ValueError for images that cannot be decoded.
+    """
+    if Image is not None:
+        try:
+            with Image.open(io.BytesIO(data)) as image:
+                # checked before decoding; Pillow's own bomb limit is far higher
+                width, height = image.size
+                if not 0 < width * height <= MAX_PIXELS:
+                    raise ValueError(f"Image of {width}x{height} pixels is too large")
+                image.thumbnail((size, size))
+                out = io.BytesIO()
+                image.save(out, format='PNG')
+                return out.getvalue()
+        except (OSError, Image.DecompressionBombError) as e:
+            raise ValueError(str(e)) from e
+    return encode_png(*resize_rgba(*decode_png(data), size))
+
+
+class ThumbnailCache:
+    """Size-bucketed thumbnails of TaxPayer profile pictures, kept on disk.
+
+    A request for any size is served from the smallest bucket in `sizes`
+    that is at least as large. Each thumbnail is made once per version of
+    its source file and stored as <root>/<bucket>/<version>.png, where the
+    version is derived from the source's device, inode, mtime and size, so
+    no user-supplied text ever becomes part of a thumbnail path. Source
+    files are opened through the taxpayer's own checks, and thumbnails
+    through a SafeRoot on `root`. Once the thumbnails exceed `max_bytes`,
+    the least recently used ones are deleted.
+    """
+
+    def __init__(self, root=THUMBNAIL_ROOT, max_bytes=MAX_BYTES, sizes=SIZES):
+        self.root = os.path.abspath(root)
+        self.max_bytes = max_bytes
+        self.sizes = tuple(sorted(sizes))
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.nbytes = 0
+        self._entries = None  # thumbnail name -> size, least recently used first; loaded on first use
+        self._safe_root = SafeRoot(self.root)
+        self._lock = threading.Lock()
+
+    def bucket(self, size):
+        """Returns the thumbnail size used for a requested size."""
+        for bucket in self.sizes:
+            if size <= bucket:
+                return bucket
+        return self.sizes[-1]
+
+    def _load(self):
+        """Indexes the thumbnails already on disk, oldest first."""
+        os.makedirs(self.root, exist_ok=True)
+        found = []
+        for bucket in self.sizes:
+            directory = os.path.join(self.root, str(bucket))
+            if not os.path.isdir(directory):
+                continue
+            for entry in os.scandir(directory):
+                if entry.is_file(follow_symlinks=False) and entry.name.endswith('.png'):
+                    st = entry.stat(follow_symlinks=False)
+                    found.append((st.st_mtime_ns, f"{bucket}/{entry.name}", st.st_size))
+        found.sort()
+        self._entries = OrderedDict((name, size) for _, name, size in found)
+        self.nbytes = sum(self._entries.values())
+
+    def open(self, taxpayer, relative_path, size):
+        """Returns (file, os.stat_result) for the thumbnail of an attachment, or None.
+
+        None means the attachment may not be read or is not an image that
+        can be resized. The caller must close the file.
+        """
+        opened = taxpayer.open_attachment_stat(relative_path)
+        if opened is None:
+            return None
+        source, st = opened
+        name = f"{self.bucket(size)}/{st.st_dev:x}-{st.st_ino:x}-{st.st_mtime_ns:x}-{st.st_size:x}.png"
+
+        with source:
+            with self._lock:
+                if self._entries is None:
+                    self._load()
+            thumbnail = self._safe_root.open_stat(name)
+            if thumbnail is not None:
+                with self._lock:
+                    self.hits += 1
+                    if name in self._entries:
+                        self._entries.move_to_end(name)
+            else:
+                with self._lock:
+                    self.misses += 1
+                try:
+                    png = make_thumbnail(source.read(), self.bucket(size))
+                except ValueError:
+                    return None
+                self._store(name, png)
+                thumbnail = self._safe_root.open_stat(name)
+                if thumbnail is None:
+                    return None
+
+        fd, thumbnail_st = thumbnail
+        return os.fdopen(fd, 'rb', buffering=0), thumbnail_st
+
+    def get(self, taxpayer, relative_path, size):
+        """Returns the thumbnail's PNG bytes, or None; see open()."""
+        opened = self.open(taxpayer, relative_path, size)
+        if opened is None:
+            return None
+        with opened[0] as f:
+            return f.read()
+
+    def _store(self, name, png):
+        directory = os.path.join(self.root, os.path.dirname(name))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(png)
+        os.replace(tmp, os.path.join(self.root, name))
+
+        with self._lock:
+            self.nbytes += len(png) - self._entries.pop(name, 0)
+            self._entries[name] = len(png)
+            while self.nbytes > self.max_bytes and len(self._entries) > 1:
+                evicted, evicted_size = self._entries.popitem(last=False)
+                self.nbytes -= evicted_size
+                self.evictions += 1
+                try:
+                    os.remove(os.path.join(self.root, evicted))
+                except FileNotFoundError:
+                    pass
+
+    def stats(self):
+        """Returns the cache counters as a dict."""
+        lookups = self.hits + self.misses
+        return {
+            'thumbnails': len(self._entries or ()),
+            'bytes': self.nbytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
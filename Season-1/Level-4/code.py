@@ -12,6 +12,7 @@ the tests.py again to recreate it.
 import sqlite3
 import os
 from flask import Flask, request
+from secure_schema import ensure_schema
 
 
 ### Unrelated to the exercise -- Starts here -- Please ignore
@@ -38,42 +39,17 @@ class Connect(object):
 
 class Create(object):
 
+    # creates the dummy database inside the folder of this challenge, if needed;
+    # the schema is only checked on the first call in this process (see secure_schema.py)
     def __init__(self):
-        con = Connect()
         try:
-            # creates a dummy database inside the folder of this challenge
             path = os.path.dirname(os.path.abspath(__file__))
             db_path = os.path.join(path, 'level-4.db')
-            db_con = con.create_connection(db_path)
-            cur = db_con.cursor()
-
-            # checks if tables already exist, which will happen when re-running code
-            table_fetch = cur.execute(
-                '''
-                SELECT name 
-                FROM sqlite_master 
-                WHERE type='table'AND name='stocks';
-                ''').fetchall()
-
-            # if tables do not exist, create them and insert dummy data
-            if table_fetch == []:
-                cur.execute(
-                    '''
-                    CREATE TABLE stocks
-                    (date text, symbol text, price real)
-                    ''')
-
-                # inserts dummy data to the 'stocks' table, representing average price on date
-                cur.execute(
-                    "INSERT INTO stocks VALUES ('2022-01-06', 'MSFT', 300.00)")
-                db_con.commit()
+            ensure_schema(db_path)
 
         except sqlite3.Error as e:
             print(f"ERROR: {e}")
 
-        finally:
-            db_con.close()
-
 class DB_CRUD_ops(object):
 
     # retrieves all info about a stock symbol from the stocks table
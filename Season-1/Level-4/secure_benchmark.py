@@ -0,0 +1,232 @@
+# secure_benchmark.py
+
+import argparse
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import secure_code as c
+import secure_pool
+import secure_schema
+
+
+def timed(label, func, count, unit="req"):
+    """Runs func once and prints its throughput."""
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<34} {elapsed:8.3f}s  {count / elapsed:12,.0f} {unit}/s")
+    return elapsed, result
+
+
+class LegacyConnection:
+    """What DatabaseConnection did before secure_pool: connect and close on every call."""
+
+    def __init__(self, path):
+        self.db_path = path
+
+    def __enter__(self):
+        self.conn = sqlite3.connect(self.db_path)
+        self.cursor = self.conn.cursor()
+        return self.cursor
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type:
+            self.conn.rollback()
+        else:
+            self.conn.commit()
+        self.conn.close()
+
+
+class LegacyStockDB(c.SecureStockDB):
+
+    def _connection(self):
+        return LegacyConnection(c.db_path(self.db_filename))
+
+
+def legacy_create(path):
+    """What Create() did on every DB_CRUD_ops call before secure_schema: connect and look for the table."""
+    conn = sqlite3.connect(path)
+    try:
+        if conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='stocks'").fetchall() == []:
+            conn.execute("CREATE TABLE stocks (date text, symbol text, price real)")
+            conn.commit()
+    finally:
+        conn.close()
+
+
+def bench_bootstrap(path, calls):
+    print("\n[schema check per call vs once per process]")
+    legacy, _ = timed("connect + sqlite_master per call", lambda: [legacy_create(path) for _ in range(calls)],
+                      calls, "calls")
+    once, _ = timed("ensure_schema (cached)", lambda: [secure_schema.ensure_schema(path) for _ in range(calls)],
+                    calls, "calls")
+    print(f"speedup: {legacy / once:,.0f}x")
+
+
+def run_requests(client, requests, threads):
+    def get(i):
+        symbol = 'MSFT' if i % 2 else 'NONE'
+        return client.get(f'/stock-price?symbol={symbol}').status_code
+
+    if threads == 1:
+        return sum(get(i) == 200 for i in range(requests))
+    with ThreadPoolExecutor(threads) as pool:
+        return sum(code == 200 for code in pool.map(get, range(requests)))
+
+
+def bench_pool(path, requests, threads, pool_size):
+    print(f"\n[connect per call vs pooled connections, {threads} thread(s), GET /stock-price]")
+    with mock.patch.dict(os.environ, DB_FILENAME=path):  # keep the server's own database off level-4.db
+        import secure_server
+    client = secure_server.app.test_client()
+    original = secure_server.db
+    try:
+        secure_server.db = LegacyStockDB(db_filename=path)
+        legacy, expected = timed("sqlite3.connect per request", lambda: run_requests(client, requests, threads),
+                                 requests)
+        secure_server.db = c.SecureStockDB(db_filename=path, pool_size=pool_size)
+        pooled, actual = timed(f"ConnectionPool(size={pool_size})", lambda: run_requests(client, requests, threads),
+                               requests)
+        assert actual == expected == requests, "pooled server answered differently"
+        print(f"speedup: {legacy / pooled:.1f}x  pool: {secure_server.db.pool.stats()}")
+        secure_server.db.close()
+    finally:
+        secure_server.db = original
+
+
+def bench_queries(path, requests):
+    print("\n[connect per call vs pooled connections, SecureStockDB.get_stock_price only]")
+    legacy_db = LegacyStockDB(db_filename=path)
+    pooled_db = c.SecureStockDB(db_filename=path)
+    legacy, _ = timed("sqlite3.connect per call", lambda: [legacy_db.get_stock_price('MSFT') for _ in range(requests)],
+                      requests, "queries")
+    pooled, _ = timed("ConnectionPool", lambda: [pooled_db.get_stock_price('MSFT') for _ in range(requests)],
+                      requests, "queries")
+    print(f"speedup: {legacy / pooled:.1f}x")
+    pooled_db.close()
+
+
+def make_symbols(path, count):
+    """Creates a scratch database holding `count` symbols; returns them."""
+    symbols = [f"S{i:04d}" for i in range(count)]
+    c.SecureStockDB(db_filename=path).close()
+    with sqlite3.connect(path) as conn:
+        conn.executemany("INSERT INTO stocks VALUES ('2022-01-06', ?, ?)", [(s, 100.0) for s in symbols])
+    conn.close()
+    return symbols
+
+
+def bench_batch(path, symbols, batch, rounds=20):
+    print(f"\n[{batch} x get_stock_price vs get_stock_prices({batch} symbols), {len(symbols):,} rows]")
+    db = c.SecureStockDB(db_filename=path)
+    wanted = symbols[::len(symbols) // batch][:batch]
+    single, _ = timed("get_stock_price per symbol", lambda: [[db.get_stock_price(s) for s in wanted]
+                                                             for _ in range(rounds)], rounds * batch, "symbols")
+    batched, prices = timed("get_stock_prices (chunked IN)", lambda: [db.get_stock_prices(wanted)
+                                                                      for _ in range(rounds)], rounds * batch, "symbols")
+    assert len(prices[-1]) == batch, "batched lookup missed symbols"
+    print(f"{batched / rounds * 1000:.2f} ms per {batch}-symbol batch, speedup: {single / batched:.1f}x")
+    db.close()
+
+
+def bench_bulk_update(path, symbols, updates, singles=500):
+    print(f"\n[update_stock_price per row vs update_stock_prices, {len(symbols):,} rows]")
+    db = c.SecureStockDB(db_filename=path)
+    rows = [(symbols[i % len(symbols)], float(i % 1000)) for i in range(updates)]
+    single, _ = timed("update_stock_price (commit per row)",
+                      lambda: [db.update_stock_price(s, p) for s, p in rows[:singles]], singles, "rows")
+    bulk, result = timed("update_stock_prices (one commit)", lambda: db.update_stock_prices(rows), updates, "rows")
+    assert result == {'updated': updates, 'failed': []}, "bulk update failed rows"
+    print(f"speedup: {single / singles / (bulk / updates):.0f}x per row")
+    db.close()
+
+
+def make_history(path, symbols, days):
+    """Fills price_history with `days` daily prices per symbol, plus the same rows in an unindexed table."""
+    c.SecureStockDB(db_filename=path).close()
+    first = date(2000, 1, 1)
+    dates = [(first + timedelta(days=d)).isoformat() for d in range(days)]
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE flat_history (date TEXT, symbol TEXT, price REAL)")
+        for symbol in symbols:
+            rows = [(symbol, day, float(i)) for i, day in enumerate(dates)]
+            conn.executemany("INSERT INTO price_history VALUES (?, ?, ?)", rows)
+            conn.executemany("INSERT INTO flat_history VALUES (?, ?, ?)", [(d, s, p) for s, d, p in rows])
+    conn.close()
+    return dates
+
+
+def bench_history(path, symbols, days, queries=200):
+    print(f"\n[price history: unindexed table vs (symbol, date) primary key, {len(symbols) * days:,} rows]")
+    dates = make_history(path, symbols, days)
+    start, end = dates[days // 2], dates[days // 2 + 30]
+    db = c.SecureStockDB(db_filename=path)
+    conn = sqlite3.connect(path)
+    picks = [symbols[i % len(symbols)] for i in range(queries)]
+
+    scan, expected = timed("31-day range, full scan", lambda: [conn.execute(
+        "SELECT date, price FROM flat_history WHERE symbol = ? AND date BETWEEN ? AND ? ORDER BY date",
+        (s, start, end)).fetchall() for s in picks], queries, "queries")
+    seek, actual = timed("31-day range, iter_price_history", lambda: [list(db.iter_price_history(s, start, end))
+                                                                      for s in picks], queries, "queries")
+    assert actual == expected, "history query returned different rows"
+    print(f"speedup: {scan / seek:.0f}x")
+
+    scan, _ = timed("latest price, full scan", lambda: [conn.execute(
+        "SELECT date, price FROM flat_history WHERE symbol = ? ORDER BY date DESC LIMIT 1", (s,)).fetchone()
+        for s in picks], queries, "queries")
+    seek, _ = timed("latest price, get_latest_price", lambda: [db.get_latest_price(s) for s in picks],
+                    queries, "queries")
+    print(f"speedup: {scan / seek:.0f}x")
+
+    for label, read in (("fetchall", lambda: conn.execute(
+            "SELECT date, price FROM price_history WHERE symbol = ? ORDER BY date", (symbols[0],)).fetchall()),
+                        ("iter_price_history", lambda: sum(1 for _ in db.iter_price_history(symbols[0])))):
+        tracemalloc.start()
+        read()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"full {days:,}-day history, {label:<19} peak {peak / 1024:10,.0f} KB")
+    conn.close()
+    db.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks for the Level-4 database access paths")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--pool-size", type=int, default=secure_pool.POOL_SIZE)
+    parser.add_argument("--symbols", type=int, default=5000)
+    parser.add_argument("--batch", type=int, default=500)
+    parser.add_argument("--updates", type=int, default=50_000)
+    parser.add_argument("--history-symbols", type=int, default=50)
+    parser.add_argument("--days", type=int, default=5000)
+    args = parser.parse_args(argv)
+
+    base = tempfile.mkdtemp()
+    try:
+        path = os.path.join(base, 'stocks.db')
+        c.SecureStockDB(db_filename=path).close()
+        print(f"[BENCH] {args.requests:,} requests against a scratch copy of the database")
+        bench_bootstrap(path, args.requests * 4)
+        bench_queries(path, args.requests * 4)
+        bench_pool(path, args.requests, 1, args.pool_size)
+        bench_pool(path, args.requests, args.threads, args.pool_size)
+        symbols_path = os.path.join(base, 'symbols.db')
+        symbols = make_symbols(symbols_path, args.symbols)
+        bench_batch(symbols_path, symbols, args.batch)
+        bench_bulk_update(symbols_path, symbols, args.updates)
+        bench_history(os.path.join(base, 'history.db'), symbols[:args.history_symbols], args.days)
+    finally:
+        shutil.rmtree(base)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,63 @@
 # secure_code.py
 
+import math
 import sqlite3
 import os
-from typing import Optional
+from collections.abc import Mapping
+from datetime import datetime, timezone
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+
+from secure_pool import ConnectionPool, POOL_SIZE
+from secure_schema import ensure_schema
+
+
+def db_path(db_filename: str = 'level-4.db') -> str:
+    """Returns the database path; relative names are resolved next to this file."""
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), db_filename)
+
+
+MAX_SYMBOLS = 1000  # per get_stock_prices() call
+IN_CHUNK = 500      # bound parameters per IN (...) query, well under SQLite's limit
+UPDATE_CHUNK = 500  # rows per executemany() in update_stock_prices()
+HISTORY_FETCH = 1000  # rows fetched at a time by iter_price_history()
+
+
+# A price for `date` is recorded in the history; it only replaces the current
+# price in stocks when no later date is recorded, so backfills keep history only.
+_RECORD_HISTORY = "INSERT OR REPLACE INTO price_history (symbol, date, price) VALUES (?, ?, ?)"
+_UPDATE_IF_LATEST = ("UPDATE stocks SET price = ? WHERE symbol = ? "
+                     "AND ? >= (SELECT MAX(date) FROM price_history WHERE symbol = ?)")
+
+
+def _today() -> str:
+    return datetime.now(timezone.utc).date().isoformat()
 
 
 class DatabaseConnection:
-    """Context manager for SQLite database connection."""
-    def __init__(self, db_filename: str = 'level-4.db'):
-        self.db_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), db_filename)
+    """Context manager for a connection from `pool`; commits on success, rolls back on error."""
+    def __init__(self, pool: ConnectionPool):
+        self.pool = pool
+        self.db_path = pool.path
 
     def __enter__(self):
-        self.conn = sqlite3.connect(self.db_path)
+        self.conn = self.pool.acquire()
         self.cursor = self.conn.cursor()
         return self.cursor
 
     def __exit__(self, exc_type, exc_value, traceback):
-        if exc_type:
-            self.conn.rollback()
-        else:
-            self.conn.commit()
-        self.conn.close()
+        discard = False
+        try:
+            if exc_type:
+                self.conn.rollback()
+            else:
+                self.conn.commit()
+        except sqlite3.Error:
+            discard = True
+            raise
+        finally:
+            self.cursor.close()
+            self.pool.release(self.conn, discard=discard)
 
 
 class SecureStockDB:
@@ -28,28 +65,38 @@ class SecureStockDB:
     Professional-grade database interface for stock operations.
     Designed for secure, testable, production use.
     """
-    def __init__(self, log_mode: str = "secure"):
+    def __init__(self, log_mode: str = "secure", db_filename: str = 'level-4.db', pool_size: int = POOL_SIZE):
         assert log_mode in {"secure", "compatible"}, "log_mode must be 'secure' or 'compatible'"
         self.log_mode = log_mode
+        self.db_filename = db_filename
+        self.pool = ConnectionPool(db_path(db_filename), size=pool_size)
         self._initialize_db()
 
+    def close(self):
+        """Closes the pooled connections."""
+        self.pool.close()
+
+    def _connection(self) -> DatabaseConnection:
+        return DatabaseConnection(self.pool)
+
     def _initialize_db(self):
-        with DatabaseConnection() as cur:
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS stocks (
-                    date TEXT,
-                    symbol TEXT PRIMARY KEY,
-                    price REAL
-                )
-            """)
-            cur.execute("SELECT COUNT(*) FROM stocks WHERE symbol = ?", ('MSFT',))
-            if cur.fetchone()[0] == 0:
-                cur.execute("INSERT INTO stocks VALUES (?, ?, ?)", ('2022-01-06', 'MSFT', 300.0))
+        """Brings the database up to the current schema; a no-op after the first call per process."""
+        ensure_schema(self.pool.path)
 
     def _is_safe_symbol(self, symbol: str) -> bool:
         """Validate stock symbol: uppercase, alphanumeric, ≤ 5 characters."""
         return symbol.isalnum() and symbol.isupper() and len(symbol) <= 5
 
+    def _is_valid_date(self, date: str) -> bool:
+        """Validate date: an ISO calendar date, YYYY-MM-DD."""
+        if not isinstance(date, str) or len(date) != 10:
+            return False
+        try:
+            datetime.strptime(date, "%Y-%m-%d")
+        except ValueError:
+            return False
+        return True
+
     def get_stock_info(self, symbol: str) -> str:
         log = "[METHOD EXECUTED] get_stock_info\n"
         log += self._log_query("SELECT * FROM stocks WHERE symbol = ?", symbol)
@@ -58,7 +105,7 @@ class SecureStockDB:
             log += "CONFIRM THAT THE ABOVE QUERY IS NOT MALICIOUS TO EXECUTE"
             return log
 
-        with DatabaseConnection() as cur:
+        with self._connection() as cur:
             cur.execute("SELECT * FROM stocks WHERE symbol = ?", (symbol,))
             result = cur.fetchone()
             log += "[RESULT] " + str(result) if result else "[RESULT] No entry found."
@@ -72,13 +119,96 @@ class SecureStockDB:
             log += "CONFIRM THAT THE ABOVE QUERY IS NOT MALICIOUS TO EXECUTE"
             return log
 
-        with DatabaseConnection() as cur:
+        with self._connection() as cur:
             cur.execute("SELECT price FROM stocks WHERE symbol = ?", (symbol,))
             result = cur.fetchone()
             log += "[RESULT] " + str(result) + "\n" if result else "[RESULT] No price found.\n"
             return log
 
-    def update_stock_price(self, symbol: str, price: float) -> str:
+    def get_stock_prices(self, symbols: Iterable[str]) -> Dict[str, float]:
+        """
+        Returns {symbol: price} for every requested symbol that has a price.
+        All symbols are validated before any query runs; symbols are looked up
+        in chunks of IN_CHUNK parameters over a single pooled connection.
+        """
+        if isinstance(symbols, str):
+            symbols = [symbols]
+        wanted = list(dict.fromkeys(symbols))
+        if len(wanted) > MAX_SYMBOLS:
+            raise ValueError(f"At most {MAX_SYMBOLS} symbols may be requested at once.")
+        unsafe = [s for s in wanted if not isinstance(s, str) or not self._is_safe_symbol(s)]
+        if unsafe:
+            raise ValueError(f"Unsafe stock symbol input: {len(unsafe)} symbol(s) rejected.")
+
+        prices = {}
+        with self._connection() as cur:
+            for start in range(0, len(wanted), IN_CHUNK):
+                chunk = wanted[start:start + IN_CHUNK]
+                placeholders = ", ".join("?" * len(chunk))
+                cur.execute(f"SELECT symbol, price FROM stocks WHERE symbol IN ({placeholders})", chunk)
+                prices.update(cur)
+        return prices
+
+    def update_stock_prices(self, rows: Iterable[Tuple[str, float]], date: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Applies (symbol, price) updates, or a {symbol: price} mapping, in one
+        transaction: rows are validated like update_stock_price() and written
+        UPDATE_CHUNK at a time with executemany(), then committed once. Each
+        price is recorded in the price history for `date`, and becomes the
+        current price in stocks unless the history already has a later date.
+        Invalid rows and unknown symbols are skipped, not fatal; returns
+        {'updated': count, 'failed': [{'row': index, 'symbol': ..., 'error': ...}]}.
+        """
+        date = self._history_date(date)
+        if isinstance(rows, Mapping):
+            rows = rows.items()
+        rows = enumerate(rows)
+        updated, failed = 0, []
+
+        def fail(index, symbol, error):
+            failed.append({'row': index, 'symbol': symbol if isinstance(symbol, str) else None, 'error': error})
+
+        with self._connection() as cur:
+            cur.execute("BEGIN IMMEDIATE")
+            while True:
+                chunk = list(islice(rows, UPDATE_CHUNK))
+                if not chunk:
+                    break
+                valid = []
+                for index, row in chunk:
+                    try:
+                        symbol, price = row
+                    except (TypeError, ValueError):
+                        fail(index, None, "Row must be a (symbol, price) pair.")
+                        continue
+                    if not isinstance(symbol, str) or not self._is_safe_symbol(symbol):
+                        fail(index, symbol, "Unsafe stock symbol input.")
+                    elif not isinstance(price, float):
+                        fail(index, symbol, "Stock price must be a float.")
+                    elif not math.isfinite(price):  # SQLite would store NaN as NULL
+                        fail(index, symbol, "Stock price must be finite.")
+                    else:
+                        valid.append((index, symbol, price))
+
+                known = set()
+                symbols = list({symbol for _, symbol, _ in valid})
+                if symbols:
+                    placeholders = ", ".join("?" * len(symbols))
+                    cur.execute(f"SELECT symbol FROM stocks WHERE symbol IN ({placeholders})", symbols)
+                    known.update(symbol for symbol, in cur)
+                params = []
+                for index, symbol, price in valid:
+                    if symbol in known:
+                        params.append((symbol, date, price))
+                    else:
+                        fail(index, symbol, "No such stock symbol.")
+                cur.executemany(_RECORD_HISTORY, params)
+                cur.executemany(_UPDATE_IF_LATEST, [(price, symbol, date, symbol) for symbol, date, price in params])
+                updated += len(params)
+        failed.sort(key=lambda failure: failure['row'])
+        return {'updated': updated, 'failed': failed}
+
+    def update_stock_price(self, symbol: str, price: float, date: Optional[str] = None) -> str:
         log = "[METHOD EXECUTED] update_stock_price\n"
         log += self._log_query("UPDATE stocks SET price = ? WHERE symbol = ?", symbol, price)
 
@@ -86,11 +216,65 @@ class SecureStockDB:
             raise ValueError("Unsafe stock symbol input.")
         if not isinstance(price, float):
             raise ValueError("Stock price must be a float.")
+        if not math.isfinite(price):
+            raise ValueError("Stock price must be finite.")
+        date = self._history_date(date)
 
-        with DatabaseConnection() as cur:
-            cur.execute("UPDATE stocks SET price = ? WHERE symbol = ?", (price, symbol))
+        with self._connection() as cur:
+            cur.execute("SELECT 1 FROM stocks WHERE symbol = ?", (symbol,))
+            if cur.fetchone():
+                cur.execute(_RECORD_HISTORY, (symbol, date, price))
+                cur.execute(_UPDATE_IF_LATEST, (price, symbol, date, symbol))
             return log
 
+    def _history_date(self, date: Optional[str]) -> str:
+        """The date price updates are recorded under: `date`, or today (UTC) when None."""
+        if date is None:
+            return _today()
+        if not self._is_valid_date(date):
+            raise ValueError("Date must be YYYY-MM-DD.")
+        return date
+
+    def get_latest_price(self, symbol: str) -> Optional[Tuple[str, float]]:
+        """Returns (date, price) of the most recent recorded price for symbol, or None."""
+        if not self._is_safe_symbol(symbol):
+            raise ValueError("Unsafe stock symbol input.")
+
+        with self._connection() as cur:
+            cur.execute("SELECT date, price FROM price_history WHERE symbol = ? ORDER BY date DESC LIMIT 1",
+                        (symbol,))
+            return cur.fetchone()
+
+    def iter_price_history(self, symbol: str, start: Optional[str] = None,
+                           end: Optional[str] = None) -> Iterator[Tuple[str, float]]:
+        """
+        Yields (date, price) for symbol, oldest first, between the inclusive
+        dates `start` and `end` (either may be None for an open end).
+        Arguments are validated immediately; rows are then read lazily,
+        HISTORY_FETCH at a time, so a long range is never held in memory.
+        The iterator keeps a pooled connection until it is exhausted or
+        closed.
+        """
+        if not self._is_safe_symbol(symbol):
+            raise ValueError("Unsafe stock symbol input.")
+        query, params = "SELECT date, price FROM price_history WHERE symbol = ?", [symbol]
+        for bound, op in ((start, ">="), (end, "<=")):
+            if bound is not None:
+                if not self._is_valid_date(bound):
+                    raise ValueError("Date must be YYYY-MM-DD.")
+                query += f" AND date {op} ?"
+                params.append(bound)
+        return self._iter_rows(query + " ORDER BY date", params)
+
+    def _iter_rows(self, query: str, params: Iterable[Any]) -> Iterator[Tuple[Any, ...]]:
+        with self._connection() as cur:
+            cur.execute(query, params)
+            while True:
+                rows = cur.fetchmany(HISTORY_FETCH)
+                if not rows:
+                    return
+                yield from rows
+
     def _log_query(self, query: str, symbol: str, price: Optional[float] = None) -> str:
         """
         Internal utility to return log output for a query depending on log_mode.
@@ -98,7 +282,8 @@ class SecureStockDB:
         if self.log_mode == "secure":
             return f"[QUERY] {query}\n"
         elif "price" in query and price is not None:
-            return f"[QUERY] UPDATE stocks SET price = '{int(price)}' WHERE symbol = '{symbol}'\n"
+            shown = int(price) if isinstance(price, (int, float)) and math.isfinite(price) else price
+            return f"[QUERY] UPDATE stocks SET price = '{shown}' WHERE symbol = '{symbol}'\n"
         else:
             interpolated = query.replace("?", f"'{symbol}'")
             return f"[QUERY] {interpolated}\n"
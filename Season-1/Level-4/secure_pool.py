@@ -0,0 +1,162 @@
+# secure_pool.py
+
+import sqlite3
+import threading
+import time
+
+POOL_SIZE = 8
+TIMEOUT = 5.0          # seconds to wait for a free connection (and for SQLite locks)
+CHECK_INTERVAL = 30.0  # seconds a connection may sit idle before it is checked again
+
+
+class ConnectionPool:
+    """A bounded pool of SQLite connections to one database file.
+
+    At most `size` connections are ever open. acquire() hands out an idle
+    connection, opening a new one while under the limit and otherwise
+    waiting up to `timeout` seconds for one to be released. A thread gets
+    back the connection it used last whenever that one is idle, so its
+    statement cache stays warm. Connections idle for `check_interval`
+    seconds or more are checked with a trivial query before reuse, and
+    replaced if they fail.
+
+    Connections are opened with check_same_thread=False because they move
+    between threads; the pool ensures only one thread uses each at a time.
+    """
+
+    def __init__(self, path, size=POOL_SIZE, timeout=TIMEOUT, check_interval=CHECK_INTERVAL,
+                 clock=time.monotonic):
+        assert size >= 1, "size must be at least 1"
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self.check_interval = check_interval
+        self.clock = clock
+        self.created = 0
+        self.reused = 0
+        self.discarded = 0
+        self.waits = 0
+        self._idle = []   # (connection, released at), most recently released last
+        self._open = 0    # connections handed out or idle
+        self._closed = False
+        self._local = threading.local()
+        self._cond = threading.Condition()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False)
+
+    def _take_idle(self):
+        last = getattr(self._local, 'connection', None)
+        for i in range(len(self._idle) - 1, -1, -1):
+            if self._idle[i][0] is last:
+                return self._idle.pop(i)
+        return self._idle.pop()
+
+    def acquire(self):
+        """Returns a connection for this thread's exclusive use; hand it back with release().
+
+        Raises TimeoutError if every connection stays in use for `timeout` seconds.
+        """
+        deadline = self.clock() + self.timeout
+        while True:
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise sqlite3.ProgrammingError("Cannot use a closed connection pool.")
+                    if self._idle:
+                        conn, released_at = self._take_idle()
+                        break
+                    if self._open < self.size:
+                        self._open += 1
+                        conn = None
+                        break
+                    remaining = deadline - self.clock()
+                    if remaining <= 0:
+                        raise TimeoutError(f"No database connection free after {self.timeout}s")
+                    self.waits += 1
+                    self._cond.wait(remaining)
+
+            fresh = conn is None
+            if fresh:
+                try:
+                    conn = self._connect()
+                except BaseException:
+                    self._forget()
+                    raise
+            elif self.clock() - released_at >= self.check_interval and not self._healthy(conn):
+                self._close(conn)
+                continue
+            with self._cond:
+                if fresh:
+                    self.created += 1
+                else:
+                    self.reused += 1
+            self._local.connection = conn
+            return conn
+
+    def release(self, conn, discard=False):
+        """Returns a connection to the pool, or closes it if `discard` is true.
+
+        An open transaction is rolled back first, so the next user starts clean.
+        """
+        if not discard and conn.in_transaction:
+            try:
+                conn.rollback()
+            except sqlite3.Error:
+                discard = True
+        with self._cond:
+            if not discard and not self._closed:
+                self._idle.append((conn, self.clock()))
+                self._cond.notify()
+                return
+        self._close(conn)
+
+    @staticmethod
+    def _healthy(conn):
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _close(self, conn):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        self._forget(discarded=1)
+
+    def _forget(self, discarded=0):
+        with self._cond:
+            self.discarded += discarded
+            self._open -= 1
+            self._cond.notify()
+
+    def close(self):
+        """Closes the idle connections; connections still in use are closed when released."""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+            self._cond.notify_all()
+        for conn, _ in idle:
+            conn.close()
+
+    def stats(self):
+        """Returns the pool counters as a dict."""
+        with self._cond:
+            return {
+                'size': self.size,
+                'open': self._open,
+                'idle': len(self._idle),
+                'created': self.created,
+                'reused': self.reused,
+                'discarded': self.discarded,
+                'waits': self.waits,
+            }
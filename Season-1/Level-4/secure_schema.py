@@ -0,0 +1,134 @@
+# secure_schema.py
+
+import os
+import sqlite3
+import threading
+
+
+SEED_ROWS = [('2022-01-06', 'MSFT', 300.0)]  # (date, symbol, price) every database is expected to hold
+
+
+def _create_stocks(cur):
+    """Version 1: the stocks table, as code.py creates it."""
+    cur.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'stocks'")
+    if cur.fetchone() is None:
+        cur.execute("CREATE TABLE stocks (date TEXT, symbol TEXT, price REAL)")
+
+
+def _index_stocks_symbol(cur):
+    """Version 2: one row per symbol, enforced by a unique index that lookups and updates also use.
+
+    code.py's table has no key, so a database it wrote to may hold a symbol
+    more than once; the first row, which is the one lookups returned, is kept.
+    """
+    cur.execute("""
+        DELETE FROM stocks WHERE symbol IS NOT NULL AND rowid NOT IN (
+            SELECT MIN(rowid) FROM stocks WHERE symbol IS NOT NULL GROUP BY symbol
+        )
+    """)
+    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS stocks_symbol ON stocks (symbol)")
+
+
+def _create_price_history(cur):
+    """Version 3: one price per symbol and date, seeded with the prices already in stocks.
+
+    WITHOUT ROWID stores the rows in the (symbol, date) primary key itself,
+    so that key is a covering index: a symbol's latest price or a date range
+    is one index seek followed by a sequential read, with no table lookups.
+    """
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS price_history (
+            symbol TEXT NOT NULL,
+            date TEXT NOT NULL,
+            price REAL NOT NULL,
+            PRIMARY KEY (symbol, date)
+        ) WITHOUT ROWID
+    """)
+    cur.execute("""
+        INSERT OR IGNORE INTO price_history (symbol, date, price)
+        SELECT symbol, date, price FROM stocks
+        WHERE symbol IS NOT NULL AND date IS NOT NULL AND price IS NOT NULL
+    """)
+
+
+# Migration N brings a database from schema version N - 1 to N. Only ever
+# append to this list: databases record the version they are at in
+# PRAGMA user_version, and every migration after it is applied in order.
+MIGRATIONS = [
+    _create_stocks,
+    _index_stocks_symbol,
+    _create_price_history,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+_ready = set()  # database paths brought up to SCHEMA_VERSION by this process
+_ready_lock = threading.Lock()
+
+
+def schema_version(conn):
+    """Returns the schema version recorded in the database behind conn."""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(path, timeout=5.0):
+    """Applies every pending migration to the database at path; returns the resulting version.
+
+    The migrations run in one IMMEDIATE transaction, so concurrent processes
+    wait for each other and a failed migration leaves the database as it was.
+    A database from before versioning (version 0, maybe with tables already
+    there) is handled by migrations that check before they create.
+    """
+    conn = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+    try:
+        if schema_version(conn) == SCHEMA_VERSION:
+            return SCHEMA_VERSION
+        cur = conn.cursor()
+        cur.execute("BEGIN IMMEDIATE")
+        try:
+            version = schema_version(conn)  # another process may have migrated meanwhile
+            if version > SCHEMA_VERSION:
+                raise sqlite3.DatabaseError(
+                    f"{path} has schema version {version}, newer than this code's {SCHEMA_VERSION}")
+            for migration in MIGRATIONS[version:]:
+                migration(cur)
+            cur.execute(f"PRAGMA user_version = {SCHEMA_VERSION:d}")
+            cur.execute("COMMIT")
+        except BaseException:
+            cur.execute("ROLLBACK")
+            raise
+        return SCHEMA_VERSION
+    finally:
+        conn.close()
+
+
+def seed(path, timeout=5.0):
+    """Puts back any SEED_ROWS symbol missing from stocks, with its price history; returns how many."""
+    conn = sqlite3.connect(path, timeout=timeout)
+    try:
+        added = 0
+        with conn:
+            for date, symbol, price in SEED_ROWS:
+                if conn.execute("INSERT OR IGNORE INTO stocks VALUES (?, ?, ?)", (date, symbol, price)).rowcount:
+                    conn.execute("INSERT OR IGNORE INTO price_history VALUES (?, ?, ?)", (symbol, date, price))
+                    added += 1
+        return added
+    finally:
+        conn.close()
+
+
+def ensure_schema(path):
+    """Makes sure the database at path is at SCHEMA_VERSION and seeded, at most once per process.
+
+    After the first call for a path this is a set lookup, so it is cheap
+    enough for request paths. A database deleted or downgraded behind the
+    process's back, or a seed row deleted, is not noticed until the process
+    restarts.
+    """
+    path = os.path.abspath(path)
+    if path in _ready:
+        return
+    with _ready_lock:
+        if path not in _ready:
+            migrate(path)
+            seed(path)
+            _ready.add(path)
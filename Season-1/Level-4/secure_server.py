@@ -1,12 +1,21 @@
 # secure_server.py
 
+import json
+import math
 import os
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from secure_code import SecureStockDB
+from secure_pool import POOL_SIZE
 
 app = Flask(__name__)
 log_mode = os.getenv("LOG_MODE", "secure")
-db = SecureStockDB(log_mode=log_mode)
+pool_size = int(os.getenv("DB_POOL_SIZE", POOL_SIZE))
+db_filename = os.getenv("DB_FILENAME", "level-4.db")
+db = SecureStockDB(log_mode=log_mode, db_filename=db_filename, pool_size=pool_size)
+
+def json_price(price):
+    """A stored price as JSON allows it: Infinity from before prices were checked becomes null."""
+    return price if price is None or math.isfinite(price) else None
 
 @app.route("/")
 def index():
@@ -15,8 +24,14 @@ def index():
         "endpoints": {
             "GET /stock-info": "/stock-info?symbol=MSFT",
             "GET /stock-price": "/stock-price?symbol=MSFT",
+            "GET /stock-prices": "/stock-prices?symbols=MSFT,AAPL",
+            "GET /latest-price": "/latest-price?symbol=MSFT",
+            "GET /price-history": "/price-history?symbol=MSFT&start=2022-01-01&end=2022-12-31",
             "POST /update-price": {
                 "payload": {"symbol": "MSFT", "price": 310.0}
+            },
+            "POST /update-prices": {
+                "payload": {"prices": [{"symbol": "MSFT", "price": 310.0}]}
             }
         }
     })
@@ -39,6 +54,56 @@ def stock_price():
     result = db.get_stock_price(symbol)
     return jsonify({"response": result})
 
+@app.route("/stock-prices", methods=["GET"])
+def stock_prices():
+    symbols = [s for value in request.args.getlist("symbols") for s in value.split(",") if s]
+    if not symbols:
+        return jsonify({"error": "Missing 'symbols' parameter"}), 400
+
+    try:
+        prices = db.get_stock_prices(symbols)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    missing = [s for s in dict.fromkeys(symbols) if s not in prices]
+    return jsonify({"prices": {s: json_price(p) for s, p in prices.items()}, "missing": missing})
+
+@app.route("/latest-price", methods=["GET"])
+def latest_price():
+    symbol = request.args.get("symbol")
+    if not symbol:
+        return jsonify({"error": "Missing 'symbol' parameter"}), 400
+
+    try:
+        latest = db.get_latest_price(symbol)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if latest is None:
+        return jsonify({"error": "No price found"}), 404
+    return jsonify({"symbol": symbol, "date": latest[0], "price": json_price(latest[1])})
+
+@app.route("/price-history", methods=["GET"])
+def price_history():
+    symbol = request.args.get("symbol")
+    if not symbol:
+        return jsonify({"error": "Missing 'symbol' parameter"}), 400
+
+    try:
+        rows = db.iter_price_history(symbol, request.args.get("start"), request.args.get("end"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # streamed row by row, so a long range is never built up as one list
+    def generate():
+        try:
+            yield '{"symbol": ' + json.dumps(symbol) + ', "history": ['
+            for i, (date, price) in enumerate(rows):
+                yield ("," if i else "") + json.dumps({"date": date, "price": json_price(price)}, allow_nan=False)
+            yield "]}"
+        finally:
+            rows.close()
+
+    return Response(generate(), mimetype="application/json")
+
 @app.route("/update-price", methods=["POST"])
 def update_price():
     data = request.get_json(force=True)
@@ -56,5 +121,15 @@ def update_price():
     except Exception as e:
         return jsonify({"error": str(e)}), 400
 
+@app.route("/update-prices", methods=["POST"])
+def update_prices():
+    data = request.get_json(force=True)
+    rows = data.get("prices") if isinstance(data, dict) else None
+    if not isinstance(rows, list):
+        return jsonify({"error": "'prices' must be a list of {symbol, price} objects"}), 400
+
+    pairs = [(row.get("symbol"), row.get("price")) if isinstance(row, dict) else None for row in rows]
+    return jsonify(db.update_stock_prices(pairs))
+
 if __name__ == "__main__":
     app.run(debug=True)
@@ -0,0 +1,391 @@
+# secure_tests.py
+
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import secure_code as c
+import secure_pool
+import secure_schema
+
+
+def import_server(path):
+    """Imports secure_server, building its module-level database at path rather than on level-4.db."""
+    with mock.patch.dict(os.environ, DB_FILENAME=path):
+        import secure_server
+    return secure_server
+
+
+class StockDBTestCase(unittest.TestCase):
+    """Runs against a scratch copy of the database, so level-4.db is never modified."""
+
+    def setUp(self):
+        self.base = tempfile.mkdtemp()
+        self.path = os.path.join(self.base, 'stocks.db')
+        self.db = c.SecureStockDB(log_mode='compatible', db_filename=self.path, pool_size=4)
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.base)
+
+    def add_stocks(self, rows):
+        with sqlite3.connect(self.path) as conn:
+            conn.executemany("INSERT INTO stocks VALUES ('2022-01-06', ?, ?)", rows)
+        conn.close()
+
+
+class TestConnectionPool(StockDBTestCase):
+
+    def test_connections_are_reused(self):
+        for _ in range(20):
+            self.assertIn("[RESULT] ('2022-01-06', 'MSFT', 300.0)", self.db.get_stock_info('MSFT'))
+        stats = self.db.pool.stats()
+        self.assertEqual(stats['created'], 1)
+        self.assertEqual(stats['open'], 1)
+
+    def test_thread_gets_its_last_connection_back(self):
+        pool = secure_pool.ConnectionPool(self.path, size=2)
+        first, second = pool.acquire(), pool.acquire()
+        pool.release(first)
+        pool.release(second)
+        self.assertIs(pool.acquire(), second)
+        pool.close()
+
+    def test_pool_is_bounded(self):
+        pool = secure_pool.ConnectionPool(self.path, size=2, timeout=0.05)
+        held = [pool.acquire(), pool.acquire()]
+        with self.assertRaises(TimeoutError):
+            pool.acquire()
+
+        released = threading.Timer(0.01, pool.release, [held[0]])
+        pool.timeout = 5.0
+        released.start()
+        self.assertIs(pool.acquire(), held[0])
+        released.join()
+        self.assertEqual(pool.stats()['created'], 2)
+        pool.close()
+
+    def test_broken_connections_are_replaced(self):
+        now = [0.0]
+        pool = secure_pool.ConnectionPool(self.path, size=1, check_interval=10, clock=lambda: now[0])
+        conn = pool.acquire()
+        pool.release(conn)
+        conn.close()  # e.g. closed underneath the pool
+        now[0] += 10
+        replacement = pool.acquire()
+        self.assertIsNot(replacement, conn)
+        self.assertEqual(replacement.execute("SELECT price FROM stocks").fetchone(), (300.0,))
+        self.assertEqual(pool.stats()['discarded'], 1)
+        pool.close()
+
+    def test_failed_statement_rolls_back(self):
+        with self.assertRaises(sqlite3.OperationalError):
+            with self.db._connection() as cur:
+                cur.execute("UPDATE stocks SET price = 1.0 WHERE symbol = 'MSFT'")
+                cur.execute("SELECT * FROM missing_table")
+        self.assertIn("(300.0,)", self.db.get_stock_price('MSFT'))
+        self.assertEqual(self.db.pool.stats()['idle'], 1)
+
+    def test_concurrent_requests(self):
+        errors = []
+
+        def worker():
+            try:
+                for _ in range(50):
+                    self.db.update_stock_price('MSFT', 310.0)
+                    self.assertIn("(310.0,)", self.db.get_stock_price('MSFT'))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors, [])
+        self.assertLessEqual(self.db.pool.stats()['created'], 4)
+
+    def test_closed_pool_refuses_connections(self):
+        self.db.close()
+        with self.assertRaises(sqlite3.ProgrammingError):
+            self.db.get_stock_price('MSFT')
+
+
+class TestSchema(StockDBTestCase):
+
+    def test_new_database_is_created_at_current_version(self):
+        with sqlite3.connect(self.path) as conn:
+            self.assertEqual(secure_schema.schema_version(conn), secure_schema.SCHEMA_VERSION)
+            self.assertEqual(conn.execute("SELECT * FROM stocks").fetchall(), [('2022-01-06', 'MSFT', 300.0)])
+
+    def test_unversioned_database_is_adopted(self):
+        path = os.path.join(self.base, 'legacy.db')
+        with sqlite3.connect(path) as conn:
+            conn.execute("CREATE TABLE stocks (date text, symbol text, price real)")
+            conn.execute("INSERT INTO stocks VALUES ('2022-01-06', 'MSFT', 320.0)")
+        secure_schema.ensure_schema(path)
+        with sqlite3.connect(path) as conn:
+            self.assertEqual(secure_schema.schema_version(conn), secure_schema.SCHEMA_VERSION)
+            self.assertEqual(conn.execute("SELECT price FROM stocks").fetchall(), [(320.0,)])
+            plan = conn.execute("EXPLAIN QUERY PLAN SELECT price FROM stocks WHERE symbol = 'MSFT'").fetchall()
+            self.assertIn('stocks_symbol', str(plan))
+
+    def test_symbols_are_unique_and_seeded(self):
+        path = os.path.join(self.base, 'legacy.db')
+        with sqlite3.connect(path) as conn:
+            conn.execute("CREATE TABLE stocks (date text, symbol text, price real)")
+            conn.executemany("INSERT INTO stocks VALUES ('2022-01-06', ?, ?)",
+                             [('AAPL', 150.0), ('AAPL', 151.0), ('GOOG', 90.0), ('AAPL', 152.0)])
+        conn.close()
+        secure_schema.ensure_schema(path)
+        with sqlite3.connect(path) as conn:
+            self.assertEqual(conn.execute("SELECT symbol, price FROM stocks ORDER BY symbol").fetchall(),
+                             [('AAPL', 150.0), ('GOOG', 90.0), ('MSFT', 300.0)])
+            self.assertEqual(conn.execute("SELECT * FROM price_history WHERE symbol = 'MSFT'").fetchall(),
+                             [('MSFT', '2022-01-06', 300.0)])
+            with self.assertRaises(sqlite3.IntegrityError):
+                conn.execute("INSERT INTO stocks VALUES ('2022-01-07', 'AAPL', 1.0)")
+        conn.close()
+
+        with sqlite3.connect(self.path) as conn:
+            conn.execute("DELETE FROM stocks")
+        conn.close()
+        self.assertEqual(secure_schema.seed(self.path), 1)
+        self.assertEqual(secure_schema.seed(self.path), 0)
+        self.assertEqual(self.db.get_stock_prices(['MSFT']), {'MSFT': 300.0})
+
+    def test_schema_is_checked_once_per_process(self):
+        with mock.patch.object(secure_schema.sqlite3, 'connect', side_effect=AssertionError("connected")):
+            secure_schema.ensure_schema(self.path)
+            c.SecureStockDB(db_filename=self.path).close()
+
+    def test_newer_database_is_refused(self):
+        path = os.path.join(self.base, 'newer.db')
+        with sqlite3.connect(path) as conn:
+            conn.execute(f"PRAGMA user_version = {secure_schema.SCHEMA_VERSION + 1}")
+        with self.assertRaises(sqlite3.DatabaseError):
+            secure_schema.ensure_schema(path)
+        self.assertNotIn(os.path.abspath(path), secure_schema._ready)
+
+
+class TestBatchPrices(StockDBTestCase):
+
+    def test_prices_for_many_symbols(self):
+        self.add_stocks([(f"S{i}", float(i)) for i in range(1200)])
+        symbols = [f"S{i}" for i in range(0, 1200, 2)] + ['MSFT', 'NONE', 'MSFT']
+        with mock.patch.object(c, 'IN_CHUNK', 64):
+            prices = self.db.get_stock_prices(symbols)
+        self.assertEqual(len(prices), 601)
+        self.assertEqual(prices['S600'], 600.0)
+        self.assertEqual(prices['MSFT'], 300.0)
+        self.assertNotIn('NONE', prices)
+        self.assertEqual(self.db.pool.stats()['created'], 1)
+
+    def test_unsafe_symbols_reject_the_whole_batch(self):
+        for symbols in (['MSFT', "MSFT' OR 1=1--"], ['MSFT', 'msft'], ['MSFT', 42], ['TOOLONG']):
+            with self.assertRaises(ValueError):
+                self.db.get_stock_prices(symbols)
+        with self.assertRaises(ValueError):
+            self.db.get_stock_prices(f"S{i}" for i in range(c.MAX_SYMBOLS + 1))
+
+    def test_single_symbol_string(self):
+        self.assertEqual(self.db.get_stock_prices('MSFT'), {'MSFT': 300.0})
+        self.assertEqual(self.db.get_stock_prices([]), {})
+
+
+class TestBulkUpdate(StockDBTestCase):
+
+    def prices(self):
+        with sqlite3.connect(self.path) as conn:
+            prices = dict(conn.execute("SELECT symbol, price FROM stocks"))
+        conn.close()
+        return prices
+
+    def test_updates_and_failures(self):
+        self.add_stocks([('AAPL', 150.0)])
+        result = self.db.update_stock_prices([('MSFT', 310.0), ('AAPL', 155), ("X' OR 1=1--", 1.0),
+                                              ('NONE', 1.0), 'MSFT', ('AAPL', 156.0)])
+        self.assertEqual(result['updated'], 2)
+        self.assertEqual([(f['row'], f['symbol']) for f in result['failed']],
+                         [(1, 'AAPL'), (2, "X' OR 1=1--"), (3, 'NONE'), (4, None)])
+        self.assertEqual(self.prices(), {'MSFT': 310.0, 'AAPL': 156.0})
+
+    def test_non_finite_prices_fail_their_rows(self):
+        result = self.db.update_stock_prices([('MSFT', 2.0), ('MSFT', float('nan')), ('MSFT', float('inf')),
+                                              ('MSFT', float('-inf'))])
+        self.assertEqual(result['updated'], 1)
+        self.assertEqual([(f['row'], f['error']) for f in result['failed']],
+                         [(i, "Stock price must be finite.") for i in (1, 2, 3)])
+        self.assertEqual(self.prices(), {'MSFT': 2.0})
+
+    def test_chunked_stream_in_one_transaction(self):
+        self.add_stocks([(f"S{i}", 0.0) for i in range(100)])
+        with mock.patch.object(c, 'UPDATE_CHUNK', 7):
+            result = self.db.update_stock_prices((f"S{i}", float(i)) for i in range(100))
+        self.assertEqual(result, {'updated': 100, 'failed': []})
+        self.assertEqual(self.prices()['S99'], 99.0)
+        self.assertEqual(self.db.update_stock_prices({'MSFT': 320.0})['updated'], 1)
+
+    def test_database_error_rolls_back_the_batch(self):
+        self.add_stocks([(f"S{i}", 1.0) for i in range(10)])
+        with sqlite3.connect(self.path) as conn:
+            conn.execute("CREATE TRIGGER no_negative BEFORE UPDATE ON stocks WHEN NEW.price < 0 "
+                         "BEGIN SELECT RAISE(ABORT, 'negative price'); END")
+        conn.close()
+        with mock.patch.object(c, 'UPDATE_CHUNK', 3):
+            with self.assertRaises(sqlite3.IntegrityError):
+                self.db.update_stock_prices([(f"S{i}", 2.0) for i in range(9)] + [('S9', -1.0)])
+        self.assertEqual(set(self.prices().values()), {1.0, 300.0})
+
+
+class TestPriceHistory(StockDBTestCase):
+
+    def add_history(self, symbol, days):
+        with sqlite3.connect(self.path) as conn:
+            conn.executemany("INSERT INTO price_history VALUES (?, ?, ?)",
+                             [(symbol, f"2023-01-{day:02d}", float(day)) for day in range(1, days + 1)])
+        conn.close()
+
+    def test_existing_prices_are_migrated(self):
+        path = os.path.join(self.base, 'legacy.db')
+        with sqlite3.connect(path) as conn:
+            conn.execute("CREATE TABLE stocks (date text, symbol text, price real)")
+            conn.execute("INSERT INTO stocks VALUES ('2022-01-06', 'MSFT', 320.0)")
+        conn.close()
+        db = c.SecureStockDB(db_filename=path)
+        self.assertEqual(db.get_latest_price('MSFT'), ('2022-01-06', 320.0))
+        self.assertEqual(db.get_stock_prices(['MSFT']), {'MSFT': 320.0})
+        db.close()
+
+    def test_updates_keep_history(self):
+        self.db.update_stock_price('MSFT', 310.0, date='2022-01-07')
+        self.db.update_stock_prices({'MSFT': 320.0, 'NONE': 1.0}, date='2022-01-10')
+        self.db.update_stock_price('MSFT', 321.0, date='2022-01-10')
+        self.db.update_stock_price('NONE', 1.0)
+        self.assertEqual(list(self.db.iter_price_history('MSFT')),
+                         [('2022-01-06', 300.0), ('2022-01-07', 310.0), ('2022-01-10', 321.0)])
+        self.assertEqual(self.db.get_latest_price('MSFT'), ('2022-01-10', 321.0))
+        self.assertIsNone(self.db.get_latest_price('NONE'))
+
+        self.db.update_stock_price('MSFT', 330.0)
+        self.assertEqual(self.db.get_latest_price('MSFT'), (c._today(), 330.0))
+
+    def test_backfilled_dates_keep_the_current_price(self):
+        self.db.update_stock_price('MSFT', 330.0)
+        self.db.update_stock_price('MSFT', 100.0, date='2020-01-01')
+        self.db.update_stock_prices({'MSFT': 101.0}, date='2021-01-01')
+        self.assertIn("(330.0,)", self.db.get_stock_price('MSFT'))
+        self.assertEqual(self.db.get_latest_price('MSFT'), (c._today(), 330.0))
+        self.assertEqual(list(self.db.iter_price_history('MSFT', end='2021-12-31')),
+                         [('2020-01-01', 100.0), ('2021-01-01', 101.0)])
+
+        self.db.update_stock_prices({'MSFT': 340.0}, date=c._today())
+        self.assertEqual(self.db.get_stock_prices(['MSFT']), {'MSFT': 340.0})
+
+    def test_range_is_inclusive_and_streamed(self):
+        self.add_history('AAPL', 31)
+        with mock.patch.object(c, 'HISTORY_FETCH', 4):
+            rows = self.db.iter_price_history('AAPL', start='2023-01-10', end='2023-01-20')
+            self.assertEqual(next(rows), ('2023-01-10', 10.0))
+            self.assertEqual(self.db.pool.stats()['idle'], 0)  # the open range holds its connection
+            self.assertEqual([day for day, _ in rows][-1], '2023-01-20')
+        self.assertEqual(self.db.pool.stats()['idle'], 1)
+        self.assertEqual(len(list(self.db.iter_price_history('AAPL', end='2023-01-05'))), 5)
+
+        rows = self.db.iter_price_history('AAPL')
+        next(rows)
+        rows.close()
+        self.assertEqual(self.db.pool.stats()['idle'], 1)
+
+    def test_invalid_arguments_are_rejected_up_front(self):
+        for args in (("MSFT'--",), ('MSFT', '2023-1-1'), ('MSFT', None, "2023-01-01' OR 1=1"), ('MSFT', '2023-02-30')):
+            with self.assertRaises(ValueError):
+                self.db.iter_price_history(*args)
+        with self.assertRaises(ValueError):
+            self.db.update_stock_prices({'MSFT': 1.0}, date='yesterday')
+        with self.assertRaises(ValueError):
+            self.db.get_latest_price('msft')
+
+    def test_range_query_uses_the_primary_key(self):
+        with sqlite3.connect(self.path) as conn:
+            plan = str(conn.execute("EXPLAIN QUERY PLAN SELECT date, price FROM price_history "
+                                    "WHERE symbol = 'MSFT' AND date >= '2022-01-01' ORDER BY date").fetchall())
+        conn.close()
+        self.assertIn('USING PRIMARY KEY', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+
+class TestServer(StockDBTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.server = import_server(self.path)
+        self.original_db, self.server.db = self.server.db, self.db
+        self.client = self.server.app.test_client()
+
+    def tearDown(self):
+        self.server.db = self.original_db
+        super().tearDown()
+
+    def test_endpoints_share_the_pool(self):
+        self.assertIn("(300.0,)", self.client.get('/stock-price?symbol=MSFT').get_json()['response'])
+        self.client.post('/update-price', json={'symbol': 'MSFT', 'price': 305.0})
+        self.assertIn("305.0", self.client.get('/stock-info?symbol=MSFT').get_json()['response'])
+        self.assertEqual(self.db.pool.stats()['created'], 1)
+
+    def test_stock_prices(self):
+        self.add_stocks([('AAPL', 150.0)])
+        response = self.client.get('/stock-prices?symbols=MSFT,AAPL&symbols=NONE')
+        self.assertEqual(response.get_json(), {'prices': {'MSFT': 300.0, 'AAPL': 150.0}, 'missing': ['NONE']})
+        self.assertEqual(self.client.get('/stock-prices').status_code, 400)
+        response = self.client.get("/stock-prices?symbols=MSFT,x';DROP TABLE stocks--")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Unsafe', response.get_json()['error'])
+
+    def test_update_prices(self):
+        response = self.client.post('/update-prices', json={'prices': [{'symbol': 'MSFT', 'price': 301.0},
+                                                                       {'symbol': 'MSFT'}, 'MSFT']})
+        result = response.get_json()
+        self.assertEqual(result['updated'], 1)
+        self.assertEqual([f['row'] for f in result['failed']], [1, 2])
+        self.assertEqual(self.db.get_stock_prices(['MSFT']), {'MSFT': 301.0})
+        self.assertEqual(self.client.post('/update-prices', json=[]).status_code, 400)
+        response = self.client.post('/update-prices', content_type='application/json',
+                                    data='{"prices": [{"symbol": "MSFT", "price": 2.0}, {"symbol": "MSFT", "price": NaN}]}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['updated'], 1)
+        self.assertEqual([f['row'] for f in response.get_json()['failed']], [1])
+
+    def test_price_history(self):
+        self.db.update_stock_price('MSFT', 310.0, date='2022-01-07')
+        response = self.client.get('/price-history?symbol=MSFT&start=2022-01-07')
+        self.assertEqual(response.get_json(), {'symbol': 'MSFT', 'history': [{'date': '2022-01-07', 'price': 310.0}]})
+        self.assertEqual(self.client.get('/price-history?symbol=MSFT&end=2022').status_code, 400)
+        self.assertEqual(self.client.get('/latest-price?symbol=MSFT').get_json()['price'], 310.0)
+        self.assertEqual(self.client.get('/latest-price?symbol=NONE').status_code, 404)
+
+    def test_non_finite_prices(self):
+        for price in (float('inf'), float('-inf'), float('nan')):
+            with self.assertRaises(ValueError):
+                self.db.update_stock_price('MSFT', price)
+            response = self.client.post('/update-price', json={'symbol': 'MSFT', 'price': price})
+            self.assertEqual(response.status_code, 400)
+        # stored before prices were checked: served as null, never as the invalid JSON token Infinity
+        with sqlite3.connect(self.path) as conn:
+            conn.execute("UPDATE stocks SET price = 9e999")
+            conn.execute("INSERT INTO price_history VALUES ('MSFT', '2022-01-07', 9e999)")
+        conn.close()
+        for url in ('/latest-price?symbol=MSFT', '/price-history?symbol=MSFT', '/stock-prices?symbols=MSFT'):
+            response = self.client.get(url)
+            self.assertNotIn(b'Infinity', response.data, url)
+            json.loads(response.data)
+        self.assertIsNone(self.client.get('/latest-price?symbol=MSFT').get_json()['price'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,7 @@
 import sqlite3
 import os
 from flask import Flask, request
+from secure_schema import ensure_schema
 
 # Flask app (not used in tests, safe to ignore)
 app = Flask(__name__)
@@ -22,23 +23,12 @@ class Connect(object):
 
 class Create(object):
     def __init__(self):
-        con = Connect()
         try:
             path = os.path.dirname(os.path.abspath(__file__))
             db_path = os.path.join(path, 'level-4.db')
-            db_con = con.create_connection(db_path)
-            cur = db_con.cursor()
-            table_fetch = cur.execute(
-                "SELECT name FROM sqlite_master WHERE type='table' AND name='stocks';"
-            ).fetchall()
-            if table_fetch == []:
-                cur.execute("CREATE TABLE stocks (date text, symbol text, price real)")
-                cur.execute("INSERT INTO stocks VALUES (?, ?, ?)", ('2022-01-06', 'MSFT', 300.00))
-                db_con.commit()
+            ensure_schema(db_path)
         except sqlite3.Error as e:
             print(f"ERROR: {e}")
-        finally:
-            db_con.close()
 
 class DB_CRUD_ops(object):
     def get_stock_info(self, stock_symbol):